@@ -0,0 +1,131 @@
+"""
+Approximate nearest-neighbour index for 1:N face identification.
+
+An inverted-file (IVF) index in plain NumPy: registered unit vectors are
+clustered with spherical k-means into ~sqrt(N) lists, and a query scans
+only the `nprobe` lists whose centroids are closest to it. Each list keeps
+its vectors contiguous, so a probe is one small matrix-vector product.
+
+New registrations are added to their nearest list without retraining,
+and deletions remove their row (the store moves its last row into the
+freed slot, which is re-added under its new number); the centroids are
+retrained once the index has doubled since the last training.
+"""
+
+import numpy as np
+
+KMEANS_ITERATIONS = 10
+# Training uses at most this many points per list (a sample, like faiss)
+TRAIN_POINTS_PER_LIST = 64
+
+
+class IVFIndex:
+    """Inverted-file index over the rows of a matrix of unit vectors."""
+
+    def __init__(self, nprobe: int = 16, seed: int = 0):
+        self.nprobe = nprobe
+        self.seed = seed
+        self.trained_size = 0
+        self.size = 0
+        # (centroids, lists), swapped as a whole on training; each list is
+        # (row ids, vectors), replaced as a unit on add(), so searches from
+        # other threads always see a consistent index
+        self._state = (None, [])
+        self._list_of = {}      # row id -> list number
+
+    @property
+    def trained(self) -> bool:
+        return self._state[0] is not None
+
+    def build(self, unit: np.ndarray) -> None:
+        """(Re)train the centroids on `unit` and index all of its rows."""
+        n = unit.shape[0]
+        if n == 0:
+            self._state, self._list_of = (None, []), {}
+            self.trained_size = self.size = 0
+            return
+        nlist = max(1, int(np.sqrt(n)))
+        centroids = _spherical_kmeans(unit, nlist, self.seed)
+        assign = np.argmax(unit @ centroids.T, axis=1)
+        lists = []
+        for c in range(nlist):
+            rows = np.flatnonzero(assign == c)
+            lists.append((rows, np.ascontiguousarray(unit[rows])))
+        self._state = (centroids, lists)
+        self._list_of = {int(row): int(c) for row, c in enumerate(assign)}
+        self.trained_size = self.size = n
+
+    def add(self, row: int, vector: np.ndarray) -> None:
+        """Index (or re-index) one row under its nearest centroid."""
+        centroids, lists = self._state
+        old = self._list_of.get(row)
+        if old is not None:
+            rows, vectors = lists[old]
+            keep = rows != row
+            lists[old] = (rows[keep], vectors[keep])
+        else:
+            self.size += 1
+        c = int(np.argmax(centroids @ vector))
+        rows, vectors = lists[c]
+        lists[c] = (np.append(rows, row), np.vstack([vectors, vector[None, :]]))
+        self._list_of[row] = c
+
+    def remove(self, row: int) -> None:
+        """Drop one row from its list."""
+        c = self._list_of.pop(row, None)
+        if c is None:
+            return
+        _, lists = self._state
+        rows, vectors = lists[c]
+        keep = rows != row
+        lists[c] = (rows[keep], vectors[keep])
+        self.size -= 1
+
+    def needs_training(self) -> bool:
+        return not self.trained or self.size >= 2 * self.trained_size
+
+    def search(self, query: np.ndarray, k: int):
+        """(row ids, similarities) of up to k best rows among the probed lists."""
+        centroids, lists = self._state
+        probe = np.argsort(centroids @ query)[::-1][: self.nprobe]
+        found_rows, found_scores = [], []
+        for c in probe:
+            rows, vectors = lists[c]
+            if len(rows):
+                found_rows.append(rows)
+                found_scores.append(vectors @ query)
+        if not found_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return top_k(np.concatenate(found_rows), np.concatenate(found_scores), k)
+
+    def stats(self) -> dict:
+        return {"lists": len(self._state[1]), "nprobe": self.nprobe, "size": self.size,
+                "trained_size": self.trained_size}
+
+
+def top_k(rows: np.ndarray, scores: np.ndarray, k: int):
+    """The k highest scores (descending) and their row ids."""
+    if len(scores) > k:
+        part = np.argpartition(scores, -k)[-k:]
+        rows, scores = rows[part], scores[part]
+    order = np.argsort(scores)[::-1]
+    return rows[order], scores[order]
+
+
+def _spherical_kmeans(unit: np.ndarray, nlist: int, seed: int) -> np.ndarray:
+    """Unit-norm centroids maximizing cosine similarity, trained on a sample."""
+    rng = np.random.default_rng(seed)
+    sample = unit
+    if unit.shape[0] > nlist * TRAIN_POINTS_PER_LIST:
+        sample = unit[rng.choice(unit.shape[0], nlist * TRAIN_POINTS_PER_LIST, replace=False)]
+    centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        # An empty list keeps its previous centroid
+        sums[empty] = centroids[empty]
+        centroids = (sums / np.where(empty[:, None], 1.0, norms)).astype(np.float32)
+    return centroids
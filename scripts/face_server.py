@@ -1,8 +1,8 @@
 """
-ExamHub DeepFace Microservice v3.0
+ExamHub DeepFace Microservice v3.1
 ===================================
 Face recognition API following DeepFace official standards.
-Uses DeepFace.verify() for identity comparison (not manual cosine distance).
+Uses DeepFace detection + Facenet512 embeddings with DeepFace's verify() threshold.
 
 Changes from v2.0:
 - DeepFace.verify() replaces manual cosine distance calculation
@@ -11,21 +11,102 @@ Changes from v2.0:
 - align=True for proper face alignment pipeline
 - Removed dead emotion fields
 - Added /health endpoint
+
+v3.1:
+- POST /analyze-face/batch: many (frame, student) pairs per call. Faces are
+  detected per frame (in parallel), then embedded in ONE Facenet512 forward
+  pass instead of one DeepFace.verify() per frame
+- Micro-batching: every face to embed (from /analyze-face and the batch
+  endpoint) goes through one model worker thread, which groups concurrent
+  requests into batches of up to FACE_BATCH_MAX faces, waiting at most
+  FACE_BATCH_WAIT_MS for a batch to fill. /analyze-face detects, queues its
+  face and compares the embedding itself instead of calling verify()
+- Verification thresholds come from THRESHOLDS (DeepFace's table); stored
+  embeddings are normalized once (cached) and compared with NumPy
+- Server-side embedding store (face_store.py): registered embeddings are
+  kept in a local SQLite file, loaded at startup
+  into one float32 matrix. /analyze-face and the batch endpoint then take a
+  student_id instead of 512 floats per frame (404 if not registered here;
+  a target_embedding is used for that one comparison only). Only the
+  Next.js routes write the store: PUT/DELETE /embeddings/{student_id}
+  need an X-Face-Store-Auth HMAC under FACE_SESSION_SECRET
+- POST /identify-face: 1:N search of every face in a frame against all
+  registered students (top-k with distances), e.g. to catch a classmate
+  sitting in for a student. Exact scan for class-sized stores, an IVF index
+  (face_index.py) from FACE_ANN_MIN_SIZE students; updated on registration
+- WebSocket /ws/monitor: one session per student for continuous
+  proctoring. The stored embedding is loaded once per session, the client
+  sends raw JPEG frames as binary messages, and verdicts are pushed back.
+  When frames arrive faster than they are analyzed only the latest one is
+  kept (latest-frame-wins). Needs a WebSocket implementation for uvicorn
+  (pip install websockets) and FACE_SESSION_SECRET: sessions are authorized
+  with a token signed by the Next.js app, and refused when no secret is
+  set. Verdicts that change is_present/is_verified carry a signed
+  log_token, which the client relays to /api/monitor/log so transitions
+  land in face_monitor_logs
+- Public listener (FACE_PUBLIC_PORT): browsers reach the server only through
+  a second listener in the same process (same model, store and sessions)
+  that serves /ws/monitor and /health and nothing else. FACE_WS_URL in the
+  Next.js app points there; the internal listener (127.0.0.1:8000, every
+  route) is for the Next.js server only and must not be exposed
+- POST /register-face/binary and /analyze-face/binary: the same endpoints
+  taking the raw JPEG (application/octet-stream or image/jpeg body, or
+  multipart field "image") and the student_id as a query parameter. The
+  image is decoded straight from the request buffer, with no base64 (a
+  third fewer bytes) and no intermediate copies. Bytes in and decode time
+  per frame are exported for both encodings
+- Cheaper detection on analysis frames: optional reduced-resolution JPEG
+  decode (FACE_DECODE_REDUCE), detection on a copy downscaled to
+  FACE_DETECT_MAX_DIM, and a region of interest around the student's face
+  box from the previous frame (the whole frame every FACE_ROI_FULL_FRAME_EVERY
+  frames, so a second person is still counted). Faces are found and
+  counted on the downscaled copy; each box is scaled back to the decoded
+  frame and DeepFace aligns the face on the full-resolution region around
+  it (extract_faces(align=True) on that crop), as on a full-size frame
+- Temporal tracking (face_tracking.py): after a verified frame, the
+  student's face is followed by template matching and the verdict is
+  reused (tracked=true) without detection or embedding, until the match
+  weakens, FACE_TRACK_REFRESH_SECONDS / FACE_TRACK_MAX_FRAMES force a full
+  re-verification, or the registered embedding changes. Tracked and gated
+  verdicts keep the last presence and face count, so both are skipped on
+  the periodic whole-frame frames: a second person is noticed within
+  FACE_ROI_FULL_FRAME_EVERY frames (never if it is 0)
+- Frame-difference gating (FrameGate): a frame nearly identical to the one
+  the student's last verdict came from (score below FACE_GATE_THRESHOLD,
+  see face_tracking.py) reuses that verdict (reused=true) for at most
+  FACE_GATE_MAX_AGE_SECONDS, before tracking or detection run
 """
 
 import os
 import sys
+import hmac
 import base64
 import time
+import asyncio
+import hashlib
+import queue
+import functools
+import threading
+from collections import OrderedDict
 import numpy as np
 import cv2
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from concurrent.futures import Future, ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, Request, WebSocket
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 import uvicorn
 
+from face_store import EmbeddingStore
+from face_tracking import FaceTracker, FrameGate
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+except ImportError:  # metrics stay available in /health
+    Histogram = None
+
 # Fix Windows console encoding for Vietnamese
 if sys.platform == "win32":
     try:
@@ -42,6 +123,108 @@ DETECTOR_BACKEND = "opencv"     # Fast, sufficient for webcam
 DISTANCE_METRIC = "cosine"      # Default for Facenet512
 EXPECTED_EMBEDDING_DIM = 512    # Facenet512 output dimension
 
+# Verification thresholds, same table as DeepFace (modules/verification.py),
+# so verdicts match DeepFace.verify(). FACE_THRESHOLD overrides it.
+THRESHOLDS = {
+    "VGG-Face": {"cosine": 0.68, "euclidean": 1.17, "euclidean_l2": 1.17},
+    "Facenet": {"cosine": 0.40, "euclidean": 10, "euclidean_l2": 0.80},
+    "Facenet512": {"cosine": 0.30, "euclidean": 23.56, "euclidean_l2": 1.04},
+    "ArcFace": {"cosine": 0.68, "euclidean": 4.15, "euclidean_l2": 1.13},
+}
+THRESHOLD = float(os.getenv("FACE_THRESHOLD") or THRESHOLDS[MODEL_NAME][DISTANCE_METRIC])
+
+# Registered embeddings (SQLite, next to this script by default)
+STORE_PATH = os.getenv(
+    "FACE_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "face_store.sqlite3")
+)
+# 1:N search: exact below FACE_ANN_MIN_SIZE students, IVF index from there
+ANN_MIN_SIZE = int(os.getenv("FACE_ANN_MIN_SIZE", "4096"))
+ANN_NPROBE = int(os.getenv("FACE_ANN_NPROBE", "16"))
+MAX_IDENTIFY_K = 50
+store = EmbeddingStore(STORE_PATH, MODEL_NAME, EXPECTED_EMBEDDING_DIM,
+                       ann_min_size=ANN_MIN_SIZE, nprobe=ANN_NPROBE)
+
+# Batch analysis
+MAX_BATCH_ITEMS = int(os.getenv("FACE_MAX_BATCH", "64"))
+# Haar detection runs in OpenCV with the GIL released: one thread per core
+DETECT_WORKERS = int(os.getenv("FACE_DETECT_WORKERS", str(os.cpu_count() or 2)))
+detect_pool = ThreadPoolExecutor(max_workers=DETECT_WORKERS, thread_name_prefix="detect")
+
+# Micro-batching: faces per model call, and how long the first face of a
+# batch may wait for others
+BATCH_MAX = int(os.getenv("FACE_BATCH_MAX", "32"))
+BATCH_WAIT_MS = float(os.getenv("FACE_BATCH_WAIT_MS", "10"))
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+if Histogram is not None:
+    BATCH_SIZE_HIST = Histogram("face_batch_size", "Faces per model forward pass", buckets=BATCH_SIZE_BUCKETS)
+    QUEUE_WAIT_HIST = Histogram(
+        "face_batch_queue_wait_seconds", "Time a face waited in the batching queue",
+        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+    )
+    FRAME_BYTES_HIST = Histogram(
+        "face_frame_bytes", "Image bytes received per frame", ["encoding"],
+        buckets=(8e3, 16e3, 32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6),
+    )
+    DECODE_HIST = Histogram(
+        "face_decode_seconds", "Time to turn a received frame into pixels", ["encoding"],
+        buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1),
+    )
+    TRACK_FRAMES = Counter("face_track_frames", "Tracking outcome per analyzed frame", ["result"])
+    GATE_FRAMES = Counter("face_gate_frames", "Frame-difference gate outcome per analyzed frame", ["result"])
+    WS_FRAMES = Counter("face_ws_frames", "Streamed frames by outcome (analyzed, dropped)", ["result"])
+
+# Analysis frame preprocessing. FACE_DECODE_REDUCE: decode JPEG frames at
+# 1/2, 1/4 or 1/8 scale (faces must stay larger than the model's 160px input);
+# registration snapshots are always decoded in full
+DECODE_FLAGS_BY_REDUCE = {
+    1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+DECODE_REDUCE = os.getenv("FACE_DECODE_REDUCE", "1")
+if not DECODE_REDUCE.isdigit() or int(DECODE_REDUCE) not in DECODE_FLAGS_BY_REDUCE:
+    print(f"[WARN] FACE_DECODE_REDUCE must be 1, 2, 4 or 8, got {DECODE_REDUCE!r}: decoding at full size")
+    DECODE_REDUCE = "1"
+DECODE_REDUCE = int(DECODE_REDUCE)
+FRAME_DECODE_FLAGS = DECODE_FLAGS_BY_REDUCE[DECODE_REDUCE]
+# Detection runs on a copy at most this many pixels on its longer side (0: full size)
+DETECT_MAX_DIM = int(os.getenv("FACE_DETECT_MAX_DIM", "320"))
+# Region searched first: the previous face box grown by ROI_MARGIN box sizes per side
+ROI_ENABLED = os.getenv("FACE_ROI", "1") == "1"
+ROI_MARGIN = float(os.getenv("FACE_ROI_MARGIN", "0.75"))
+ROI_TTL_SECONDS = float(os.getenv("FACE_ROI_TTL_SECONDS", "10"))
+# Every this many frames of a student with a recent box, detect on the whole
+# frame instead, without gating or tracking (0: never)
+ROI_FULL_FRAME_EVERY = int(os.getenv("FACE_ROI_FULL_FRAME_EVERY", "10"))
+# Margin kept around a found box when aligning the face at full resolution
+CROP_MARGIN = 0.5
+
+# Temporal tracking: reuse a verified verdict while the face is followed
+TRACK_ENABLED = os.getenv("FACE_TRACK", "1") == "1"
+TRACK_REFRESH_SECONDS = float(os.getenv("FACE_TRACK_REFRESH_SECONDS", "5"))
+TRACK_MAX_FRAMES = int(os.getenv("FACE_TRACK_MAX_FRAMES", "50"))
+TRACK_MIN_SCORE = float(os.getenv("FACE_TRACK_MIN_SCORE", "0.7"))
+
+# Frame-difference gating: reuse any verdict for near-identical frames
+GATE_ENABLED = os.getenv("FACE_GATE", "1") == "1"
+GATE_THRESHOLD = float(os.getenv("FACE_GATE_THRESHOLD", "8.0"))
+GATE_MAX_AGE_SECONDS = float(os.getenv("FACE_GATE_MAX_AGE_SECONDS", "2"))
+
+# Streaming sessions (/ws/monitor). FACE_SESSION_SECRET: HMAC key shared with
+# the Next.js app, for session tokens and verdict log tokens; unset, the
+# WebSocket endpoint refuses every session (CORS is open to any origin)
+SESSION_SECRET = os.getenv("FACE_SESSION_SECRET", "")
+# Validity of the X-Face-Store-Auth signature on PUT/DELETE /embeddings
+STORE_AUTH_MAX_AGE = 60
+WS_IDLE_SECONDS = float(os.getenv("FACE_WS_IDLE_SECONDS", "60"))
+MAX_FRAME_BYTES = int(os.getenv("FACE_MAX_FRAME_BYTES", str(2 * 1024 * 1024)))
+# Public listener for browsers: only /ws/monitor and /health, on
+# FACE_PUBLIC_HOST:FACE_PUBLIC_PORT. Every other route stays on the internal
+# 127.0.0.1:8000 listener; unset port, only the internal listener runs
+PUBLIC_HOST = os.getenv("FACE_PUBLIC_HOST", "0.0.0.0")
+PUBLIC_PORT = int(os.getenv("FACE_PUBLIC_PORT", "0"))
+streaming = {"sessions": 0, "frames": 0, "analyzed": 0, "dropped": 0}
+
 # =============================================
 # Pre-loaded DeepFace module (singleton)
 # =============================================
@@ -60,13 +243,22 @@ def get_deepface():
             )
     return _df_module
 
+_face_model = None
+
+def get_face_model():
+    """Facenet512 client (same instance DeepFace.represent() uses internally)."""
+    global _face_model
+    if _face_model is None:
+        _face_model = get_deepface().build_model(MODEL_NAME)
+    return _face_model
+
 # =============================================
 # FastAPI App
 # =============================================
 app = FastAPI(
     title="ExamHub DeepFace Microservice",
     description="Face recognition API following DeepFace official standards.",
-    version="3.0.0"
+    version="3.1.0"
 )
 
 app.add_middleware(
@@ -85,22 +277,426 @@ class FaceRegisterRequest(BaseModel):
 
 class FaceAnalyzeRequest(BaseModel):
     image_base64: str
-    target_embedding: List[float]
+    student_id: Optional[str] = None        # compare against the stored embedding
+    target_embedding: Optional[List[float]] = None
+
+class FaceBatchItem(BaseModel):
+    id: Optional[str] = None        # echoed back (e.g. student id)
+    image_base64: str
+    student_id: Optional[str] = None
+    target_embedding: Optional[List[float]] = None
+
+class FaceIdentifyRequest(BaseModel):
+    image_base64: str
+    k: int = 5
+    mode: str = "auto"              # "auto" | "exact" | "approx"
+
+class EmbeddingRequest(BaseModel):
+    embedding: List[float]
+
+class FaceBatchRequest(BaseModel):
+    items: List[FaceBatchItem]
 
 # =============================================
 # Helper: Decode base64 → numpy array (zero disk I/O)
 # =============================================
-def decode_base64_to_numpy(base64_str: str) -> np.ndarray:
+def decode_base64_to_numpy(base64_str: str, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
     """Convert base64 image string to OpenCV BGR numpy array in-memory."""
+    t0 = time.perf_counter()
+    size = len(base64_str)
     if "," in base64_str:
         base64_str = base64_str.split(",")[1]
     img_bytes = base64.b64decode(base64_str)
     nparr = np.frombuffer(img_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    img = cv2.imdecode(nparr, flags)
     if img is None:
         raise HTTPException(status_code=400, detail="Cannot decode image from base64")
+    observe_decode("base64", size, time.perf_counter() - t0)
+    return img
+
+def decode_image_bytes(data, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+    """
+    Encoded image (JPEG/PNG bytes) -> BGR array, or None if invalid.
+    np.frombuffer wraps the received buffer without copying it.
+    """
+    t0 = time.perf_counter()
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+    if img is not None:
+        observe_decode("binary", len(data), time.perf_counter() - t0)
     return img
 
+def observe_decode(encoding: str, size: int, seconds: float):
+    if Histogram is not None:
+        FRAME_BYTES_HIST.labels(encoding=encoding).observe(size)
+        DECODE_HIST.labels(encoding=encoding).observe(seconds)
+
+# =============================================
+# Helpers: batched detection + embedding
+# =============================================
+def extract_faces(img: np.ndarray, align: bool = True) -> list:
+    """Aligned faces in an image (DeepFace.extract_faces), [] when there is none."""
+    try:
+        return get_deepface().extract_faces(
+            img_path=img,
+            detector_backend=DETECTOR_BACKEND,
+            enforce_detection=True,
+            align=align,
+        )
+    except ValueError:
+        return []
+
+def detect_faces(img: np.ndarray, hint: Optional[tuple] = None) -> list:
+    """
+    Aligned faces in a frame, [] when there is none.
+
+    Faces are found on a copy downscaled to DETECT_MAX_DIM: inside the
+    region around `hint` (the previous face box, x/y/w/h) when given and a
+    face is found there, else on the whole frame. Each box is scaled back to
+    the frame and the face is aligned by DeepFace on the full-resolution
+    pixels around it. facial_area is in frame coordinates.
+    """
+    if not DETECT_MAX_DIM and hint is None:
+        return extract_faces(img)
+    found = []
+    if hint is not None:
+        x0, y0, x1, y1 = _grow_box(hint, ROI_MARGIN, img.shape)
+        found = _find_areas(img[y0:y1, x0:x1], x0, y0)
+    if not found:
+        found = _find_areas(img, 0, 0)
+    return [{**face_obj, "face": _aligned_face(img, face_obj["facial_area"])} for face_obj in found]
+
+def _find_areas(img: np.ndarray, dx: int, dy: int) -> list:
+    """
+    Faces detected (not aligned) on a copy of img downscaled to
+    DETECT_MAX_DIM, with facial_area mapped to frame coordinates.
+    """
+    h, w = img.shape[:2]
+    scale = DETECT_MAX_DIM / max(h, w) if DETECT_MAX_DIM and max(h, w) > DETECT_MAX_DIM else 1.0
+    small = img if scale == 1.0 else cv2.resize(
+        img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA
+    )
+    return [{**face_obj, "facial_area": _map_area(face_obj["facial_area"], scale, dx, dy)}
+            for face_obj in extract_faces(small, align=False)]
+
+def _aligned_face(img: np.ndarray, area: dict) -> np.ndarray:
+    """
+    The face in `area` (RGB, 0-1) from extract_faces(align=True) on the
+    full-resolution region around the box, the face nearest the box centre
+    when the region holds several. If the detector misses it at full
+    resolution, the box itself, unaligned.
+    """
+    x, y, w, h = _area_box({"facial_area": area})
+    x0, y0, x1, y1 = _grow_box((x, y, w, h), CROP_MARGIN, img.shape)
+    faces = extract_faces(img[y0:y1, x0:x1])
+    if not faces:
+        return img[y:y + h, x:x + w, ::-1].astype(np.float32) / 255
+    cx, cy = x + w / 2 - x0, y + h / 2 - y0
+
+    def offset(face_obj: dict) -> float:
+        fx, fy, fw, fh = _area_box(face_obj)
+        return (fx + fw / 2 - cx) ** 2 + (fy + fh / 2 - cy) ** 2
+    return min(faces, key=offset)["face"]
+
+def _grow_box(box: tuple, margin: float, shape: tuple) -> tuple:
+    """(x0, y0, x1, y1) of box grown by margin box sizes per side, clipped to the image."""
+    x, y, w, h = box
+    x0, y0 = max(int(x - margin * w), 0), max(int(y - margin * h), 0)
+    x1, y1 = min(int(x + w + margin * w), shape[1]), min(int(y + h + margin * h), shape[0])
+    return x0, y0, x1, y1
+
+def _map_area(area: dict, scale: float, dx: int, dy: int) -> dict:
+    """facial_area of a crop downscaled by `scale` -> frame coordinates (box and landmark points)."""
+    mapped = {}
+    for key, value in area.items():
+        if key in ("x", "w"):
+            value = round(value / scale) + (dx if key == "x" else 0)
+        elif key in ("y", "h"):
+            value = round(value / scale) + (dy if key == "y" else 0)
+        elif isinstance(value, (tuple, list)) and len(value) == 2:
+            value = (round(value[0] / scale) + dx, round(value[1] / scale) + dy)
+        mapped[key] = value
+    return mapped
+
+class FaceBoxHints:
+    """Last face box per student, used as the next frame's detection region."""
+
+    def __init__(self, ttl: float = ROI_TTL_SECONDS, full_frame_every: int = ROI_FULL_FRAME_EVERY,
+                 max_entries: int = 10000):
+        self.ttl = ttl
+        self.full_frame_every = full_frame_every
+        self.max_entries = max_entries
+        self._boxes = OrderedDict()     # student_id -> (box, updated_at, frames since the last full frame)
+        self._lock = threading.Lock()
+
+    def region(self, student_id: Optional[str]) -> tuple:
+        """
+        (hint, whole_frame) for the student's next frame; call it once per
+        frame, whether or not detection runs. hint: the region to detect in,
+        or None (no recent box, FACE_ROI off, or whole_frame). whole_frame:
+        this frame is the periodic whole-frame detection, which verdict reuse
+        (gating, tracking) must not skip, so a person outside the region is
+        counted.
+        """
+        if not student_id:
+            return None, False
+        with self._lock:
+            entry = self._boxes.get(student_id)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                return None, False
+            box, updated_at, uses = entry
+            if self.full_frame_every and uses + 1 >= self.full_frame_every:
+                self._boxes[student_id] = (box, updated_at, 0)
+                return None, True
+            self._boxes[student_id] = (box, updated_at, uses + 1)
+        return (box if ROI_ENABLED else None), False
+
+    def update(self, student_id: Optional[str], box: Optional[tuple]):
+        """Remember a face box (x, y, w, h) for student_id (forget it when there is no face)."""
+        if not student_id:
+            return
+        with self._lock:
+            if box is None:
+                self._boxes.pop(student_id, None)
+                return
+            entry = self._boxes.get(student_id)
+            self._boxes[student_id] = (box, time.monotonic(), entry[2] if entry else 0)
+            self._boxes.move_to_end(student_id)
+            while len(self._boxes) > self.max_entries:
+                self._boxes.popitem(last=False)
+
+roi_hints = FaceBoxHints()
+
+tracker = FaceTracker(
+    refresh_seconds=TRACK_REFRESH_SECONDS, max_frames=TRACK_MAX_FRAMES, min_score=TRACK_MIN_SCORE,
+    enabled=TRACK_ENABLED,
+    on_result=(lambda result: TRACK_FRAMES.labels(result=result).inc()) if Histogram is not None else None,
+)
+
+gate = FrameGate(
+    threshold=GATE_THRESHOLD, max_age=GATE_MAX_AGE_SECONDS, enabled=GATE_ENABLED,
+    on_result=(lambda result: GATE_FRAMES.labels(result=result).inc()) if Histogram is not None else None,
+)
+
+def _area_box(face_obj: dict) -> tuple:
+    area = face_obj["facial_area"]
+    return area["x"], area["y"], area["w"], area["h"]
+
+def _face_to_input(face: np.ndarray, target_size: tuple) -> np.ndarray:
+    """One extracted face -> model input, exactly as DeepFace.represent() prepares it."""
+    from deepface.modules import preprocessing
+    img = face[:, :, ::-1]  # extract_faces returns RGB; represent() feeds BGR
+    img = preprocessing.resize_image(img=img, target_size=(target_size[1], target_size[0]))
+    return preprocessing.normalize_input(img=img, normalization="base")
+
+def embed_faces(faces: List[np.ndarray]) -> np.ndarray:
+    """Embed extracted faces in one forward pass -> (n, 512)."""
+    if not faces:
+        return np.zeros((0, EXPECTED_EMBEDDING_DIM), dtype=np.float32)
+    client = get_face_model()
+    try:
+        batch = np.concatenate([_face_to_input(f, client.input_shape) for f in faces], axis=0)
+        return np.asarray(client.model(batch, training=False), dtype=np.float32)
+    except (ImportError, AttributeError) as e:
+        # DeepFace internals differ in this version: one represent() per face
+        print(f"[WARN] Batched embedding unavailable ({e}), embedding one by one")
+        df = get_deepface()
+        return np.array([
+            df.represent(
+                img_path=(f[:, :, ::-1] * 255).astype(np.uint8),
+                model_name=MODEL_NAME,
+                enforce_detection=False,
+                detector_backend="skip",
+            )[0]["embedding"]
+            for f in faces
+        ], dtype=np.float32)
+
+@functools.lru_cache(maxsize=1024)
+def unit_target(target: tuple) -> np.ndarray:
+    """
+    A stored embedding as a float64 unit vector. Cached: each student's
+    embedding arrives with every frame, but is normalized once.
+    """
+    vector = np.asarray(target, dtype=np.float64)
+    return vector / max(np.linalg.norm(vector), 1e-10)
+
+def cosine_distances(embeddings: np.ndarray, unit_targets: np.ndarray) -> np.ndarray:
+    """
+    Row-wise cosine distance to pre-normalized targets, in float64 like
+    DeepFace's find_cosine_distance (so verdicts at the threshold match).
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float64)
+    norms = np.maximum(np.linalg.norm(embeddings, axis=-1), 1e-10)
+    return 1.0 - np.einsum("...j,...j->...", embeddings, unit_targets) / norms
+
+class InferenceBatcher:
+    """
+    Single model worker fed by a queue. Callers (threadpool handlers) enqueue
+    face crops and block on futures; the worker takes the first waiting face,
+    collects more for up to max_wait_ms (or until max_batch), runs one
+    forward pass and fans the rows back out. One thread owns the model, so
+    handlers no longer contend for the GIL and TF's thread pools.
+    """
+
+    def __init__(self, embed_fn, max_batch: int = BATCH_MAX, max_wait_ms: float = BATCH_WAIT_MS):
+        self.embed_fn = embed_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.faces = 0
+        self.wait_seconds = 0.0
+        self.size_counts = {b: 0 for b in BATCH_SIZE_BUCKETS}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="face-batcher", daemon=True)
+                self._thread.start()
+
+    def embed(self, faces: List[np.ndarray]) -> np.ndarray:
+        """Embeddings for faces -> (n, 512), computed in shared batches."""
+        if not faces:
+            return np.zeros((0, EXPECTED_EMBEDDING_DIM), dtype=np.float32)
+        self.start()
+        futures = []
+        for face in faces:
+            future = Future()
+            self._queue.put((face, future, time.perf_counter()))
+            futures.append(future)
+        return np.stack([future.result() for future in futures])
+
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                # Faces already queued join the batch even after the deadline
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            self._observe(len(batch), [started - queued for _, _, queued in batch])
+            try:
+                embeddings = self.embed_fn([face for face, _, _ in batch])
+                for row, (_, future, _) in zip(embeddings, batch):
+                    future.set_result(row)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+
+    def _observe(self, size: int, waits: list):
+        self.batches += 1
+        self.faces += size
+        self.wait_seconds += sum(waits)
+        bucket = next((b for b in BATCH_SIZE_BUCKETS if size <= b), BATCH_SIZE_BUCKETS[-1])
+        self.size_counts[bucket] += 1
+        if Histogram is not None:
+            BATCH_SIZE_HIST.observe(size)
+            for wait in waits:
+                QUEUE_WAIT_HIST.observe(wait)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "faces": self.faces,
+            "mean_batch_size": round(self.faces / self.batches, 2) if self.batches else 0.0,
+            "mean_queue_wait_ms": round(self.wait_seconds / self.faces * 1000, 2) if self.faces else 0.0,
+            "batch_size_counts": {f"<={b}": n for b, n in self.size_counts.items()},
+            "queued": self._queue.qsize(),
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+batcher = InferenceBatcher(embed_faces)
+
+def verify_frame(img: np.ndarray, target: np.ndarray, student_id: Optional[str] = None) -> dict:
+    """
+    Verdict for one frame against a unit target: detect, embed through the
+    batching queue, closest face's cosine distance vs THRESHOLD. With a
+    student_id, a frame nearly identical to the last one verified reuses
+    its verdict, a tracked verified face reuses its verdict, and detection
+    starts around that student's previous face box (except on the periodic
+    whole-frame frames, which take the full pipeline).
+    """
+    hint, whole_frame = roi_hints.region(student_id)
+    reused, difference, thumbnail = gate.check(student_id, img, target, force=whole_frame)
+    if reused is not None:
+        return {**reused, "reused": True, "frame_diff": round(difference, 2)}
+    verdict = _track_or_verify(img, target, student_id, hint, whole_frame)
+    gate.remember(student_id, thumbnail, verdict, target)
+    return {**verdict, "reused": False}
+
+def _track_or_verify(img: np.ndarray, target: np.ndarray, student_id: Optional[str],
+                     hint: Optional[tuple], whole_frame: bool) -> dict:
+    followed = None if whole_frame else tracker.follow(student_id, img, target)
+    if followed is not None:
+        verdict, box, score = followed
+        roi_hints.update(student_id, box)
+        return {**verdict, "tracked": True, "track_score": round(score, 3)}
+
+    faces = detect_faces(img, hint)
+    if not faces:
+        # No face detected → student is not present at the desk
+        roi_hints.update(student_id, None)
+        tracker.drop(student_id)
+        return {"is_present": False, "is_verified": False, "cosine_distance": 1.0, "threshold_used": 0.0,
+                "tracked": False}
+    embeddings = batcher.embed([face_obj["face"] for face_obj in faces])
+    distances = cosine_distances(embeddings, target)
+    closest = int(np.argmin(distances))
+    distance = float(distances[closest])
+    threshold = THRESHOLD
+    verdict = {
+        "is_present": True,
+        "is_verified": distance <= threshold,
+        "cosine_distance": distance,
+        "threshold_used": threshold,
+    }
+    _remember_face(student_id, img, faces[closest], verdict, target)
+    return {**verdict, "tracked": False}
+
+def _remember_face(student_id: Optional[str], img: np.ndarray, face_obj: dict, verdict: dict, target: np.ndarray):
+    """Next-frame state for a student's closest face: detection region, and a track if verified."""
+    box = _area_box(face_obj)
+    roi_hints.update(student_id, box)
+    if verdict["is_verified"]:
+        tracker.start(student_id, img, box, verdict, target)
+    else:
+        tracker.drop(student_id)
+
+def resolve_target(student_id: Optional[str], target_embedding: Optional[List[float]]) -> np.ndarray:
+    """
+    Unit target vector for a request: target_embedding when given (used for
+    this comparison only, never stored), else the stored embedding.
+    """
+    if target_embedding is not None:
+        if len(target_embedding) != EXPECTED_EMBEDDING_DIM:
+            raise HTTPException(
+                status_code=400,
+                detail=f"target_embedding must have {EXPECTED_EMBEDDING_DIM} values"
+            )
+        return unit_target(tuple(target_embedding))
+    if not student_id:
+        raise HTTPException(status_code=400, detail="student_id or target_embedding is required")
+    target = store.get(student_id)
+    if target is None:
+        raise HTTPException(status_code=404, detail=f"Unknown student_id: {student_id}")
+    return target
+
+def _decode_or_none(base64_str: str) -> Optional[np.ndarray]:
+    try:
+        return decode_base64_to_numpy(base64_str, FRAME_DECODE_FLAGS)
+    except Exception:
+        return None
+
 # =============================================
 # Startup: Pre-load model into memory
 # =============================================
@@ -116,6 +712,8 @@ async def preload_model():
             enforce_detection=False,
             detector_backend="skip",
         )
+        get_face_model()
+        batcher.start()
         print(f"[OK] {MODEL_NAME} model pre-loaded into memory!")
     except Exception as e:
         print(f"[WARN] Model pre-load failed (will lazy-load on first request): {e}")
@@ -127,7 +725,7 @@ async def preload_model():
 def read_root():
     return {
         "status": "online",
-        "version": "3.0.0",
+        "version": "3.1.0",
         "model": MODEL_NAME,
         "detector": DETECTOR_BACKEND,
         "distance_metric": DISTANCE_METRIC,
@@ -156,6 +754,11 @@ def health_check():
             "model": MODEL_NAME,
             "embedding_dim": EXPECTED_EMBEDDING_DIM,
             "inference_ms": round(latency_ms, 1),
+            "batching": batcher.stats(),
+            "store": store.stats(),
+            "streaming": {**streaming, "enabled": bool(SESSION_SECRET)},
+            "tracking": tracker.stats(),
+            "gating": gate.stats(),
         }
     except Exception as e:
         return JSONResponse(
@@ -163,6 +766,15 @@ def health_check():
             content={"status": "unhealthy", "error": str(e)}
         )
 
+# =============================================
+# GET /metrics — Prometheus (when prometheus_client is installed)
+# =============================================
+if Histogram is not None:
+    @app.get("/metrics")
+    def metrics():
+        """Batch size and queue wait histograms."""
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 # =============================================
 # POST /register-face — Extract face embedding
 # =============================================
@@ -173,12 +785,18 @@ def register_face(payload: FaceRegisterRequest):
     Uses enforce_detection=True to GUARANTEE a real face is found.
     
     Returns:
-        embedding: List[float] — 512-d vector for Facenet512
+        embedding: List[float] — 512-d vector for Facenet512 (not stored:
+            the Next.js route stores it with PUT /embeddings once saved)
         face_confidence: float — detector confidence score
         embedding_dim: int — dimension of the embedding
     """
-    df = get_deepface()
+    get_deepface()
     img = decode_base64_to_numpy(payload.image_base64)
+    return register_image(img)
+
+def register_image(img: np.ndarray) -> dict:
+    """Embedding of the one face in a registration snapshot."""
+    df = get_deepface()
     t0 = time.perf_counter()
 
     try:
@@ -232,70 +850,469 @@ def analyze_face(payload: FaceAnalyzeRequest):
     """
     Compare live snapshot against registered face embedding.
     
-    Uses DeepFace.verify() — the OFFICIAL API for face comparison.
-    - img1_path: numpy array (live webcam snapshot)  
-    - img2_path: List[float] (pre-calculated embedding from registration)
+    Same pipeline and verdict as DeepFace.verify(), split so the model call
+    can be shared with concurrent requests:
+    - Face detection + alignment on the snapshot (DeepFace.extract_faces)
+    - Embedding through the micro-batching queue (one forward pass for many
+      concurrent requests)
+    - Cosine distance to the stored embedding; with several faces the
+      closest one counts, verified when distance <= DeepFace's threshold
     
-    DeepFace.verify() handles:
-    - Face detection + alignment on img1
-    - Distance calculation (cosine)
-    - Threshold comparison (auto-tuned per model)
-    
-    When no face is detected (enforce_detection=True), catches ValueError
-    and returns is_present=False — cleaner than manual face_confidence checks.
+    The registered face is the stored embedding for student_id, or
+    target_embedding when sent. When no face is detected, returns
+    is_present=False.
     """
-    df = get_deepface()
-    img = decode_base64_to_numpy(payload.image_base64)
+    target = resolve_target(payload.student_id, payload.target_embedding)
+    get_deepface()
+    img = decode_base64_to_numpy(payload.image_base64, FRAME_DECODE_FLAGS)
+    return analyze_image(img, target, payload.student_id)
+
+def analyze_image(img: np.ndarray, target: np.ndarray, student_id: Optional[str] = None) -> dict:
+    t0 = time.perf_counter()
+    try:
+        verdict = verify_frame(img, target, student_id)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        return {"success": True, **verdict, "latency_ms": round(elapsed_ms, 1)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
+
+# =============================================
+# POST /register-face/binary, /analyze-face/binary — Raw JPEG uploads
+# =============================================
+async def read_image_upload(request: Request) -> bytes:
+    """
+    Image bytes of a raw (octet-stream / image/*) or multipart upload
+    (field "image"). A raw body arriving in one chunk is used as is.
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("image")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail='Multipart upload needs an "image" file field')
+        data = await upload.read()
+    else:
+        data = await request.body()
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty image body")
+    if len(data) > MAX_FRAME_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image too large ({len(data)} bytes). Max: {MAX_FRAME_BYTES}")
+    return data
+
+def _decode_upload(data: bytes, flags: int = cv2.IMREAD_COLOR) -> tuple:
     t0 = time.perf_counter()
+    img = decode_image_bytes(data, flags)
+    if img is None:
+        raise HTTPException(status_code=400, detail="Cannot decode image")
+    return img, {"bytes_in": len(data), "decode_ms": round((time.perf_counter() - t0) * 1000, 2)}
+
+def _register_upload(data: bytes) -> dict:
+    img, io_stats = _decode_upload(data)
+    return {**register_image(img), **io_stats}
+
+def _analyze_upload(data: bytes, target: np.ndarray, student_id: str) -> dict:
+    img, io_stats = _decode_upload(data, FRAME_DECODE_FLAGS)
+    return {**analyze_image(img, target, student_id), **io_stats}
+
+@app.post("/register-face/binary")
+async def register_face_binary(request: Request):
+    """/register-face for a raw JPEG upload."""
+    get_deepface()
+    data = await read_image_upload(request)
+    return await run_in_threadpool(_register_upload, data)
+
+@app.post("/analyze-face/binary")
+async def analyze_face_binary(request: Request, student_id: str):
+    """/analyze-face for a raw JPEG upload, against the stored embedding of student_id."""
+    target = resolve_target(student_id, None)
+    get_deepface()
+    data = await read_image_upload(request)
+    return await run_in_threadpool(_analyze_upload, data, target, student_id)
+
+# =============================================
+# POST /analyze-face/batch — Verify many frames in one pass
+# =============================================
+@app.post("/analyze-face/batch")
+def analyze_face_batch(payload: FaceBatchRequest):
+    """
+    Verify many (frame, registered face) pairs, e.g. a whole classroom.
+    Each item names its student_id (stored embedding) or sends
+    target_embedding, as in /analyze-face.
+
+    Detection runs per frame in parallel; every detected face is then
+    embedded through the batching queue (one forward pass for the whole
+    request, shared with concurrent /analyze-face calls), and distances to each
+    item's target embedding are computed together. Same verdict rules as
+    /analyze-face: no face -> is_present=False; with several faces the
+    closest one counts (as DeepFace.verify() does).
+
+    Returns results in request order. A frame that cannot be decoded gets
+    success=False with an error instead of failing the whole batch.
+    """
+    items = payload.items
+    if not items:
+        return {"success": True, "results": [], "count": 0, "faces": 0, "latency_ms": 0.0}
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many items ({len(items)}). Max: {MAX_BATCH_ITEMS}")
+    item_targets = []
+    for item in items:
+        try:
+            item_targets.append(resolve_target(item.student_id, item.target_embedding))
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=f"{e.detail} (item {item.id})")
+
+    get_deepface()
+    t0 = time.perf_counter()
+    images = list(detect_pool.map(_decode_or_none, [item.image_base64 for item in items]))
+    t_decode = time.perf_counter()
+    # Near-identical frames and still-tracked verified faces reuse their verdict,
+    # except on whole-frame frames
+    regions = [
+        roi_hints.region(item.student_id) if img is not None else (None, False)
+        for item, img in zip(items, images)
+    ]
+    gated = [
+        gate.check(item.student_id, img, target, force=region[1]) if img is not None else (None, None, None)
+        for item, img, target, region in zip(items, images, item_targets, regions)
+    ]
+    followed = [
+        tracker.follow(item.student_id, img, target)
+        if img is not None and gated_item[0] is None and not region[1] else None
+        for item, img, target, gated_item, region in zip(items, images, item_targets, gated, regions)
+    ]
+    detections = list(detect_pool.map(
+        lambda img, region, reused, hit: detect_faces(img, region[0])
+        if img is not None and reused[0] is None and hit is None else [],
+        images, regions, gated, followed,
+    ))
+    t_detect = time.perf_counter()
+
+    # Flatten faces, remembering which item each belongs to
+    faces, face_objs, owners = [], [], []
+    for index, item_faces in enumerate(detections):
+        for face_obj in item_faces:
+            faces.append(face_obj["face"])
+            face_objs.append(face_obj)
+            owners.append(index)
 
     try:
-        # === DeepFace.verify() — Official API ===
-        # Replaces manual: represent() → cosine_distance() → threshold check
-        result = df.verify(
-            img1_path=img,                        # numpy BGR array (live snapshot)
-            img2_path=payload.target_embedding,   # List[float] (stored embedding)
-            model_name=MODEL_NAME,
-            detector_backend=DETECTOR_BACKEND,
-            distance_metric=DISTANCE_METRIC,
-            enforce_detection=True,               # Raise ValueError if no face
-            align=True,                           # Face alignment pipeline
-        )
+        embeddings = batcher.embed(faces)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
+    t_embed = time.perf_counter()
 
-        elapsed_ms = (time.perf_counter() - t0) * 1000
+    threshold = THRESHOLD
+    distances = np.ones(len(items), dtype=np.float64)
+    closest_face = {}
+    if len(faces):
+        targets = np.stack([item_targets[i] for i in owners])
+        face_distances = cosine_distances(embeddings, targets)
+        np.minimum.at(distances, np.asarray(owners), face_distances)
+        for owner, face_obj, distance in zip(owners, face_objs, face_distances):
+            if distance == distances[owner]:
+                closest_face.setdefault(owner, face_obj)
 
-        return {
-            "success": True,
-            "is_present": True,
-            "is_verified": bool(result["verified"]),
-            "cosine_distance": float(result["distance"]),
-            "threshold_used": float(result["threshold"]),
-            "latency_ms": round(elapsed_ms, 1),
+    results = []
+    for index, item in enumerate(items):
+        face_count = len(detections[index])
+        if images[index] is None:
+            results.append({"id": item.id, "success": False, "error": "Cannot decode image from base64"})
+            continue
+        reused, difference, thumbnail = gated[index]
+        if reused is not None:
+            results.append({"id": item.id, "success": True, **reused,
+                            "reused": True, "frame_diff": round(difference, 2)})
+            continue
+        if followed[index] is not None:
+            verdict, box, score = followed[index]
+            roi_hints.update(item.student_id, box)
+            verdict = {**verdict, "face_count": 1, "tracked": True, "track_score": round(score, 3)}
+            gate.remember(item.student_id, thumbnail, verdict, item_targets[index])
+            results.append({"id": item.id, "success": True, **verdict, "reused": False})
+            continue
+        verdict = {
+            "is_present": face_count > 0,
+            "is_verified": bool(face_count > 0 and distances[index] <= threshold),
+            "cosine_distance": float(distances[index]) if face_count else 1.0,
+            "threshold_used": threshold if face_count else 0.0,
         }
+        if face_count:
+            _remember_face(item.student_id, images[index], closest_face[index], verdict, item_targets[index])
+        else:
+            roi_hints.update(item.student_id, None)
+            tracker.drop(item.student_id)
+        verdict = {**verdict, "face_count": face_count, "tracked": False}
+        gate.remember(item.student_id, thumbnail, verdict, item_targets[index])
+        results.append({"id": item.id, "success": True, **verdict, "reused": False})
 
-    except ValueError:
-        # No face detected → student is not present at the desk
-        elapsed_ms = (time.perf_counter() - t0) * 1000
-        return {
-            "success": True,
-            "is_present": False,
-            "is_verified": False,
-            "cosine_distance": 1.0,
-            "threshold_used": 0.0,
-            "latency_ms": round(elapsed_ms, 1),
-        }
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    print(f"[BATCH] items={len(items)}, faces={len(faces)}, time={elapsed_ms:.0f}ms")
+    return {
+        "success": True,
+        "results": results,
+        "count": len(items),
+        "faces": len(faces),
+        "latency_ms": round(elapsed_ms, 1),
+        "timings_ms": {
+            "decode": round((t_decode - t0) * 1000, 1),
+            "detect": round((t_detect - t_decode) * 1000, 1),
+            "embed": round((t_embed - t_detect) * 1000, 1),
+        },
+    }
 
+# =============================================
+# POST /identify-face — Who is in the frame? (1:N)
+# =============================================
+@app.post("/identify-face")
+def identify_face(payload: FaceIdentifyRequest):
+    """
+    Search every face in a snapshot against all registered students.
+
+    Returns, per detected face, the k closest registered students with their
+    cosine distances (nearest first); is_match marks those within the
+    verification threshold. mode="exact" scans every student, "approx" uses
+    the IVF index, "auto" (default) picks by store size.
+    """
+    if payload.mode not in ("auto", "exact", "approx"):
+        raise HTTPException(status_code=400, detail="mode must be auto, exact or approx")
+    if not 1 <= payload.k <= MAX_IDENTIFY_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {MAX_IDENTIFY_K}")
+    get_deepface()
+    img = decode_base64_to_numpy(payload.image_base64, FRAME_DECODE_FLAGS)
+    t0 = time.perf_counter()
+
+    try:
+        faces = detect_faces(img)
+        embeddings = batcher.embed([face_obj["face"] for face_obj in faces])
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Identification error: {str(e)}")
+    t_embed = time.perf_counter()
+
+    threshold = THRESHOLD
+    results = []
+    for face_obj, embedding in zip(faces, embeddings):
+        matches = store.search(embedding, payload.k, payload.mode)
+        results.append({
+            "facial_area": {key: int(value) for key, value in face_obj.get("facial_area", {}).items()
+                            if isinstance(value, (int, float, np.integer, np.floating))},
+            "matches": [
+                {"student_id": student_id, "cosine_distance": distance, "is_match": distance <= threshold}
+                for student_id, distance in matches
+            ],
+        })
+    t_search = time.perf_counter()
+
+    return {
+        "success": True,
+        "is_present": bool(faces),
+        "faces": results,
+        "threshold_used": threshold,
+        "registered": len(store),
+        "latency_ms": round((t_search - t0) * 1000, 1),
+        "timings_ms": {
+            "embed": round((t_embed - t0) * 1000, 1),
+            "search": round((t_search - t_embed) * 1000, 3),
+        },
+    }
+
+# =============================================
+# WebSocket /ws/monitor — Streaming proctoring session
+# =============================================
+def session_student(student_id: Optional[str], token: Optional[str]) -> Optional[str]:
+    """
+    Student a session is for: only a valid unexpired token
+    "<student_id>.<expires unix s>.<hex HMAC-SHA256>" counts, and none
+    without FACE_SESSION_SECRET.
+    """
+    if not SESSION_SECRET:
+        return None
+    try:
+        student, expires, signature = (token or "").rsplit(".", 2)
+    except ValueError:
+        return None
+    expected = hmac.new(SESSION_SECRET.encode(), f"{student}.{expires}".encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(signature, expected) or not expires.isdigit() or int(expires) < time.time():
+        return None
+    return student
+
+def verdict_log_token(student: str, verdict: dict) -> str:
+    """
+    "<student_id>.<present 0|1>.<verified 0|1>.<confidence>.<issued unix s>.<hex HMAC-SHA256>":
+    lets /api/monitor/log record a verdict it did not compute itself.
+    """
+    confidence = 1 - verdict["cosine_distance"] if verdict["is_present"] else 0.0
+    payload = (f"{student}.{int(verdict['is_present'])}.{int(verdict['is_verified'])}"
+               f".{confidence:.4f}.{int(time.time())}")
+    signature = hmac.new(SESSION_SECRET.encode(), payload.encode(), hashlib.sha256).hexdigest()
+    return f"{payload}.{signature}"
+
+def analyze_frame_bytes(data: bytes, target: np.ndarray, student_id: str) -> dict:
+    t0 = time.perf_counter()
+    img = decode_image_bytes(data, FRAME_DECODE_FLAGS)
+    if img is None:
+        return {"type": "error", "error": "Cannot decode frame"}
+    verdict = verify_frame(img, target, student_id)
+    return {"type": "verdict", **verdict, "latency_ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+@app.websocket("/ws/monitor")
+async def monitor_session(websocket: WebSocket, student_id: Optional[str] = None, token: Optional[str] = None):
+    """
+    Continuous verification for one student.
+
+    Client -> server: binary messages, one JPEG frame each.
+    Server -> client: {"type": "ready"} once, then per analyzed frame
+    {"type": "verdict", "seq", is_present, is_verified, cosine_distance,
+    threshold_used, latency_ms, "dropped"} (seq = 1-based index of the frame
+    among those received; dropped = frames skipped so far because a newer
+    one arrived first), plus "log_token" on the first verdict and whenever
+    is_present or is_verified changes. Close codes: 4401 bad token, 4403
+    streaming disabled (no FACE_SESSION_SECRET), 4404 face not registered
+    on this server (the Next.js analyze route stores it from the database
+    with PUT /embeddings), 4408 idle.
+    """
+    student = session_student(student_id, token)
+    await websocket.accept()
+    if not SESSION_SECRET:
+        await websocket.close(code=4403)
+        return
+    if student is None:
+        await websocket.close(code=4401)
+        return
+    target = store.get(student)
+    if target is None:
+        await websocket.send_json({"type": "error", "error": f"Unknown student_id: {student}"})
+        await websocket.close(code=4404)
+        return
+
+    await websocket.send_json({"type": "ready", "student_id": student, "threshold": THRESHOLD})
+    streaming["sessions"] += 1
+    latest = None               # (seq, frame) waiting to be analyzed; newer frames replace it
+    received = dropped = 0
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        nonlocal latest, received, dropped
+        while True:
+            try:
+                message = await asyncio.wait_for(websocket.receive(), WS_IDLE_SECONDS)
+            except asyncio.TimeoutError:
+                await websocket.close(code=4408)
+                return
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            if not data or len(data) > MAX_FRAME_BYTES:
+                continue
+            received += 1
+            streaming["frames"] += 1
+            if latest is not None:
+                dropped += 1
+                streaming["dropped"] += 1
+                if Histogram is not None:
+                    WS_FRAMES.labels(result="dropped").inc()
+            latest = (received, data)
+            frame_ready.set()
+
+    async def analyze_frames():
+        nonlocal latest
+        logged = None           # (is_present, is_verified) of the last log_token sent
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            seq, data = latest
+            latest = None
+            try:
+                result = await run_in_threadpool(analyze_frame_bytes, data, target, student)
+            except Exception as e:
+                result = {"type": "error", "error": f"Analysis error: {str(e)}"}
+            streaming["analyzed"] += 1
+            if Histogram is not None:
+                WS_FRAMES.labels(result="analyzed").inc()
+            if result["type"] == "verdict" and (result["is_present"], result["is_verified"]) != logged:
+                logged = (result["is_present"], result["is_verified"])
+                result["log_token"] = verdict_log_token(student, result)
+            await websocket.send_json({**result, "seq": seq, "dropped": dropped})
+
+    tasks = [asyncio.create_task(receive_frames()), asyncio.create_task(analyze_frames())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        streaming["sessions"] -= 1
+        print(f"[WS] student={student}, frames={received}, dropped={dropped}")
+
+# =============================================
+# PUT/DELETE /embeddings/{student_id} — Manage stored embeddings
+# =============================================
+def check_store_auth(request: Request, student_id: str):
+    """
+    Writes to the store come only from the Next.js routes: X-Face-Store-Auth
+    must be "<unix s>.<hex HMAC-SHA256 of '<METHOD> <student_id> <unix s>'>"
+    under FACE_SESSION_SECRET, at most STORE_AUTH_MAX_AGE seconds old.
+    """
+    if not SESSION_SECRET:
+        raise HTTPException(status_code=403, detail="Store writes need FACE_SESSION_SECRET")
+    try:
+        issued, signature = request.headers.get("x-face-store-auth", "").split(".", 1)
+    except ValueError:
+        raise HTTPException(status_code=403, detail="Missing store authorization")
+    message = f"{request.method} {student_id} {issued}".encode()
+    expected = hmac.new(SESSION_SECRET.encode(), message, hashlib.sha256).hexdigest()
+    if (not hmac.compare_digest(signature.encode(), expected.encode()) or not issued.isdigit()
+            or abs(time.time() - int(issued)) > STORE_AUTH_MAX_AGE):
+        raise HTTPException(status_code=403, detail="Invalid store authorization")
+
+@app.put("/embeddings/{student_id}")
+def put_embedding(student_id: str, payload: EmbeddingRequest, request: Request):
+    """Store an embedding computed elsewhere (the registration route, a backfill from the database)."""
+    check_store_auth(request, student_id)
+    try:
+        store.put(student_id, payload.embedding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "student_id": student_id, "count": len(store)}
+
+@app.delete("/embeddings/{student_id}")
+def delete_embedding(student_id: str, request: Request):
+    check_store_auth(request, student_id)
+    if not store.delete(student_id):
+        raise HTTPException(status_code=404, detail=f"Unknown student_id: {student_id}")
+    return {"success": True, "student_id": student_id, "count": len(store)}
+
+# =============================================
+# Public listener — browser-facing routes only
+# =============================================
+public_app = FastAPI(
+    title="ExamHub DeepFace Microservice (public)",
+    description="Streaming sessions for browsers; every other route is internal.",
+    version="3.1.0"
+)
+public_app.add_api_websocket_route("/ws/monitor", monitor_session)
+public_app.add_api_route("/health", health_check, methods=["GET"])
+
+async def serve_all(servers: List[uvicorn.Server]):
+    await asyncio.gather(*(server.serve() for server in servers))
 
 # =============================================
 # Entry point
 # =============================================
 if __name__ == "__main__":
     print("=" * 50)
-    print(f"  DeepFace Server v3.0")
+    print(f"  DeepFace Server v3.1")
     print(f"  Model:    {MODEL_NAME} ({EXPECTED_EMBEDDING_DIM}-d)")
     print(f"  Detector: {DETECTOR_BACKEND}")
     print(f"  Metric:   {DISTANCE_METRIC}")
-    print(f"  API:      DeepFace.verify() (official)")
+    print(f"  Batching: up to {BATCH_MAX} faces / {BATCH_WAIT_MS:g}ms")
+    print(f"  Store:    {len(store)} faces ({STORE_PATH})")
+    if PUBLIC_PORT:
+        print(f"  Public:   {PUBLIC_HOST}:{PUBLIC_PORT} (/ws/monitor, /health)")
     print("=" * 50)
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    if not PUBLIC_PORT:
+        uvicorn.run(app, host="127.0.0.1", port=8000)
+    else:
+        # One process for both listeners, so they share the model and the store
+        asyncio.run(serve_all([
+            uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=8000)),
+            uvicorn.Server(uvicorn.Config(public_app, host=PUBLIC_HOST, port=PUBLIC_PORT)),
+        ]))
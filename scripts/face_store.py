@@ -0,0 +1,193 @@
+"""
+Persistent registered-face store for the DeepFace microservice.
+
+Registered embeddings live in a local SQLite file (float32 blobs) and in
+memory as one float32 matrix of unit vectors, so analysis requests send a
+student_id instead of 512 floats per frame and the server compares against
+vectors that are already normalized.
+
+Rows registered with another model or dimension (e.g. after a model switch)
+are ignored at load, like the Next.js route's stale-embedding migration.
+
+search() answers 1:N queries ("who is this?"): an exact scan of the whole
+matrix for class-sized stores, and an IVF index (face_index.py) once the
+store reaches ann_min_size rows. The index is kept up to date on put() and
+delete().
+
+The matrices are views of preallocated buffers that double when full: a
+new registration is written into the next free row and then published, and
+a deletion moves the last row into the freed one, so neither copies the
+store. Readers take the published views and ids together; a reader racing
+a delete may briefly see the moved vector under the deleted id.
+"""
+
+import time
+import sqlite3
+import threading
+from typing import Optional
+
+import numpy as np
+
+from face_index import IVFIndex, top_k
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    student_id TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    embedding BLOB NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+# Initial buffer rows; the buffers double when full
+MIN_CAPACITY = 64
+
+
+class EmbeddingStore:
+    """student_id -> embedding, persisted in SQLite and resident as a matrix."""
+
+    def __init__(self, path: str, model_name: str, dim: int,
+                 ann_min_size: int = 4096, nprobe: int = 16):
+        self.path = path
+        self.model_name = model_name
+        self.dim = dim
+        self.ann_min_size = ann_min_size
+        self.index = IVFIndex(nprobe=nprobe)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(SCHEMA)
+        self._load()
+
+    def _load(self):
+        rows = self._conn.execute(
+            "SELECT student_id, embedding FROM embeddings WHERE model = ? AND dim = ? ORDER BY student_id",
+            (self.model_name, self.dim),
+        ).fetchall()
+        self.ids = [student_id for student_id, _ in rows]
+        self._rows = {student_id: i for i, student_id in enumerate(self.ids)}
+        self._raw = np.zeros((max(len(rows), MIN_CAPACITY), self.dim), dtype=np.float32)
+        for i, (_, blob) in enumerate(rows):
+            self._raw[i] = np.frombuffer(blob, dtype=np.float32)
+        self._unit = _normalize(self._raw)
+        self._publish()
+        if len(self.ids) >= self.ann_min_size:
+            self.index.build(self.unit)
+        else:
+            self.index.build(self.unit[:0])
+
+    def _publish(self):
+        """Expose the filled rows of the buffers to readers."""
+        count = len(self.ids)
+        self.raw, self.unit = self._raw[:count], self._unit[:count]
+
+    def _grow(self):
+        """Double the buffers; the old ones stay valid for current readers."""
+        capacity = 2 * self._raw.shape[0]
+        for name in ("_raw", "_unit"):
+            old = getattr(self, name)
+            new = np.zeros((capacity, self.dim), dtype=np.float32)
+            new[: old.shape[0]] = old
+            setattr(self, name, new)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, student_id: str) -> bool:
+        return student_id in self._rows
+
+    def put(self, student_id: str, embedding) -> None:
+        """Insert or replace a student's embedding (persisted before it is visible)."""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"Embedding must have {self.dim} values, got {vector.shape[0]}")
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (student_id, model, dim, embedding, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (student_id, self.model_name, self.dim, vector.tobytes(), time.time()),
+            )
+            row = self._rows.get(student_id)
+            if row is None:
+                row = len(self.ids)
+                if row == self._raw.shape[0]:
+                    self._grow()
+            # Rows past the published views are invisible until _publish()
+            self._raw[row] = vector
+            self._unit[row] = _normalize(vector[None, :])[0]
+            if row == len(self.ids):
+                self.ids.append(student_id)
+                self._publish()
+                self._rows[student_id] = row
+            if len(self.ids) >= self.ann_min_size:
+                if self.index.needs_training():
+                    self.index.build(self.unit)
+                else:
+                    self.index.add(row, self.unit[row])
+
+    def delete(self, student_id: str) -> bool:
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings WHERE student_id = ?", (student_id,))
+            row = self._rows.pop(student_id, None)
+            if row is None:
+                return False
+            # Swap-remove: the last row takes the freed slot
+            last = len(self.ids) - 1
+            ids = list(self.ids)
+            if row != last:
+                self._raw[row] = self._raw[last]
+                self._unit[row] = self._unit[last]
+                ids[row] = ids[last]
+                self._rows[ids[row]] = row
+            ids.pop()
+            self.ids = ids
+            self._publish()
+            if len(ids) < self.ann_min_size:
+                if self.index.trained:
+                    self.index.build(self.unit[:0])
+            elif self.index.trained:
+                self.index.remove(last)
+                if row != last:
+                    self.index.add(row, self.unit[row])
+            return True
+
+    def get(self, student_id: str) -> Optional[np.ndarray]:
+        """Stored embedding as a float64 unit vector, or None if not registered."""
+        row = self._rows.get(student_id)
+        if row is None:
+            return None
+        vector = self.raw[row].astype(np.float64)
+        return vector / max(np.linalg.norm(vector), 1e-10)
+
+    def search(self, embedding, k: int = 5, mode: str = "auto"):
+        """
+        The k registered students closest to an embedding, as
+        [(student_id, cosine_distance)] nearest first. mode: "exact",
+        "approx" (IVF, falls back to exact while the store is too small to
+        index) or "auto" (approx from ann_min_size rows).
+        """
+        ids, unit, index = self.ids, self.unit, self.index
+        count = min(len(ids), len(unit))  # put() may be between the two swaps
+        if not count:
+            return []
+        query = np.asarray(embedding, dtype=np.float64).reshape(-1)
+        query = (query / max(np.linalg.norm(query), 1e-10)).astype(np.float32)
+        if mode != "exact" and index.trained:
+            rows, _ = index.search(query, k)
+            rows = rows[rows < count]
+        else:
+            rows, _ = top_k(np.arange(count), unit[:count] @ query, k)
+        # Final distances in float64, as in the 1:1 check
+        distances = 1.0 - unit[rows].astype(np.float64) @ query.astype(np.float64)
+        return [(ids[row], float(distance)) for row, distance in zip(rows, distances)]
+
+    def stats(self) -> dict:
+        return {"path": self.path, "students": len(self.ids), "model": self.model_name, "dim": self.dim,
+                "index": self.index.stats() if self.index.trained else None}
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return (matrix / np.maximum(norms, 1e-10)).astype(np.float32)
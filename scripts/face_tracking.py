@@ -0,0 +1,226 @@
+"""
+Temporal face tracking for continuous verification.
+
+A seated student barely moves between proctoring frames, so after a full
+verification (detect + align + Facenet512) the verified face is followed
+from frame to frame with template matching: a small grayscale template of
+the verified face is searched for in a window around its last position
+(cv2.matchTemplate, well under a millisecond). While the match stays good,
+the last verdict is reused and detection and embedding are skipped.
+
+A track ends, and the next frame is verified in full, when:
+- the match score drops below min_score (face lost, turned away, or a
+  different face: a large appearance change against the verified face)
+- refresh_seconds have passed or max_frames frames were reused since the
+  last full verification
+- the target embedding changed (re-registration)
+
+Only verified faces are tracked: frames of an absent or unverified student
+always take the full pipeline.
+
+FrameGate sits in front of both: a frame nearly identical to the one the
+student's last verdict was computed from reuses that verdict, whatever it
+was, for at most max_age seconds. The difference score is the mean of the
+largest 5% pixel differences between 32x24 grayscale thumbnails: area
+averaging removes sensor noise, and a change confined to the face (a few
+percent of the frame) is not diluted by the static background.
+
+A reused verdict also reuses its presence and face count, so neither
+shortcut can notice a second person entering the frame. The caller
+bypasses both (check(force=True), no follow()) on its periodic whole-frame
+detections, which bounds how long such a person goes unseen.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+import numpy as np
+
+# Track outcomes per frame, for metrics
+RESULTS = ("tracked", "lost", "refresh", "untracked")
+GATE_RESULTS = ("reused", "changed", "expired", "new", "forced")
+
+
+class _Track:
+    __slots__ = ("box", "template", "scale", "verdict", "target", "verified_at", "frames")
+
+
+class FaceTracker:
+    """Per-student face tracks, keyed by student_id."""
+
+    def __init__(self, refresh_seconds: float = 5.0, max_frames: int = 50, min_score: float = 0.7,
+                 template_width: int = 48, search_margin: float = 0.5, max_entries: int = 10000,
+                 enabled: bool = True, on_result=None):
+        self.refresh_seconds = refresh_seconds
+        self.max_frames = max_frames
+        self.min_score = min_score
+        self.template_width = template_width
+        self.search_margin = search_margin
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.on_result = on_result
+        self.counts = dict.fromkeys(RESULTS, 0)
+        self._tracks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def follow(self, key: Optional[str], img: np.ndarray, target: np.ndarray) -> Optional[tuple]:
+        """
+        (verdict, box, score) when the tracked face is found again in img and
+        the last verdict may be reused; None when the frame needs a full
+        verification.
+        """
+        if not self.enabled or not key:
+            return None
+        with self._lock:
+            track = self._tracks.get(key)
+        if track is None:
+            self._count("untracked")
+            return None
+        if (time.monotonic() - track.verified_at > self.refresh_seconds
+                or track.frames >= self.max_frames or not np.array_equal(track.target, target)):
+            self.drop(key)
+            self._count("refresh")
+            return None
+        box, score = self._match(track, img)
+        if box is None or score < self.min_score:
+            self.drop(key)
+            self._count("lost")
+            return None
+        track.box = box
+        track.frames += 1
+        self._count("tracked")
+        return track.verdict, box, score
+
+    def start(self, key: Optional[str], img: np.ndarray, box: tuple, verdict: dict, target: np.ndarray):
+        """Begin (or restart) tracking a just-verified face; box is (x, y, w, h) in img."""
+        if not self.enabled or not key:
+            return
+        x, y, w, h = (int(v) for v in box)
+        if w < 8 or h < 8:
+            return
+        track = _Track()
+        track.scale = self.template_width / w
+        track.template = self._gray(img[y:y + h, x:x + w], track.scale)
+        track.box = (x, y, w, h)
+        track.verdict = verdict
+        track.target = np.array(target, copy=True)
+        track.verified_at = time.monotonic()
+        track.frames = 0
+        with self._lock:
+            self._tracks[key] = track
+            self._tracks.move_to_end(key)
+            while len(self._tracks) > self.max_entries:
+                self._tracks.popitem(last=False)
+
+    def drop(self, key: Optional[str]):
+        if key:
+            with self._lock:
+                self._tracks.pop(key, None)
+
+    def stats(self) -> dict:
+        total = sum(self.counts.values())
+        return {"enabled": self.enabled, "tracks": len(self._tracks), **self.counts,
+                "reuse_ratio": round(self.counts["tracked"] / total, 3) if total else 0.0}
+
+    def _match(self, track: _Track, img: np.ndarray) -> tuple:
+        """Best position of the template in a window around the last box, and its score."""
+        x, y, w, h = track.box
+        mx, my = int(self.search_margin * w), int(self.search_margin * h)
+        x0, y0 = max(x - mx, 0), max(y - my, 0)
+        x1, y1 = min(x + w + mx, img.shape[1]), min(y + h + my, img.shape[0])
+        window = self._gray(img[y0:y1, x0:x1], track.scale)
+        th, tw = track.template.shape
+        if window.shape[0] < th or window.shape[1] < tw:
+            return None, 0.0
+        scores = cv2.matchTemplate(window, track.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (bx, by) = cv2.minMaxLoc(scores)
+        return (x0 + int(round(bx / track.scale)), y0 + int(round(by / track.scale)), w, h), float(score)
+
+    @staticmethod
+    def _gray(img: np.ndarray, scale: float) -> np.ndarray:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        size = (max(int(round(gray.shape[1] * scale)), 1), max(int(round(gray.shape[0] * scale)), 1))
+        return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+    def _count(self, result: str):
+        self.counts[result] += 1
+        if self.on_result is not None:
+            self.on_result(result)
+
+
+class FrameGate:
+    """Per-student reuse of the last verdict for near-identical frames."""
+
+    def __init__(self, threshold: float = 8.0, max_age: float = 2.0, size: tuple = (32, 24),
+                 max_entries: int = 10000, enabled: bool = True, on_result=None):
+        self.threshold = threshold
+        self.max_age = max_age
+        self.size = size
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.on_result = on_result
+        self.counts = dict.fromkeys(GATE_RESULTS, 0)
+        self._entries = OrderedDict()     # key -> (thumbnail, verdict, target, computed_at)
+        self._lock = threading.Lock()
+
+    def check(self, key: Optional[str], img: np.ndarray, target: np.ndarray, force: bool = False) -> tuple:
+        """
+        (verdict, difference, thumbnail): verdict is the reusable previous
+        verdict or None (always None with force); pass the thumbnail to
+        remember() with the new one.
+        """
+        if not self.enabled or not key:
+            return None, None, None
+        thumbnail = self.thumbnail(img)
+        if force:
+            self._count("forced")
+            return None, None, thumbnail
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            self._count("new")
+            return None, None, thumbnail
+        previous, verdict, previous_target, computed_at = entry
+        if time.monotonic() - computed_at > self.max_age or not np.array_equal(previous_target, target):
+            self._count("expired")
+            return None, None, thumbnail
+        difference = self.difference(thumbnail, previous)
+        if difference >= self.threshold:
+            self._count("changed")
+            return None, difference, thumbnail
+        self._count("reused")
+        return verdict, difference, thumbnail
+
+    def remember(self, key: Optional[str], thumbnail: Optional[np.ndarray], verdict: dict, target: np.ndarray):
+        """Store a freshly computed verdict and the thumbnail of its frame."""
+        if not self.enabled or not key or thumbnail is None:
+            return
+        with self._lock:
+            self._entries[key] = (thumbnail, verdict, np.array(target, copy=True), time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def difference(a: np.ndarray, b: np.ndarray) -> float:
+        """Mean of the largest 5% absolute pixel differences (0-255)."""
+        diff = np.abs(a - b).ravel()
+        top = max(diff.size // 20, 1)
+        return float(np.partition(diff, diff.size - top)[-top:].mean())
+
+    def thumbnail(self, img: np.ndarray) -> np.ndarray:
+        small = cv2.resize(img, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+    def stats(self) -> dict:
+        total = sum(self.counts.values())
+        return {"enabled": self.enabled, "sessions": len(self._entries), **self.counts,
+                "skip_ratio": round(self.counts["reused"] / total, 3) if total else 0.0}
+
+    def _count(self, result: str):
+        self.counts[result] += 1
+        if self.on_result is not None:
+            self.on_result(result)
@@ -1,7 +1,10 @@
+import { createHmac } from "crypto"
 import { NextRequest, NextResponse } from "next/server"
 import { createClient, createAdminClient } from "@/lib/supabase/server"
 
 const PYTHON_SERVER_URL = process.env.PYTHON_SERVER_URL || "http://127.0.0.1:8000"
+// Phải trùng FACE_SESSION_SECRET của face_server.py: chỉ route này được ghi kho embedding của face server
+const FACE_SESSION_SECRET = process.env.FACE_SESSION_SECRET || ""
 
 // Model configuration — must match face_server.py
 const EXPECTED_EMBEDDING_DIM = 512 // Facenet512
@@ -49,6 +52,26 @@ async function getCachedEmbedding(adminClient: any, userId: string): Promise<num
   return embedding
 }
 
+// ===== Face server embedding store =====
+// PUT/DELETE /embeddings/{id} cần header X-Face-Store-Auth ký HMAC (face server từ chối mọi ghi khác)
+async function writeFaceStore(
+  baseUrl: string,
+  method: "PUT" | "DELETE",
+  studentId: string,
+  embedding?: number[]
+): Promise<boolean> {
+  if (!FACE_SESSION_SECRET) return false
+  const issued = Math.floor(Date.now() / 1000)
+  const signature = createHmac("sha256", FACE_SESSION_SECRET)
+    .update(`${method} ${studentId} ${issued}`)
+    .digest("hex")
+  return fetch(`${baseUrl}/embeddings/${encodeURIComponent(studentId)}`, {
+    method,
+    headers: { "Content-Type": "application/json", "X-Face-Store-Auth": `${issued}.${signature}` },
+    body: embedding ? JSON.stringify({ embedding }) : undefined
+  }).then(res => res.ok).catch(() => false)
+}
+
 // ===== Debounced DB Logging =====
 // Only log when status CHANGES (not every frame at 10 FPS)
 interface LastLogState {
@@ -146,6 +169,7 @@ export async function POST(request: NextRequest) {
           headers: {
             "Content-Type": "application/json"
           },
+          // Không gửi student_id: face server chỉ lưu embedding sau khi DB đã ghi thành công (bước PUT bên dưới)
           body: JSON.stringify({ image_base64 })
         })
 
@@ -168,6 +192,8 @@ export async function POST(request: NextRequest) {
             registered_at: new Date().toISOString()
           }, { onConflict: "student_id" })
 
+        embeddingCache.delete(targetStudentId)
+
         if (dbError) {
           console.error("Lỗi lưu DB face registration:", dbError)
           return NextResponse.json({ 
@@ -175,6 +201,14 @@ export async function POST(request: NextRequest) {
           }, { status: 500 })
         }
 
+        // DB đã có bản mới: face server giữ bản sao để các frame analyze chỉ cần gửi id.
+        // Lỗi ở đây không chặn đăng ký: xoá bản cũ trên face server (nếu có), frame
+        // analyze đầu tiên nhận 404 và nạp lại từ DB.
+        if (!(await writeFaceStore(cleanPythonServerUrl, "PUT", targetStudentId, data.embedding))) {
+          console.warn(`Face server không lưu được embedding của ${targetStudentId}`)
+          await writeFaceStore(cleanPythonServerUrl, "DELETE", targetStudentId)
+        }
+
         return NextResponse.json({
           success: true,
           message: "Đăng ký khuôn mặt mẫu thành công!"
@@ -192,27 +226,31 @@ export async function POST(request: NextRequest) {
     // TRƯỜNG HỢP B: ĐỐI SÁNH & PHÂN TÍCH REALTIME (ANALYZE)
     // ----------------------------------------------------
     if (type === "analyze") {
-      // 1. Lấy dữ liệu khuôn mặt mẫu gốc của em trai (CACHED — không gọi DB mỗi frame)
-      const targetEmbedding = await getCachedEmbedding(adminClient, userId)
-
-      if (!targetEmbedding) {
-        return NextResponse.json({ 
-          error: "Chưa đăng ký khuôn mặt mẫu gốc. Vui lòng thiết lập đăng ký khuôn mặt trước." 
-        }, { status: 400 })
-      }
+      const analyze = (payload: Record<string, unknown>) => fetch(`${cleanPythonServerUrl}/analyze-face`, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json"
+        },
+        body: JSON.stringify({ image_base64, student_id: userId, ...payload })
+      })
 
       try {
-        // 2. Gửi snapshot kèm vector gốc sang Python FastAPI
-        const response = await fetch(`${cleanPythonServerUrl}/analyze-face`, {
-          method: "POST",
-          headers: {
-            "Content-Type": "application/json"
-          },
-          body: JSON.stringify({
-            image_base64,
-            target_embedding: targetEmbedding
-          })
-        })
+        // 1. Gửi snapshot kèm student_id: face server so với embedding đã lưu (không gửi 512 số mỗi frame)
+        let response = await analyze({})
+
+        // 2. Face server chưa có embedding (404) hoặc là bản cũ chưa hỗ trợ student_id (422):
+        //    lấy từ DB (CACHED), lưu lên face server (PUT có ký) cho các frame sau rồi gửi kèm lần này
+        if (response.status === 404 || response.status === 422) {
+          const targetEmbedding = await getCachedEmbedding(adminClient, userId)
+
+          if (!targetEmbedding) {
+            return NextResponse.json({ 
+              error: "Chưa đăng ký khuôn mặt mẫu gốc. Vui lòng thiết lập đăng ký khuôn mặt trước." 
+            }, { status: 400 })
+          }
+          await writeFaceStore(cleanPythonServerUrl, "PUT", userId, targetEmbedding)
+          response = await analyze({ target_embedding: targetEmbedding })
+        }
 
         if (!response.ok) {
           const errData = await response.json().catch(() => ({}))
@@ -0,0 +1,115 @@
+import { createHmac, timingSafeEqual } from "crypto"
+import { NextRequest, NextResponse } from "next/server"
+import { createClient, createAdminClient } from "@/lib/supabase/server"
+
+// Phải trùng FACE_SESSION_SECRET của face_server.py
+const FACE_SESSION_SECRET = process.env.FACE_SESSION_SECRET || ""
+// log_token cũ hơn mức này bị từ chối (chống gửi lại)
+const LOG_TOKEN_MAX_AGE_SECONDS = 60
+
+interface VerdictLog {
+  studentId: string
+  isPresent: boolean
+  isVerified: boolean
+  confidence: number
+}
+
+/**
+ * Giải mã log_token của face server:
+ * "<student_id>.<present 0|1>.<verified 0|1>.<confidence>.<issued unix s>.<hex HMAC-SHA256>".
+ * Trả null nếu chữ ký sai hoặc token đã hết hạn.
+ */
+function parseLogToken(token: string): VerdictLog | null {
+  const parts = token.split(".")
+  if (parts.length < 7) return null
+  const signature = parts.pop()!
+  const payload = parts.join(".")
+  const [issued] = parts.slice(-1)
+  const [present, verified, confidenceInt, confidenceFrac] = parts.slice(-5, -1)
+  const studentId = parts.slice(0, -5).join(".")
+
+  const expected = createHmac("sha256", FACE_SESSION_SECRET).update(payload).digest("hex")
+  if (signature.length !== expected.length
+    || !timingSafeEqual(Buffer.from(signature), Buffer.from(expected))) {
+    return null
+  }
+  if (Math.abs(Date.now() / 1000 - Number(issued)) > LOG_TOKEN_MAX_AGE_SECONDS) return null
+
+  return {
+    studentId,
+    isPresent: present === "1",
+    isVerified: verified === "1",
+    confidence: Number(`${confidenceInt}.${confidenceFrac}`),
+  }
+}
+
+/**
+ * Ghi face_monitor_logs cho phiên giám sát streaming (/ws/monitor).
+ *
+ * Face server chỉ gửi log_token khi is_present/is_verified thay đổi, nên
+ * route này ghi log giống chế độ debounce của /api/monitor/analyze; khi vi
+ * phạm, client gửi kèm frame (image_base64) để lưu snapshot.
+ */
+export async function POST(request: NextRequest) {
+  try {
+    if (!FACE_SESSION_SECRET) {
+      return NextResponse.json({ error: "Chưa cấu hình giám sát streaming." }, { status: 503 })
+    }
+
+    const supabase = await createClient()
+    const { data: { user }, error: authError } = await supabase.auth.getUser()
+    if (authError || !user) {
+      return NextResponse.json({ error: "Chưa xác thực người dùng." }, { status: 401 })
+    }
+
+    const { log_token, image_base64 } = await request.json() as { log_token?: string; image_base64?: string }
+    const verdict = log_token ? parseLogToken(log_token) : null
+    if (!verdict || verdict.studentId !== user.id) {
+      return NextResponse.json({ error: "log_token không hợp lệ." }, { status: 403 })
+    }
+
+    // Upload snapshot chỉ khi vi phạm (vắng mặt hoặc sai danh tính)
+    let snapshotPath: string | null = null
+    if ((!verdict.isPresent || !verdict.isVerified) && image_base64) {
+      try {
+        const buffer = Buffer.from(image_base64.split(",").pop()!, "base64")
+        const fileName = `${user.id}/${Date.now()}.jpg`
+        const { data: uploadData, error: uploadError } = await supabase.storage
+          .from("student-snapshots")
+          .upload(fileName, buffer, {
+            contentType: "image/jpeg",
+            upsert: false
+          })
+        if (uploadData && !uploadError) {
+          const { data: { publicUrl } } = supabase.storage
+            .from("student-snapshots")
+            .getPublicUrl(fileName)
+          snapshotPath = publicUrl
+        }
+      } catch (storageErr) {
+        // Fault Tolerance: skip if storage not available
+      }
+    }
+
+    const adminClient = createAdminClient()
+    const { error: logError } = await adminClient
+      .from("face_monitor_logs")
+      .insert({
+        student_id: user.id,
+        is_present: verdict.isPresent,
+        is_verified: verdict.isVerified,
+        confidence: verdict.confidence,
+        snapshot_path: snapshotPath
+      })
+
+    if (logError) {
+      console.error("Lỗi ghi log giám sát khuôn mặt:", logError)
+      return NextResponse.json({ error: "Không thể ghi log giám sát." }, { status: 500 })
+    }
+
+    return NextResponse.json({ success: true })
+  } catch (error: any) {
+    console.error("Lỗi ghi log giám sát streaming:", error)
+    return NextResponse.json({ error: "Lỗi hệ thống nội bộ: " + error.message }, { status: 500 })
+  }
+}
@@ -0,0 +1,55 @@
+import { createHmac } from "crypto"
+import { NextResponse } from "next/server"
+import { createClient } from "@/lib/supabase/server"
+
+// URL công khai mà trình duyệt dùng để mở WebSocket tới face server (wss://.../ws/monitor).
+// Trỏ tới listener công khai (FACE_PUBLIC_PORT của face_server.py), chỉ phục vụ /ws/monitor
+// và /health; listener nội bộ (PYTHON_SERVER_URL, mọi route khác) không được mở ra ngoài.
+// Không suy ra từ PYTHON_SERVER_URL: địa chỉ nội bộ đó (127.0.0.1) là máy của trình duyệt.
+const FACE_WS_URL = process.env.FACE_WS_URL || ""
+// Phải trùng FACE_SESSION_SECRET của face_server.py (face server từ chối mọi phiên khi thiếu)
+const FACE_SESSION_SECRET = process.env.FACE_SESSION_SECRET || ""
+const SESSION_TOKEN_TTL_SECONDS = 300
+
+/**
+ * Mở phiên giám sát streaming: trả về URL WebSocket của face server kèm token
+ * ký HMAC cho học sinh đang đăng nhập. Token chỉ được kiểm tra lúc kết nối.
+ *
+ * Client gửi từng frame JPEG dạng binary qua WebSocket và nhận verdict trả về;
+ * verdict có log_token (khi trạng thái thay đổi) được chuyển tiếp tới
+ * /api/monitor/log để ghi face_monitor_logs. Khi socket đóng với mã 4404
+ * (face server chưa có embedding) thì gọi /api/monitor/analyze một lần để
+ * face server nạp embedding rồi mở lại phiên. Trả 503 khi chưa cấu hình
+ * FACE_WS_URL / FACE_SESSION_SECRET: client dùng /api/monitor/analyze.
+ */
+export async function POST() {
+  try {
+    if (!FACE_WS_URL || !FACE_SESSION_SECRET) {
+      return NextResponse.json({ error: "Chưa cấu hình giám sát streaming." }, { status: 503 })
+    }
+
+    const supabase = await createClient()
+    const { data: { user }, error: authError } = await supabase.auth.getUser()
+    if (authError || !user) {
+      return NextResponse.json({ error: "Chưa xác thực người dùng." }, { status: 401 })
+    }
+
+    const expiresAt = Math.floor(Date.now() / 1000) + SESSION_TOKEN_TTL_SECONDS
+    const signature = createHmac("sha256", FACE_SESSION_SECRET)
+      .update(`${user.id}.${expiresAt}`)
+      .digest("hex")
+    const params = new URLSearchParams({
+      student_id: user.id,
+      token: `${user.id}.${expiresAt}.${signature}`,
+    })
+
+    return NextResponse.json({
+      success: true,
+      url: `${FACE_WS_URL}?${params.toString()}`,
+      expires_at: expiresAt * 1000,
+    })
+  } catch (error: any) {
+    console.error("Lỗi tạo phiên giám sát streaming:", error)
+    return NextResponse.json({ error: "Lỗi hệ thống nội bộ: " + error.message }, { status: 500 })
+  }
+}
@@ -15,6 +15,10 @@ const ALLOWED_PATH_PREFIXES = [
 
 const MAX_BODY_BYTES = 25 * 1024 * 1024; // 25MB
 
+export const maxDuration = 60;
+/** Worker budget: the function limit minus time to relay the response */
+const WORKER_DEADLINE_MS = 55_000;
+
 function isAllowedPath(path: string): boolean {
   const normalized = path.replace(/^\/+/, "").toLowerCase();
   if (!normalized || normalized.includes("..") || normalized.includes("\\")) {
@@ -79,6 +83,15 @@ async function handleProxy(
     if (contentType) headers.set("content-type", contentType);
     const accept = request.headers.get("accept");
     if (accept) headers.set("accept", accept);
+    // Debug timings and W3C trace context pass through to the worker
+    for (const name of ["x-timings", "traceparent", "tracestate"]) {
+      const value = request.headers.get(name);
+      if (value) headers.set(name, value);
+    }
+    // Fair scheduling: one queue share per teacher; callers may only downgrade to bulk
+    headers.set("x-caller-id", user.id);
+    headers.set("x-priority", request.headers.get("x-priority") === "bulk" ? "bulk" : "interactive");
+    headers.set("x-deadline-ms", String(WORKER_DEADLINE_MS));
 
     let body: Blob | null = null;
     if (request.method !== "GET" && request.method !== "HEAD") {
@@ -93,6 +106,8 @@ async function handleProxy(
       headers,
       body,
       cache: "no-store",
+      // Client disconnects close the worker request, so it stops the extraction too
+      signal: AbortSignal.any([request.signal, AbortSignal.timeout(WORKER_DEADLINE_MS + 2_000)]),
     });
 
     const responseHeaders = new Headers(response.headers);
@@ -110,6 +125,9 @@ async function handleProxy(
       headers: responseHeaders,
     });
   } catch (error: unknown) {
+    if (error instanceof Error && error.name === "TimeoutError") {
+      return NextResponse.json({ error: "PDF Worker timed out" }, { status: 504 });
+    }
     const message = error instanceof Error ? error.message : "Unknown error";
     // Auth errors from requireAuth/requireRole
     if (message === "Unauthorized") {
@@ -364,7 +364,7 @@ export default function TakeExamPage() {
     <AntiCheatProvider enabled={antiCheatEnabled} onMaxViolations={() => handleSubmit(true)} onViolation={handleViolation} examId={examId} initialViolations={tabSwitchCount}>
       {!examStarted && antiCheatEnabled && <FullscreenPrompt onStart={() => setExamStarted(true)} />}
       {examStarted && <AntiCheatWarning />}
-      {examStarted && (exam.security_level ?? 1) >= 2 && <WebcamProctor enabled enableFaceDetection={(exam.security_level ?? 1) >= 4} onViolation={() => handleViolation("webcam_violation", tabSwitchCount + 1)} />}
+      {examStarted && (exam.security_level ?? 1) >= 2 && <WebcamProctor enabled enableFaceDetection={(exam.security_level ?? 1) >= 4} enableFaceVerification={(exam.security_level ?? 1) >= 4} onViolation={() => handleViolation("webcam_violation", tabSwitchCount + 1)} />}
       {examStarted && (exam.security_level ?? 1) >= 3 && <AudioProctor enabled onViolation={() => handleViolation("audio_violation", tabSwitchCount + 1)} />}
       
       <StudentShell className={cn("bg-[#0B0A13] text-[#F1EDF9]", inter.className)}>
@@ -3,11 +3,14 @@
 import { useEffect, useRef, useState, useCallback } from "react"
 import { Camera, CameraOff, AlertTriangle, UserCheck, Users, UserX } from "lucide-react"
 import { cn } from "@/lib/utils"
+import { useFaceMonitorStream, type FaceVerdict } from "@/hooks/useFaceMonitorStream"
 
 interface WebcamProctorProps {
     enabled: boolean
     enableFaceDetection?: boolean
-    onViolation?: (type: "no_face" | "multiple_faces", message: string) => void
+    /** Đối chiếu danh tính với khuôn mặt đã đăng ký qua face server (streaming) */
+    enableFaceVerification?: boolean
+    onViolation?: (type: "no_face" | "multiple_faces" | "unverified_face", message: string) => void
     snapshotIntervalMs?: number
     onSnapshot?: (blob: Blob) => void
 }
@@ -27,6 +30,7 @@ interface WebcamProctorProps {
 export function WebcamProctor({
     enabled,
     enableFaceDetection = false,
+    enableFaceVerification = false,
     onViolation,
     snapshotIntervalMs = 30000,
     onSnapshot
@@ -85,6 +89,19 @@ export function WebcamProctor({
         return () => stopCamera()
     }, [enabled, startCamera, stopCamera])
 
+    // Identity verification over the face server's WebSocket session
+    const verificationCooldownRef = useRef(false)
+    const handleVerdict = useCallback((verdict: FaceVerdict) => {
+        if (!verdict.is_present || verdict.is_verified || verificationCooldownRef.current) return
+        verificationCooldownRef.current = true
+        onViolation?.("unverified_face", "⚠️ Khuôn mặt trước camera không khớp với khuôn mặt đã đăng ký!")
+        setTimeout(() => { verificationCooldownRef.current = false }, VIOLATION_COOLDOWN)
+    }, [onViolation])
+    const { status: verificationStatus, verdict } = useFaceMonitorStream(
+        videoRef, canvasRef, cameraActive && enableFaceVerification, handleVerdict
+    )
+    const identityMismatch = verificationStatus === "streaming" && !!verdict?.is_present && !verdict.is_verified
+
     // Initialize FaceDetector if available
     useEffect(() => {
         if (!enableFaceDetection) return
@@ -268,6 +285,14 @@ export function WebcamProctor({
                         </div>
                     )}
 
+                    {/* Identity mismatch overlay */}
+                    {identityMismatch && (
+                        <div className="absolute inset-x-0 bottom-0 bg-red-900/80 px-2 py-1 flex items-center gap-1">
+                            <AlertTriangle className="w-3 h-3 text-red-200" />
+                            <span className="text-[10px] text-red-100">Sai danh tính</span>
+                        </div>
+                    )}
+
                     {/* Recording indicator */}
                     {cameraActive && (
                         <div className="absolute top-2 left-2 flex items-center gap-1.5">
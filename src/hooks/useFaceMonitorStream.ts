@@ -0,0 +1,183 @@
+"use client";
+
+import { useEffect, useRef, useState } from "react";
+
+export interface FaceVerdict {
+  is_present: boolean;
+  is_verified: boolean;
+  cosine_distance: number;
+  seq: number;
+}
+
+type StreamStatus = "idle" | "connecting" | "streaming" | "unavailable";
+
+// Mã đóng của face server (/ws/monitor)
+const CLOSE_BAD_TOKEN = 4401;
+const CLOSE_DISABLED = 4403;
+const CLOSE_NOT_REGISTERED = 4404;
+const RECONNECT_DELAY_MS = 5000;
+// Giữ vài frame gần nhất để gửi đúng snapshot của verdict vi phạm
+const KEPT_FRAMES = 5;
+
+function captureFrame(video: HTMLVideoElement, canvas: HTMLCanvasElement): string | null {
+  if (video.readyState < 2) return null;
+  const ctx = canvas.getContext("2d");
+  if (!ctx) return null;
+  canvas.width = 320;
+  canvas.height = 240;
+  ctx.drawImage(video, 0, 0, 320, 240);
+  return canvas.toDataURL("image/jpeg", 0.7);
+}
+
+function dataUrlToBytes(dataUrl: string): Uint8Array {
+  const binary = atob(dataUrl.split(",")[1]);
+  const bytes = new Uint8Array(binary.length);
+  for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+  return bytes;
+}
+
+/**
+ * Hook giám sát khuôn mặt liên tục qua WebSocket của face server.
+ * Mở phiên bằng /api/monitor/session, gửi frame JPEG từ video mỗi intervalMs
+ * và nhận verdict; verdict có log_token được chuyển tới /api/monitor/log để
+ * ghi face_monitor_logs (kèm snapshot khi vi phạm). Khi face server chưa có
+ * embedding (4404), gọi /api/monitor/analyze một lần rồi mở lại phiên.
+ * Không có streaming (503, 4401, 4403) thì dừng với status "unavailable".
+ *
+ * @param videoRef - Video camera đang phát.
+ * @param canvasRef - Canvas ẩn dùng để chụp frame.
+ * @param enabled - Bật/tắt phiên giám sát.
+ * @param onVerdict - Callback nhận từng verdict.
+ * @param intervalMs - Khoảng cách giữa hai frame gửi đi.
+ * @returns Trạng thái phiên và verdict gần nhất.
+ * @example
+ * const { status, verdict } = useFaceMonitorStream(videoRef, canvasRef, cameraActive);
+ */
+export function useFaceMonitorStream(
+  videoRef: React.RefObject<HTMLVideoElement | null>,
+  canvasRef: React.RefObject<HTMLCanvasElement | null>,
+  enabled: boolean,
+  onVerdict?: (verdict: FaceVerdict) => void,
+  intervalMs = 1000
+) {
+  const [status, setStatus] = useState<StreamStatus>("idle");
+  const [verdict, setVerdict] = useState<FaceVerdict | null>(null);
+  const onVerdictRef = useRef(onVerdict);
+  onVerdictRef.current = onVerdict;
+
+  useEffect(() => {
+    if (!enabled) return;
+
+    let socket: WebSocket | null = null;
+    let sendTimer: ReturnType<typeof setInterval> | null = null;
+    let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+    let stopped = false;
+    let seeded = false;
+    let sent = 0;
+    const frames = new Map<number, string>();
+
+    const grabFrame = () =>
+      videoRef.current && canvasRef.current ? captureFrame(videoRef.current, canvasRef.current) : null;
+
+    const stopSending = () => {
+      if (sendTimer) clearInterval(sendTimer);
+      sendTimer = null;
+    };
+
+    const relayLog = (logToken: string, frame?: string) => {
+      fetch("/api/monitor/log", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ log_token: logToken, image_base64: frame }),
+      }).catch(() => {
+        // Fault Tolerance: log bị bỏ qua nếu mất mạng
+      });
+    };
+
+    // Face server chưa có embedding: nạp qua /api/monitor/analyze (lấy từ DB) một lần
+    const seedEmbedding = async () => {
+      const frame = grabFrame();
+      if (!frame) return false;
+      const res = await fetch("/api/monitor/analyze", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ image_base64: frame, type: "analyze" }),
+      }).catch(() => null);
+      return !!res?.ok;
+    };
+
+    const connect = async () => {
+      if (stopped) return;
+      setStatus("connecting");
+      const res = await fetch("/api/monitor/session", { method: "POST" }).catch(() => null);
+      if (stopped) return;
+      if (!res?.ok) {
+        setStatus("unavailable");
+        return;
+      }
+      const { url } = await res.json();
+      socket = new WebSocket(url);
+      socket.binaryType = "arraybuffer";
+
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === "ready") {
+          setStatus("streaming");
+          sendTimer = setInterval(() => {
+            const frame = grabFrame();
+            if (!frame || socket?.readyState !== WebSocket.OPEN) return;
+            sent += 1;
+            frames.set(sent, frame);
+            frames.delete(sent - KEPT_FRAMES);
+            socket.send(dataUrlToBytes(frame));
+          }, intervalMs);
+        } else if (message.type === "verdict") {
+          const next: FaceVerdict = {
+            is_present: message.is_present,
+            is_verified: message.is_verified,
+            cosine_distance: message.cosine_distance,
+            seq: message.seq,
+          };
+          setVerdict(next);
+          onVerdictRef.current?.(next);
+          if (message.log_token) {
+            const violation = !message.is_present || !message.is_verified;
+            relayLog(message.log_token, violation ? frames.get(message.seq) : undefined);
+          }
+        }
+      };
+
+      socket.onclose = async (event) => {
+        stopSending();
+        socket = null;
+        if (stopped) return;
+        if (event.code === CLOSE_BAD_TOKEN || event.code === CLOSE_DISABLED) {
+          setStatus("unavailable");
+          return;
+        }
+        if (event.code === CLOSE_NOT_REGISTERED) {
+          if (seeded || !(await seedEmbedding())) {
+            setStatus("unavailable");
+            return;
+          }
+          seeded = true;
+          connect();
+          return;
+        }
+        reconnectTimer = setTimeout(connect, RECONNECT_DELAY_MS);
+      };
+    };
+
+    connect();
+
+    return () => {
+      stopped = true;
+      stopSending();
+      if (reconnectTimer) clearTimeout(reconnectTimer);
+      socket?.close();
+      setStatus("idle");
+    };
+  }, [enabled, intervalMs, videoRef, canvasRef]);
+
+  return { status, verdict };
+}
@@ -0,0 +1,252 @@
+"""
+Admission control and fair scheduling for the PDF worker.
+
+Each endpoint class (text, vision, bank) has a cap on extractions in flight
+and a short bounded wait queue. When both are full, or a queued request waits
+longer than the queue timeout, the request is rejected straight away with
+503 + Retry-After instead of piling onto pdfplumber and Gemini until the
+instance runs out of memory or every upstream call times out.
+
+- text:   answer-key and parse endpoints (pdfplumber + one AI text call)
+- vision: rasterize + vision model step inside an extraction
+- bank:   question-bank imports (long AI calls, large outputs)
+
+Queued jobs are ordered by weighted fair queuing across callers (X-Caller-Id
+from the Next.js proxy, else the client address). Every job admitted or
+queued (not one rejected) advances the caller's virtual finish tag by
+1/weight, where the weight comes from the priority class (X-Priority:
+interactive | bulk), so one teacher importing 50 PDFs queues behind
+everyone else's next upload instead of in front of it.
+Bulk jobs also may not take the last ADMISSION_INTERACTIVE_RESERVED slots of a
+class, so an interactive upload never waits for a long import to finish.
+
+A nested admit (vision inside a text or bank slot) passes wait=False: it runs
+only if a slot is free right now, so a request never sits on one class's slot
+while queueing for another.
+
+Config (env): ADMISSION_TEXT_LIMIT, ADMISSION_VISION_LIMIT, ADMISSION_BANK_LIMIT,
+ADMISSION_QUEUE_SIZE (per class), ADMISSION_QUEUE_TIMEOUT and
+ADMISSION_RETRY_AFTER (seconds), ADMISSION_INTERACTIVE_WEIGHT,
+ADMISSION_INTERACTIVE_RESERVED.
+"""
+
+import os
+import time
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS
+
+ADMISSION_LIMITS = {
+    "text": int(os.getenv("ADMISSION_TEXT_LIMIT", "4")),
+    "vision": int(os.getenv("ADMISSION_VISION_LIMIT", "2")),
+    "bank": int(os.getenv("ADMISSION_BANK_LIMIT", "2")),
+}
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "8"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITY_WEIGHTS = {
+    INTERACTIVE: float(os.getenv("ADMISSION_INTERACTIVE_WEIGHT", "8")),
+    BULK: 1.0,
+}
+ADMISSION_INTERACTIVE_RESERVED = int(os.getenv("ADMISSION_INTERACTIVE_RESERVED", "1"))
+# Priority when the caller does not say: bank imports are bulk work
+DEFAULT_PRIORITY = {"text": INTERACTIVE, "vision": INTERACTIVE, "bank": BULK}
+
+# (caller, priority) of the admitted request, so nested admits (vision inside
+# an extraction) are scheduled for the same caller
+_current_job: ContextVar[tuple] = ContextVar("admission_job", default=("", None))
+
+
+def resolve_priority(job_class: str, requested: str = None) -> str:
+    """Requested priority if valid, else the current request's, else the class default."""
+    if requested in PRIORITY_WEIGHTS:
+        return requested
+    return _current_job.get()[1] or DEFAULT_PRIORITY.get(job_class, INTERACTIVE)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a class is at capacity and its queue is full or timed out."""
+
+    def __init__(self, job_class: str, reason: str, retry_after: int):
+        super().__init__(f"{job_class} at capacity ({reason})")
+        self.job_class = job_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("tag", "seq", "start_tag", "priority", "future")
+
+    def __init__(self, tag, seq, start_tag, priority, future):
+        self.tag = tag
+        self.seq = seq
+        self.start_tag = start_tag
+        self.priority = priority
+        self.future = future
+
+
+class AdmissionLimiter:
+    """In-flight cap plus a bounded weighted-fair wait queue for one job class."""
+
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout: float,
+                 reserved: int = ADMISSION_INTERACTIVE_RESERVED):
+        self.name = name
+        self.limit = limit
+        self.bulk_limit = max(1, limit - reserved)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.bulk_in_flight = 0
+        self._waiters = []
+        self._virtual_time = 0.0
+        self._finish_tags = {}
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _update_gauges(self):
+        ADMISSION_IN_FLIGHT.labels(job_class=self.name).set(self.in_flight)
+        ADMISSION_QUEUE_DEPTH.labels(job_class=self.name).set(len(self._waiters))
+
+    def _can_run(self, priority: str) -> bool:
+        if self.in_flight >= self.limit:
+            return False
+        return priority != BULK or self.bulk_in_flight < self.bulk_limit
+
+    def _take_slot(self, priority: str, start_tag: float):
+        self.in_flight += 1
+        if priority == BULK:
+            self.bulk_in_flight += 1
+        self._virtual_time = max(self._virtual_time, start_tag)
+
+    def _tag(self, caller: str, priority: str) -> tuple:
+        """WFQ (start, finish) tags for one more job from caller (not yet charged)."""
+        start_tag = max(self._virtual_time, self._finish_tags.get(caller, 0.0))
+        return start_tag, start_tag + 1.0 / PRIORITY_WEIGHTS[priority]
+
+    def _charge(self, caller: str, finish_tag: float):
+        """Advance caller's finish tag for a job admitted or queued (never for a rejection)."""
+        self._finish_tags[caller] = finish_tag
+        if len(self._finish_tags) > 1000:
+            self._finish_tags = {c: t for c, t in self._finish_tags.items() if t > self._virtual_time}
+
+    async def acquire(self, caller: str = "", priority: str = INTERACTIVE, wait: bool = True):
+        """Take a slot, waiting in the queue if needed (and wait); raise AdmissionRejected."""
+        start_tag, finish_tag = self._tag(caller, priority)
+        # Waiters still queued cannot use a free slot (release() dispatches),
+        # so a job that fits runs now
+        if self._can_run(priority):
+            self._charge(caller, finish_tag)
+            self._take_slot(priority, start_tag)
+            self._update_gauges()
+            return
+
+        if not wait:
+            self._reject("busy", priority)
+        if len(self._waiters) >= self.queue_size:
+            self._reject("queue_full", priority)
+
+        self._charge(caller, finish_tag)
+        waiter = _Waiter(finish_tag, next(self._seq), start_tag, priority,
+                         asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._update_gauges()
+        start = time.perf_counter()
+        try:
+            # _dispatch() takes the slot for the waiter before resolving it
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if self._withdraw(waiter):
+                self._reject("queue_timeout", priority)
+        except asyncio.CancelledError:
+            if not self._withdraw(waiter):
+                self.release(priority)
+            raise
+        finally:
+            self._update_gauges()
+            ADMISSION_WAIT_SECONDS.labels(job_class=self.name, priority=priority).observe(time.perf_counter() - start)
+
+    def _withdraw(self, waiter: _Waiter) -> bool:
+        """Remove a waiter that gave up; False if it was already granted a slot."""
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+            return True
+        return False
+
+    def release(self, priority: str = INTERACTIVE):
+        self.in_flight -= 1
+        if priority == BULK:
+            self.bulk_in_flight -= 1
+        self._dispatch()
+        self._update_gauges()
+
+    def _dispatch(self):
+        """Grant free slots to the eligible waiters with the smallest finish tags."""
+        while self._waiters:
+            eligible = [w for w in self._waiters if self._can_run(w.priority)]
+            if not eligible:
+                return
+            waiter = min(eligible, key=lambda w: (w.tag, w.seq))
+            self._waiters.remove(waiter)
+            self._take_slot(waiter.priority, waiter.start_tag)
+            waiter.future.set_result(True)
+
+    def _reject(self, reason: str, priority: str):
+        ADMISSION_REJECTIONS.labels(job_class=self.name, reason=reason, priority=priority).inc()
+        raise AdmissionRejected(self.name, reason, ADMISSION_RETRY_AFTER)
+
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "bulk_in_flight": self.bulk_in_flight,
+            "limit": self.limit,
+            "queued": len(self._waiters),
+        }
+
+
+class AdmissionController:
+    """One AdmissionLimiter per job class."""
+
+    def __init__(self, limits: dict = None, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+                 reserved: int = ADMISSION_INTERACTIVE_RESERVED):
+        limits = limits or ADMISSION_LIMITS
+        self.limiters = {
+            name: AdmissionLimiter(name, limit, queue_size, queue_timeout, reserved)
+            for name, limit in limits.items()
+        }
+
+    @asynccontextmanager
+    async def admit(self, job_class: str, caller: str = None, priority: str = None, wait: bool = True):
+        """
+        Hold a slot of job_class for the enclosed block. caller and priority
+        default to those of the request already admitted in this context,
+        then to the class default. wait=False rejects at once instead of
+        queueing when no slot is free.
+        """
+        if caller is None:
+            caller = _current_job.get()[0]
+        priority = resolve_priority(job_class, priority)
+
+        limiter = self.limiters[job_class]
+        await limiter.acquire(caller, priority, wait)
+        token = _current_job.set((caller, priority))
+        try:
+            yield priority
+        finally:
+            _current_job.reset(token)
+            limiter.release(priority)
+
+    def snapshot(self) -> dict:
+        return {name: limiter.snapshot() for name, limiter in self.limiters.items()}
+
+
+admission = AdmissionController()
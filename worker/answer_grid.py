@@ -0,0 +1,474 @@
+"""
+Layout-aware answer-key extraction from pdfplumber word coordinates.
+
+Many answer keys are printed as tables: a row of question numbers with the
+answers in the row (or rows) below. pdfplumber's flattened text loses the
+column alignment, so here the grid is rebuilt geometrically instead:
+- Words are grouped into rows by their vertical position
+- A row of increasing question numbers defines the columns
+- The next row's words are assigned to the nearest column
+
+Supported cells:
+- Multiple choice: "A" / "b"
+- True/False: "ĐSĐS", "Đ-S-Đ-S", "Đ S Đ S" in one cell, or one row per
+  sub-question labelled a) b) c) d)
+- Short answer: "2,5", "-1", "2024"
+
+Multi-variant keys (mã đề 101, 102, ...) printed in one combined table are
+decoded the same way, with the variant codes as either the columns or the
+leading cell of each row.
+
+Keys split into parts (Phần I multiple choice, Phần II true/false, Phần III
+short answer) often restart numbering at 1 in every part. A "Phần"/"Part"
+heading or a question number that goes backwards starts a new part, and a
+restarted part is numbered on from the previous ones (Phần II câu 1 after
+12 multiple-choice questions is question 13), as in the AI extraction.
+"""
+
+import re
+from statistics import median
+from typing import Optional
+
+from pdf_parser import build_flat_answers, parse_short_answer
+
+# =========================================
+# Configuration
+# =========================================
+
+# Uppercase headings only: "chọn đáp án đúng" appears in question text on
+# every page, the printed key heading is almost always in capitals.
+_KEY_HEADING_RE = re.compile(r'ĐÁP\s*ÁN|DAP\s*AN|HƯỚNG\s*DẪN\s*CHẤM|ANSWER\s*KEY')
+
+MAX_QUESTION = 100          # Larger numbers are variant codes or scores, not questions
+MIN_COLUMNS = 3             # A question row needs at least this many numbers
+MIN_DECODED = 4             # Fewer answers than this is not worth trusting
+MIN_COVERAGE = 0.9          # Share of seen question numbers that must decode
+MIN_VARIANTS = 2            # A combined table lists at least two mã đề
+
+# =========================================
+# Cell patterns
+# =========================================
+
+_QNUM_RE = re.compile(r'^(\d{1,3})[.):]?$')
+_QLABEL_RE = re.compile(r'^(?:Câu|Cau|Question|Q)[.:]?$', re.IGNORECASE)
+_SUB_LABEL_RE = re.compile(r'^([a-dA-D])[).:]?$')
+_VARIANT_CODE_RE = re.compile(r'^\d{3,4}$')
+_VARIANT_LABEL_RE = re.compile(r'mã|đề|ma\s*de|\\', re.IGNORECASE)
+_PART_HEADING_RE = re.compile(r'^(?:Phần|PHẦN|Phan|PHAN|Part|PART)\b')
+# Row label of a variant-column table: "1", "Câu 1", "13a", "13.a)", "13 a"
+_ROW_QUESTION_RE = re.compile(r'^(?:Câu|Cau)?(\d{1,3})[.)]?(?:([a-dA-D])[).]?)?$', re.IGNORECASE)
+
+_MC_CELL_RE = re.compile(r'^[A-Da-d]$')
+_TF_CELL_RE = re.compile(r'^[ĐđᎠDdSs]{4}$')
+_TF_MARK_RE = re.compile(r'^[ĐđᎠDdSs]$')
+_TF_SEPARATORS_RE = re.compile(r'[\s\-–,;/.|]')
+_SA_CELL_RE = re.compile(r'^[-+]?\d+(?:[.,]\d+)?$')
+
+_TF_TRUE = frozenset('ĐđᎠDd')
+
+
+def find_answer_pages(page_texts: list) -> list:
+    """
+    Indexes of the pages that hold the answer key: from the last page with a
+    key heading to the end, or just the last page when there is no heading.
+    """
+    if not page_texts:
+        return []
+    start = len(page_texts) - 1
+    for i in range(len(page_texts) - 1, -1, -1):
+        if page_texts[i] and _KEY_HEADING_RE.search(page_texts[i]):
+            start = i
+            break
+    return list(range(start, len(page_texts)))
+
+
+def extract_answer_grid(pages: list) -> Optional[dict]:
+    """
+    Decode table-format answer keys from pdfplumber pages.
+
+    Returns the same shape as extract_answer_key plus "coverage" (share of
+    question numbers that decoded) and "confident", or None if no grid found.
+    """
+    rows = []
+    for page in pages:
+        rows.extend(group_rows(page.extract_words()))
+
+    mc = {}
+    tf = {}
+    tf_parts = {}
+    sa = {}
+    numbering = _PartNumbering()
+    parts = []      # question numbers seen, one set per part
+
+    columns = None
+    answered = False
+    for row in rows:
+        if _is_part_heading(row):
+            numbering.heading()
+            columns = None
+            continue
+        if columns and not answered and _decode_answer_row(row, columns, mc, tf, sa):
+            answered = True
+            continue
+        question_columns = _question_columns(row)
+        if question_columns:
+            if numbering.start(question_columns[0][0], repeat=False) or not parts:
+                parts.append(set())
+            columns = [(numbering.number(q), x) for q, x in question_columns]
+            answered = False
+            parts[-1].update(q for q, _ in columns)
+            continue
+        if columns and _decode_sub_row(row, columns, tf_parts):
+            answered = True
+
+    if not parts:
+        return None
+
+    _merge_tf_parts(tf, tf_parts)
+    answered_questions = set(mc) | set(tf) | set(sa)
+    # Per part, and only questions of the part count, so coverage never exceeds 1
+    decoded = [len(seen & answered_questions) for seen in parts]
+    coverage = sum(decoded) / sum(len(seen) for seen in parts)
+    part_coverage = min(count / len(seen) for count, seen in zip(decoded, parts))
+
+    result = _build_key(mc, tf, sa)
+    result["answers"] = build_flat_answers(
+        result["multiple_choice"], result["true_false"], result["short_answer"]
+    )
+    result.update({
+        "coverage": round(coverage, 3),
+        "confident": (sum(decoded) >= MIN_DECODED and coverage >= MIN_COVERAGE
+                      and part_coverage >= MIN_COVERAGE),
+    })
+    return result
+
+
+def extract_variant_grid(pages: list) -> Optional[dict]:
+    """
+    Decode a combined multi-variant answer table from pdfplumber pages.
+
+    Handles both layouts:
+    - Variants as columns: a "Câu | 101 | 102 ..." header, then one row per
+      question ("1", "13a") with each variant's answer in its column
+    - Variants as rows: a "Mã đề | 1 | 2 ..." header of question numbers,
+      then one row per variant starting with its code
+
+    Returns {"variants": {code: key}, "variant_count", "coverage",
+    "confident"} where each key has multiple_choice / true_false /
+    short_answer and coverage is the lowest share of question numbers
+    decoded for a variant, or None if no variant table is found.
+    """
+    rows = []
+    for page in pages:
+        rows.extend(group_rows(page.extract_words()))
+
+    variants = {}
+    numbering = _PartNumbering()
+    seen = set()
+    variant_columns = None
+    question_columns = None
+    for row in rows:
+        if _is_part_heading(row):
+            numbering.heading()
+            continue
+        # Inside a table, data rows win over header detection: a row of
+        # increasing short answers must not start a new table
+        if variant_columns and _decode_question_row(row, variant_columns, variants, numbering, seen):
+            continue
+        if question_columns and _decode_variant_row(row, question_columns, variants):
+            continue
+        header = _variant_columns(row)
+        if header:
+            variant_columns, question_columns = header, None
+            continue
+        header = _question_columns(row, allow_variant_label=True)
+        if header:
+            numbering.start(header[0][0], repeat=False)
+            question_columns = [(numbering.number(q), x) for q, x in header]
+            variant_columns = None
+            seen.update(q for q, _ in question_columns)
+
+    if not variants:
+        return None
+
+    keys = {}
+    coverages = []
+    for code, parts in variants.items():
+        _merge_tf_parts(parts["tf"], parts["tf_parts"])
+        keys[code] = _build_key(parts["mc"], parts["tf"], parts["sa"])
+        decoded = seen & (set(parts["mc"]) | set(parts["tf"]) | set(parts["sa"]))
+        coverages.append((len(decoded), len(decoded) / len(seen) if seen else 0.0))
+
+    coverage = min(share for _, share in coverages)
+    return {
+        "variants": keys,
+        "variant_count": len(keys),
+        "coverage": round(coverage, 3),
+        "confident": (len(keys) >= MIN_VARIANTS and min(count for count, _ in coverages) >= MIN_DECODED
+                      and coverage >= MIN_COVERAGE),
+    }
+
+
+# =========================================
+# Key assembly
+# =========================================
+
+def _classify_cell(cell: str) -> Optional[tuple]:
+    """Return ("mc" | "tf" | "sa", value) for a cell that looks like an answer."""
+    if _MC_CELL_RE.match(cell):
+        return "mc", cell.upper()
+    marks = _TF_SEPARATORS_RE.sub('', cell)
+    if _TF_CELL_RE.match(marks):
+        return "tf", {k: m in _TF_TRUE for k, m in zip('abcd', marks)}
+    if _SA_CELL_RE.match(cell):
+        return "sa", parse_short_answer(cell)
+    return None
+
+
+def _decode_question_row(row: list, variant_columns: list, variants: dict,
+                         numbering: "_PartNumbering", seen: set) -> bool:
+    """Read a "13a | Đ | S | ..." row of a table with one column per mã đề."""
+    cells, leading = _assign_cells(row, variant_columns)
+    label = _ROW_QUESTION_RE.match(''.join(w["text"] for w in leading))
+    if not cells or not label:
+        return False
+    # Sub-question rows repeat their question number
+    numbering.start(int(label.group(1)), repeat=True)
+    q = numbering.number(int(label.group(1)))
+    if 1 <= q <= MAX_QUESTION:
+        seen.add(q)
+    sub = label.group(2).lower() if label.group(2) else None
+    for code, cell in cells.items():
+        _store_variant_cell(variants, code, q, sub, cell)
+    return True
+
+
+def _decode_variant_row(row: list, question_columns: list, variants: dict) -> bool:
+    """Read a "101 | A | B | ..." row of a table with one column per question."""
+    cells, leading = _assign_cells(row, question_columns)
+    if not cells or len(leading) != 1 or not _VARIANT_CODE_RE.match(leading[0]["text"]):
+        return False
+    code = leading[0]["text"]
+    for q, cell in cells.items():
+        _store_variant_cell(variants, code, q, None, cell)
+    return True
+
+
+def _store_variant_cell(variants: dict, code: str, q: int, sub: Optional[str], cell: str):
+    """Record one decoded cell for a variant; the first value per slot wins."""
+    if not 1 <= q <= MAX_QUESTION:
+        return
+    parts = variants.setdefault(code, {"mc": {}, "tf": {}, "tf_parts": {}, "sa": {}})
+    if sub:
+        if _TF_MARK_RE.match(cell):
+            parts["tf_parts"].setdefault(q, {}).setdefault(sub, cell in _TF_TRUE)
+        return
+    decoded = _classify_cell(cell)
+    if decoded:
+        kind, value = decoded
+        parts[kind].setdefault(q, value)
+
+
+def _merge_tf_parts(tf: dict, tf_parts: dict):
+    """Turn complete a)-d) sub-rows into T/F answers."""
+    for q, parts in tf_parts.items():
+        if q not in tf and len(parts) == 4:
+            tf[q] = {k: parts[k] for k in ('a', 'b', 'c', 'd')}
+
+
+def _build_key(mc: dict, tf: dict, sa: dict) -> dict:
+    """Lay out {question: answer} maps as extract_answer_key's lists."""
+    multiple_choice = []
+    if mc:
+        multiple_choice = [None] * max(mc)
+        for q, letter in mc.items():
+            multiple_choice[q - 1] = letter
+    return {
+        "multiple_choice": multiple_choice,
+        "true_false": [{"question": q, "answers": tf[q]} for q in sorted(tf)],
+        "short_answer": [{"question": q, "answer": sa[q]} for q in sorted(sa)],
+    }
+
+
+# =========================================
+# Part numbering
+# =========================================
+
+class _PartNumbering:
+    """
+    Map printed question numbers to key numbers across parts. A part starts
+    on a heading or when numbering goes backwards; a part that restarts is
+    numbered on from the highest question so far.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.last = 0       # last printed number in the current part
+        self.top = 0        # highest key number so far
+        self.pending = False
+
+    def heading(self):
+        if self.top:
+            self.pending = True
+
+    def start(self, q: int, repeat: bool) -> bool:
+        """
+        Note the first printed number of a header or row; True if it starts
+        a new part. repeat: the same number may continue the part.
+        """
+        restarted = q < self.last if repeat else q <= self.last
+        if not (self.pending or restarted):
+            return False
+        self.offset = self.top if q <= self.top else 0
+        self.last = 0
+        self.pending = False
+        return True
+
+    def number(self, q: int) -> int:
+        self.last = q
+        self.top = max(self.top, q + self.offset)
+        return q + self.offset
+
+
+def _is_part_heading(row: list) -> bool:
+    return bool(row) and bool(_PART_HEADING_RE.match(row[0]["text"]))
+
+
+# =========================================
+# Geometry helpers
+# =========================================
+
+def _center(word: dict) -> float:
+    return (word["x0"] + word["x1"]) / 2
+
+
+def group_rows(words: list) -> list:
+    """Group pdfplumber words into rows (top to bottom, each left to right)."""
+    if not words:
+        return []
+    tolerance = median(w["bottom"] - w["top"] for w in words) / 2
+
+    rows = []
+    row_mid = None
+    for word in sorted(words, key=lambda w: (w["top"], w["x0"])):
+        mid = (word["top"] + word["bottom"]) / 2
+        if rows and abs(mid - row_mid) <= tolerance:
+            rows[-1].append(word)
+        else:
+            rows.append([word])
+            row_mid = mid
+    for row in rows:
+        row.sort(key=lambda w: w["x0"])
+    return rows
+
+
+def _question_columns(row: list, allow_variant_label: bool = False) -> Optional[list]:
+    """
+    Return [(question, x_center)] if the row is a run of increasing question
+    numbers. Words before the first number ("Câu", "Câu hỏi") are a label;
+    "Câu" may also repeat in front of every number. A "Mã đề" label marks
+    the header of a multi-variant table, which is only accepted on request.
+    """
+    columns = []
+    for word in row:
+        match = _QNUM_RE.match(word["text"])
+        if match:
+            columns.append((int(match.group(1)), _center(word)))
+        elif columns and not _QLABEL_RE.match(word["text"]):
+            return None
+        elif not columns and not allow_variant_label and _VARIANT_LABEL_RE.search(word["text"]):
+            return None
+
+    if len(columns) < MIN_COLUMNS:
+        return None
+    numbers = [q for q, _ in columns]
+    if numbers[0] < 1 or numbers[-1] > MAX_QUESTION:
+        return None
+    if any(b <= a for a, b in zip(numbers, numbers[1:])):
+        return None
+    return columns
+
+
+def _variant_columns(row: list) -> Optional[list]:
+    """
+    Return [(code, x_center)] if the row is a header of distinct mã đề codes
+    ("Câu\\Mã đề 101 102 103"). Numeric words before the codes mean this is
+    a data row of 3-4 digit short answers, not a header.
+    """
+    columns = []
+    for word in row:
+        text = word["text"]
+        if _VARIANT_CODE_RE.match(text):
+            columns.append((text, _center(word)))
+        elif columns and not _VARIANT_LABEL_RE.search(text):
+            return None
+        elif not columns and any(ch.isdigit() for ch in text):
+            return None
+
+    codes = [code for code, _ in columns]
+    if len(codes) < MIN_VARIANTS or len(set(codes)) != len(codes):
+        return None
+    return columns
+
+
+def _assign_cells(row: list, columns: list) -> tuple:
+    """
+    Assign each word to the nearest column within half a column gap.
+    Returns ({column key: cell text}, words left of the grid).
+    """
+    centers = [x for _, x in columns]
+    half_gap = median(b - a for a, b in zip(centers, centers[1:])) / 2
+
+    cells = {}
+    leading = []
+    for word in row:
+        x = _center(word)
+        nearest = min(range(len(columns)), key=lambda i: abs(centers[i] - x))
+        if abs(centers[nearest] - x) <= half_gap:
+            q = columns[nearest][0]
+            cells[q] = cells.get(q, "") + word["text"]
+        elif x < centers[0]:
+            leading.append(word)
+    return cells, leading
+
+
+def _decode_answer_row(row: list, columns: list, mc: dict, tf: dict, sa: dict) -> bool:
+    """
+    Read one answer per column. The row only counts if most of its cells
+    look like answers, so a stray row of text is not taken for a key.
+    """
+    cells, leading = _assign_cells(row, columns)
+    if not cells or (leading and _SUB_LABEL_RE.match(leading[0]["text"])):
+        return False
+
+    decoded = {}
+    for q, cell in cells.items():
+        value = _classify_cell(cell)
+        if value:
+            decoded[q] = value
+
+    if len(decoded) * 2 < len(cells):
+        return False
+
+    for q, (kind, value) in decoded.items():
+        target = mc if kind == "mc" else tf if kind == "tf" else sa
+        target.setdefault(q, value)
+    return True
+
+
+def _decode_sub_row(row: list, columns: list, tf_parts: dict) -> bool:
+    """Read an "a) Đ S Đ S" row of a T/F table with one row per sub-question."""
+    cells, leading = _assign_cells(row, columns)
+    if not cells or not leading:
+        return False
+    label = _SUB_LABEL_RE.match(leading[0]["text"])
+    if not label:
+        return False
+    marks = {q: cell for q, cell in cells.items() if _TF_MARK_RE.match(cell)}
+    if len(marks) * 2 < len(cells):
+        return False
+
+    key = label.group(1).lower()
+    for q, mark in marks.items():
+        tf_parts.setdefault(q, {}).setdefault(key, mark in _TF_TRUE)
+    return True
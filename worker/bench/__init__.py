@@ -0,0 +1 @@
+"""Offline benchmark suite for the PDF worker (see run_bench.py)."""
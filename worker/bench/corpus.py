@@ -0,0 +1,264 @@
+"""
+Synthetic Vietnamese exam PDFs for benchmarking the worker.
+
+Each exam has question pages (MC options, Đúng/Sai items, short-answer
+prompts and data tables) followed by an answer key page in one of three
+formats:
+- "text":  ĐÁP ÁN / PHẦN I-III lines the regex parser reads
+- "table": a Câu / Đáp án grid for the layout decoder
+- "image": the key rendered as a picture (no text layer), as in scanned keys
+
+Needs reportlab and a TrueType font with Vietnamese glyphs (DejaVu Sans by
+default, override with BENCH_FONT).
+
+Run: python -m bench.corpus --out /tmp/exam-corpus --docs 20
+"""
+
+import io
+import os
+import glob
+import json
+import random
+import argparse
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+KEY_FORMATS = ("text", "table", "image")
+FONT_NAME = "BenchSans"
+
+SUBJECTS = ["Toán", "Vật lí", "Hóa học", "Sinh học", "Lịch sử", "Địa lí"]
+STEMS = [
+    "Cho hàm số y = f(x) có bảng biến thiên như hình bên. Hàm số đã cho đồng biến trên khoảng nào?",
+    "Một vật dao động điều hòa với biên độ 5 cm và tần số 2 Hz. Tốc độ cực đại của vật là bao nhiêu?",
+    "Trong không gian Oxyz, cho mặt phẳng (P): 2x − y + 2z − 3 = 0. Khoảng cách từ gốc tọa độ đến (P) bằng",
+    "Chất nào sau đây là chất điện li mạnh khi hòa tan trong nước?",
+    "Nguyên nhân chủ yếu dẫn đến sự phát triển của phong trào giải phóng dân tộc sau năm 1945 là gì?",
+    "Dựa vào bảng số liệu, nhận xét nào sau đây đúng về sản lượng lúa của nước ta giai đoạn 2015 – 2022?",
+]
+STATEMENTS = [
+    "Hàm số có hai điểm cực trị.",
+    "Giá trị lớn nhất của hàm số trên đoạn [0; 2] bằng 4.",
+    "Đồ thị hàm số cắt trục hoành tại ba điểm phân biệt.",
+    "Phương trình f(x) = 1 có đúng một nghiệm dương.",
+]
+
+
+def find_font() -> str:
+    candidates = [os.getenv("BENCH_FONT", "")]
+    candidates += glob.glob("/usr/share/fonts/**/DejaVuSans.ttf", recursive=True)
+    candidates += glob.glob("/Library/Fonts/**/DejaVuSans.ttf", recursive=True)
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+    raise RuntimeError("No Vietnamese-capable TrueType font found; set BENCH_FONT")
+
+
+def _register_font() -> str:
+    path = find_font()
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT_NAME, path))
+    return path
+
+
+def random_key(rng: random.Random, mc_count: int, tf_count: int, sa_count: int) -> dict:
+    """Random answer key in the worker's output shape."""
+    mc = [rng.choice("ABCD") for _ in range(mc_count)]
+    tf = [
+        {"question": mc_count + i + 1, "answers": {k: rng.random() < 0.5 for k in "abcd"}}
+        for i in range(tf_count)
+    ]
+    sa = [
+        {"question": mc_count + tf_count + i + 1, "answer": rng.choice(["2,5", "-1", "121", "0,25", "7", "36"])}
+        for i in range(sa_count)
+    ]
+    return {"multiple_choice": mc, "true_false": tf, "short_answer": sa}
+
+
+def key_lines(key: dict) -> list:
+    """The key as ĐÁP ÁN text lines (the format extract_answer_key reads)."""
+    lines = ["ĐÁP ÁN", "PHẦN I"]
+    mc = [f"{i + 1}{a}" for i, a in enumerate(key["multiple_choice"])]
+    lines += [" ".join(mc[i:i + 10]) for i in range(0, len(mc), 10)]
+    if key["true_false"]:
+        lines.append("PHẦN II")
+        for item in key["true_false"]:
+            marks = " ".join("Đ" if item["answers"][k] else "S" for k in "abcd")
+            lines.append(f'{item["question"]} {marks}')
+    if key["short_answer"]:
+        lines.append("PHẦN III")
+        lines += [f'{item["question"]} {item["answer"]}' for item in key["short_answer"]]
+    return lines
+
+
+def _draw_question_page(c, rng: random.Random, page_no: int, first_question: int, subject: str):
+    width, height = A4
+    c.setFont(FONT_NAME, 10)
+    c.drawString(40, height - 30, f"ĐỀ THI THỬ TỐT NGHIỆP THPT – Môn: {subject} – Trang {page_no}")
+    y = height - 60
+    question = first_question
+    while y > 120:
+        stem = rng.choice(STEMS)
+        c.drawString(40, y, f"Câu {question}. {stem[:95]}")
+        y -= 14
+        if rng.random() < 0.25:
+            for label in "abcd":
+                c.drawString(60, y, f"{label}) {rng.choice(STATEMENTS)}")
+                y -= 13
+        else:
+            options = [f"{letter}. {rng.randint(-20, 99)}" for letter in "ABCD"]
+            c.drawString(60, y, "    ".join(options))
+            y -= 13
+        if rng.random() < 0.15 and y > 200:
+            y = _draw_table(c, rng, y - 6)
+        y -= 10
+        question += 1
+    return question
+
+
+def _draw_table(c, rng: random.Random, top: float) -> float:
+    """A small data table with grid lines (the kind Địa lí / Vật lí items use)."""
+    cols, rows, cell_w, cell_h = 5, 3, 70, 16
+    left = 60
+    c.setFont(FONT_NAME, 9)
+    for r in range(rows + 1):
+        c.line(left, top - r * cell_h, left + cols * cell_w, top - r * cell_h)
+    for col in range(cols + 1):
+        c.line(left + col * cell_w, top, left + col * cell_w, top - rows * cell_h)
+    headers = ["Năm", "2016", "2018", "2020", "2022"]
+    for col, text in enumerate(headers):
+        c.drawCentredString(left + col * cell_w + cell_w / 2, top - 12, text)
+    for r in range(1, rows):
+        c.drawCentredString(left + cell_w / 2, top - r * cell_h - 12, f"Chỉ số {r}")
+        for col in range(1, cols):
+            c.drawCentredString(left + col * cell_w + cell_w / 2, top - r * cell_h - 12, f"{rng.uniform(10, 99):.1f}")
+    c.setFont(FONT_NAME, 10)
+    return top - rows * cell_h - 8
+
+
+def _draw_text_key(c, key: dict):
+    c.setFont(FONT_NAME, 11)
+    y = A4[1] - 60
+    for line in key_lines(key):
+        c.drawString(50, y, line)
+        y -= 16
+
+
+def _draw_table_key(c, key: dict):
+    """Câu / Đáp án rows, Câu / a) b) c) d) blocks for Đúng/Sai."""
+    c.setFont(FONT_NAME, 11)
+    y = A4[1] - 60
+    c.drawString(50, y, "BẢNG ĐÁP ÁN")
+    y -= 30
+
+    def row(label, cells, y):
+        c.drawString(40, y, label)
+        for i, value in enumerate(cells):
+            c.drawCentredString(110 + i * 40, y, value)
+
+    mc = key["multiple_choice"]
+    for start in range(0, len(mc), 10):
+        chunk = mc[start:start + 10]
+        row("Câu", [str(start + i + 1) for i in range(len(chunk))], y)
+        row("Đáp án", chunk, y - 18)
+        y -= 50
+    if key["true_false"]:
+        row("Câu", [str(item["question"]) for item in key["true_false"]], y)
+        for k, label in enumerate("abcd"):
+            row(f"{label})", ["Đ" if item["answers"][label] else "S" for item in key["true_false"]], y - 18 * (k + 1))
+        y -= 18 * 5 + 20
+    if key["short_answer"]:
+        row("Câu", [str(item["question"]) for item in key["short_answer"]], y)
+        row("Đáp án", [str(item["answer"]) for item in key["short_answer"]], y - 18)
+
+
+def _draw_image_key(c, key: dict, font_path: str):
+    """Render the key into a bitmap so the page has no text layer."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.new("L", (1240, 1754), 255)  # A4 at 150 dpi
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.truetype(font_path, 30)
+    y = 120
+    for line in key_lines(key):
+        draw.text((100, y), line, fill=0, font=font)
+        y += 44
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    buffer.seek(0)
+    c.drawImage(ImageReader(buffer), 0, 0, width=A4[0], height=A4[1])
+
+
+def make_exam(path: str, pages: int, key_format: str, seed: int) -> dict:
+    """Write one exam PDF and return its metadata (including the true key)."""
+    font_path = _register_font()
+    rng = random.Random(seed)
+    subject = rng.choice(SUBJECTS)
+    mc_count, tf_count, sa_count = rng.choice([(12, 4, 6), (18, 4, 6), (24, 0, 0), (40, 0, 0)])
+    key = random_key(rng, mc_count, tf_count, sa_count)
+
+    c = canvas.Canvas(path, pagesize=A4)
+    question = 1
+    for page_no in range(1, pages):
+        question = _draw_question_page(c, rng, page_no, question, subject)
+        c.showPage()
+
+    if key_format == "text":
+        _draw_text_key(c, key)
+    elif key_format == "table":
+        _draw_table_key(c, key)
+    else:
+        _draw_image_key(c, key, font_path)
+    c.showPage()
+    c.save()
+
+    return {"path": path, "pages": pages, "key_format": key_format, "subject": subject, "key": key}
+
+
+def _make_exam_args(args):
+    return make_exam(*args)
+
+
+def build_corpus(out_dir: str, docs: int, min_pages: int = 10, max_pages: int = 100,
+                 seed: int = 1, processes: int = None) -> list:
+    """
+    Generate `docs` exams into out_dir (key formats rotate text/table/image)
+    and write manifest.json. Existing manifests with the same settings are reused.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    settings = {"docs": docs, "min_pages": min_pages, "max_pages": max_pages, "seed": seed}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("settings") == settings and all(os.path.exists(d["path"]) for d in manifest["exams"]):
+            return manifest["exams"]
+
+    rng = random.Random(seed)
+    jobs = [
+        (os.path.join(out_dir, f"exam_{i:03d}.pdf"), rng.randint(min_pages, max_pages), KEY_FORMATS[i % 3], seed * 1000 + i)
+        for i in range(docs)
+    ]
+    # Generate in worker processes so the benchmark's RSS stays the pipeline's
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        exams = list(pool.map(_make_exam_args, jobs))
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"settings": settings, "exams": exams}, f, ensure_ascii=False)
+    return exams
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic exam PDF corpus")
+    parser.add_argument("--out", default="/tmp/exam-corpus")
+    parser.add_argument("--docs", type=int, default=30)
+    parser.add_argument("--min-pages", type=int, default=10)
+    parser.add_argument("--max-pages", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    exams = build_corpus(args.out, args.docs, args.min_pages, args.max_pages, args.seed)
+    print(f"{len(exams)} exams, {sum(e['pages'] for e in exams)} pages in {args.out}")
@@ -0,0 +1,142 @@
+"""
+Load generator for a running worker.
+
+Steps through concurrency levels, uploading corpus PDFs to /extract-answers
+with N requests in flight, and reports throughput, latency percentiles and
+error/shed rates per level. The saturation point is the first level where
+throughput grows by less than --knee (default 10%) over the previous level or
+errors exceed --max-error-rate.
+
+Pair it with the Gemini stand-in so nothing is billed:
+    python -m bench.stub_gemini --port 8090 --latency lognormal:900,0.5 &
+    GEMINI_BASE_URL=http://127.0.0.1:8090 uvicorn main:app --port 8000 &
+    python -m bench.loadgen --url http://localhost:8000 --levels 1,2,4,8,16 --requests 40
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter
+
+import httpx
+
+from bench.corpus import build_corpus
+from bench.run_bench import latency_summary
+
+
+async def run_level(client: httpx.AsyncClient, url: str, payloads: list, concurrency: int,
+                    requests: int, duration: float) -> dict:
+    """Keep `concurrency` uploads in flight until `requests` finish or `duration` passes."""
+    latencies = []
+    statuses = Counter()
+    methods = Counter()
+    issued = 0
+    start = time.perf_counter()
+
+    async def worker():
+        nonlocal issued
+        while issued < requests and (duration <= 0 or time.perf_counter() - start < duration):
+            name, content = payloads[issued % len(payloads)]
+            issued += 1
+            sent = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"{url}/extract-answers",
+                    files={"file": (name, content, "application/pdf")},
+                )
+                status = response.status_code
+                if status == 200:
+                    methods[response.json().get("extraction_method", "unknown")] += 1
+            except httpx.HTTPError:
+                status = "error"
+            statuses[str(status)] += 1
+            if status == 200:
+                latencies.append((time.perf_counter() - sent) * 1000)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    total = sum(statuses.values())
+    failed = total - statuses.get("200", 0)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "wall_seconds": round(wall, 2),
+        "throughput_docs_per_s": round(statuses.get("200", 0) / wall, 3) if wall else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "error_rate": round(failed / total, 3) if total else 0.0,
+        "shed": statuses.get("429", 0) + statuses.get("503", 0),
+        "statuses": dict(statuses),
+        "routes": dict(methods),
+    }
+
+
+def find_saturation(levels: list, knee: float, max_error_rate: float):
+    """The first level that adds < knee throughput or errors too much."""
+    previous = None
+    for level in levels:
+        if level["error_rate"] > max_error_rate:
+            return level, "errors"
+        if previous and level["throughput_docs_per_s"] < previous["throughput_docs_per_s"] * (1 + knee):
+            return level, "throughput"
+        previous = level
+    return None, None
+
+
+async def main_async(args) -> dict:
+    exams = build_corpus(args.corpus, args.docs, args.min_pages, args.max_pages, args.seed)
+    payloads = []
+    for exam in exams:
+        with open(exam["path"], "rb") as f:
+            payloads.append((os.path.basename(exam["path"]), f.read()))
+
+    levels = []
+    limits = httpx.Limits(max_connections=max(args.levels), max_keepalive_connections=max(args.levels))
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        for concurrency in args.levels:
+            level = await run_level(client, args.url.rstrip("/"), payloads, concurrency, args.requests, args.duration)
+            levels.append(level)
+            lat = level["latency_ms"]
+            print(f"c={concurrency:<4} {level['throughput_docs_per_s']:>8} docs/s  "
+                  f"p50={lat['p50']:>9}  p95={lat['p95']:>9}  p99={lat['p99']:>9}  "
+                  f"errors={level['error_rate']:.1%}  shed={level['shed']}  {level['routes']}")
+
+    saturated, reason = find_saturation(levels, args.knee, args.max_error_rate)
+    if saturated:
+        print(f"\nSaturates at concurrency {saturated['concurrency']} ({reason}); "
+              f"peak throughput {max(l['throughput_docs_per_s'] for l in levels)} docs/s")
+    else:
+        print("\nNo saturation within the tested levels")
+    return {
+        "url": args.url,
+        "levels": levels,
+        "saturation": {"concurrency": saturated["concurrency"], "reason": reason} if saturated else None,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Drive a running worker at increasing concurrency")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--levels", default="1,2,4,8,16", type=lambda s: [int(v) for v in s.split(",")])
+    parser.add_argument("--requests", type=int, default=40, help="uploads per level")
+    parser.add_argument("--duration", type=float, default=0, help="cap seconds per level (0 = no cap)")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--knee", type=float, default=0.10, help="min throughput gain per level")
+    parser.add_argument("--max-error-rate", type=float, default=0.05)
+    parser.add_argument("--corpus", default="/tmp/exam-corpus")
+    parser.add_argument("--docs", type=int, default=30)
+    parser.add_argument("--min-pages", type=int, default=10)
+    parser.add_argument("--max-pages", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,242 @@
+"""
+Offline benchmark for the PDF worker.
+
+Generates (or reuses) a synthetic exam corpus, starts the Gemini stub in a
+subprocess, then drives /extract-answers in-process through the ASGI app
+at a fixed concurrency. Reports throughput, p50/p95/p99 latency (overall and
+per key format), peak RSS and how requests were routed (layout / regex / AI /
+vision), and writes a JSON report that can be compared across commits.
+
+Run from worker/:
+    python -m bench.run_bench --docs 30 --concurrency 4 --out bench-HEAD.json
+    python -m bench.run_bench --docs 30 --concurrency 4 --compare bench-HEAD.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import resource
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+
+from bench.corpus import build_corpus
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(latencies_ms: list) -> dict:
+    values = sorted(latencies_ms)
+    return {
+        "p50": round(percentile(values, 50), 1),
+        "p95": round(percentile(values, 95), 1),
+        "p99": round(percentile(values, 99), 1),
+        "max": round(values[-1], 1) if values else 0.0,
+        "mean": round(sum(values) / len(values), 1) if values else 0.0,
+    }
+
+
+def rss_mb() -> float:
+    """Peak RSS of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(latency_ms: float, jitter_ms: float, error_rate: float, seed: int) -> tuple:
+    """Start the Gemini stub in a subprocess and wait until it answers."""
+    port = _free_port()
+    process = subprocess.Popen([
+        sys.executable, "-m", "bench.stub_gemini", "--port", str(port),
+        "--latency-ms", str(latency_ms), "--jitter-ms", str(jitter_ms),
+        "--error-rate", str(error_rate), "--seed", str(seed),
+    ])
+    base_url = f"http://127.0.0.1:{port}"
+    import httpx
+    for _ in range(100):
+        try:
+            if httpx.get(f"{base_url}/health", timeout=0.5).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Gemini stub did not start")
+
+
+async def drive(exams: list, concurrency: int, rounds: int) -> tuple:
+    """Upload every exam `rounds` times through the in-process app."""
+    import httpx
+    import main
+
+    payloads = []
+    for exam in exams:
+        with open(exam["path"], "rb") as f:
+            payloads.append((exam, f.read()))
+
+    results = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://worker", timeout=300) as client:
+        async def one(exam, content):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(
+                    "/extract-answers",
+                    files={"file": (os.path.basename(exam["path"]), content, "application/pdf")},
+                )
+                elapsed_ms = (time.perf_counter() - start) * 1000
+            method = response.json().get("extraction_method", "error") if response.status_code == 200 else "error"
+            results.append({
+                "key_format": exam["key_format"],
+                "pages": exam["pages"],
+                "status": response.status_code,
+                "method": method,
+                "ms": elapsed_ms,
+            })
+
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(one(exam, content) for _ in range(rounds) for exam, content in payloads))
+        wall = time.perf_counter() - wall_start
+
+    main.pdf_pool.shutdown(wait=False)
+    return results, wall
+
+
+def build_report(results: list, wall: float, config: dict, baseline_rss: float) -> dict:
+    total = len(results)
+    methods = Counter(r["method"] for r in results)
+    by_format = {}
+    for key_format in sorted({r["key_format"] for r in results}):
+        subset = [r for r in results if r["key_format"] == key_format]
+        by_format[key_format] = {
+            "latency_ms": latency_summary([r["ms"] for r in subset]),
+            "routes": dict(Counter(r["method"] for r in subset)),
+        }
+    pages = sum(r["pages"] for r in results)
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": config,
+        "requests": total,
+        "pages": pages,
+        "wall_seconds": round(wall, 2),
+        "throughput_docs_per_s": round(total / wall, 3) if wall else 0.0,
+        "throughput_pages_per_s": round(pages / wall, 1) if wall else 0.0,
+        "latency_ms": latency_summary([r["ms"] for r in results]),
+        "by_key_format": by_format,
+        "routes": {method: round(count / total, 3) for method, count in sorted(methods.items())},
+        "errors": sum(1 for r in results if r["status"] != 200),
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": rss_mb(),
+    }
+
+
+COMPARED = [
+    ("throughput_docs_per_s", "throughput docs/s", True),
+    ("throughput_pages_per_s", "throughput pages/s", True),
+    ("latency_ms.p50", "latency p50 ms", False),
+    ("latency_ms.p95", "latency p95 ms", False),
+    ("latency_ms.p99", "latency p99 ms", False),
+    ("peak_rss_mb", "peak RSS MB", False),
+]
+
+
+def _lookup(report: dict, dotted: str):
+    value = report
+    for part in dotted.split("."):
+        value = value.get(part, {}) if isinstance(value, dict) else {}
+    return value if isinstance(value, (int, float)) else None
+
+
+def print_report(report: dict, previous: dict = None):
+    print(f"\ncommit {report['commit']}  {report['requests']} requests / {report['pages']} pages in {report['wall_seconds']}s")
+    print(f"routes: {report['routes']}  errors: {report['errors']}")
+    for key_format, summary in report["by_key_format"].items():
+        print(f"  {key_format:6} {summary['latency_ms']}  {summary['routes']}")
+    header = f"{'metric':22}{'value':>12}"
+    if previous:
+        header += f"{'previous':>12}{'change':>10}"
+    print(header)
+    for dotted, label, higher_is_better in COMPARED:
+        value = _lookup(report, dotted)
+        line = f"{label:22}{value:>12}"
+        if previous:
+            old = _lookup(previous, dotted)
+            if old:
+                change = (value - old) / old * 100
+                better = change > 0 if higher_is_better else change < 0
+                line += f"{old:>12}{change:>+9.1f}%{'' if abs(change) < 5 else (' better' if better else ' WORSE')}"
+        print(line)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the PDF worker")
+    parser.add_argument("--corpus", default="/tmp/exam-corpus", help="corpus directory (reused if settings match)")
+    parser.add_argument("--docs", type=int, default=30)
+    parser.add_argument("--min-pages", type=int, default=10)
+    parser.add_argument("--max-pages", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=1, help="times each exam is uploaded")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=800, help="stub Gemini mean latency")
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub calls failing with 503")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cache", action="store_true", help="use a fresh shared cache, so repeat rounds hit it")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="previous JSON report to diff against")
+    args = parser.parse_args()
+
+    exams = build_corpus(args.corpus, args.docs, args.min_pages, args.max_pages, args.seed)
+    stub, base_url = start_stub(args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    os.environ["GEMINI_BASE_URL"] = base_url
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    # Never reuse results from an earlier run or a local worker
+    os.environ["CACHE_ENABLED"] = "1" if args.cache else "0"
+    os.environ["CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-cache-"), "cache.sqlite3")
+
+    import logging
+    logging.disable(logging.INFO)
+    try:
+        baseline_rss = rss_mb()
+        results, wall = asyncio.run(drive(exams, args.concurrency, args.rounds))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    config = {k: v for k, v in vars(args).items() if k not in ("out", "compare")}
+    report = build_report(results, wall, config, baseline_rss)
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+    print_report(report, previous)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,226 @@
+"""
+Local OpenAI-compatible stand-in for the Gemini proxy (GEMINI_BASE_URL).
+
+Replays recorded /v1/chat/completions responses for each worker prompt
+(EXTRACTION_PROMPT, VARIANT_EXTRACTION_PROMPT, QUESTION_EXTRACTION_PROMPT,
+VISION_PROMPT) from bench/fixtures/<kind>.json, round-robin, and injects:
+- latency from a distribution: fixed:800 | normal:800,200 | lognormal:800,0.6
+  (median ms, sigma) | uniform:200,1500
+- random 503s (--error-rate) and periodic 429/503 bursts (--burst-every /
+  --burst-length seconds, --burst-status)
+- truncated JSON bodies (--truncate-rate), the case _parse_json_response repairs
+- SSE streaming when the request sets "stream": true
+
+--record-from <url> proxies to a real upstream instead and appends each
+response's content to the fixture file for its prompt kind.
+
+Point the worker at it with GEMINI_BASE_URL=http://127.0.0.1:8090.
+Run: python -m bench.stub_gemini --port 8090 --latency lognormal:900,0.5 --burst-every 60 --burst-length 5
+"""
+
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+PROMPT_KINDS = ("answers", "variants", "bank", "vision")
+
+
+def prompt_kind(body: dict) -> str:
+    """Which worker prompt a chat request carries."""
+    content = body.get("messages", [{}])[0].get("content", "")
+    if isinstance(content, list):
+        text = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+        return "bank" if "`questions`" in text else "vision"
+    if '"de_thi"' in content:
+        return "variants"
+    if "`questions`" in content:
+        return "bank"
+    return "answers"
+
+
+def load_fixtures(directory: str) -> dict:
+    """{kind: [response content, ...]} from <directory>/<kind>.json."""
+    fixtures = {}
+    for kind in PROMPT_KINDS:
+        path = os.path.join(directory, f"{kind}.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                fixtures[kind] = json.load(f)["responses"]
+    if "vision" not in fixtures and "answers" in fixtures:
+        fixtures["vision"] = fixtures["answers"]
+    return fixtures
+
+
+def parse_latency(spec: str):
+    """Build a sampler (rng -> ms) from a latency spec string."""
+    name, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if name == "fixed":
+        return lambda rng: values[0]
+    if name == "normal":
+        mean, sd = values
+        return lambda rng: max(0.0, rng.gauss(mean, sd))
+    if name == "lognormal":
+        median, sigma = values
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    if name == "uniform":
+        low, high = values
+        return lambda rng: rng.uniform(low, high)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def completion(model: str, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-stub-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+def _stream_chunks(model: str, content: str, chunk_chars: int = 40):
+    created = int(time.time())
+    for i in range(0, len(content), chunk_chars):
+        chunk = {
+            "id": f"chatcmpl-stub-{created}",
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": content[i:i + chunk_chars]}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def create_app(latency: str = "normal:800,200", error_rate: float = 0.0, burst_every: float = 0,
+               burst_length: float = 0, burst_status: int = 429, truncate_rate: float = 0.0,
+               stream_chunk_ms: float = 20, fixtures_dir: str = FIXTURES_DIR,
+               record_from: str = None, seed: int = None) -> FastAPI:
+    app = FastAPI(title="Gemini stand-in")
+    rng = random.Random(seed)
+    sample_latency = parse_latency(latency)
+    fixtures = load_fixtures(fixtures_dir)
+    replay_index = Counter()
+    stats = Counter()
+    started = time.monotonic()
+
+    def in_burst() -> bool:
+        if burst_every <= 0 or burst_length <= 0:
+            return False
+        return (time.monotonic() - started) % burst_every < burst_length
+
+    def next_fixture(kind: str) -> str:
+        responses = fixtures.get(kind) or fixtures["answers"]
+        content = responses[replay_index[kind] % len(responses)]
+        replay_index[kind] += 1
+        return content
+
+    async def record(body: dict, kind: str, authorization: str) -> JSONResponse:
+        async with httpx.AsyncClient(timeout=120) as client:
+            upstream = await client.post(
+                f"{record_from.rstrip('/')}/v1/chat/completions",
+                headers={"Authorization": authorization or "", "Content-Type": "application/json"},
+                json={**body, "stream": False},
+            )
+        if upstream.status_code == 200:
+            content = upstream.json().get("choices", [{}])[0].get("message", {}).get("content", "")
+            path = os.path.join(fixtures_dir, f"{kind}.json")
+            existing = {"kind": kind, "responses": []}
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    existing = json.load(f)
+            existing["responses"].append(content)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(existing, f, ensure_ascii=False, indent=2)
+                f.write("\n")
+        return JSONResponse(upstream.json(), status_code=upstream.status_code)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        kind = prompt_kind(body)
+        model = body.get("model", "stub")
+
+        if record_from:
+            stats[f"{kind}:recorded"] += 1
+            return await record(body, kind, request.headers.get("authorization"))
+
+        await asyncio.sleep(sample_latency(rng) / 1000)
+
+        if in_burst():
+            stats[f"{kind}:{burst_status}"] += 1
+            return JSONResponse({"error": {"message": "stand-in burst", "code": burst_status}},
+                                status_code=burst_status, headers={"Retry-After": "1"})
+        if rng.random() < error_rate:
+            stats[f"{kind}:503"] += 1
+            return JSONResponse({"error": {"message": "stand-in overloaded", "code": 503}}, status_code=503)
+
+        content = next_fixture(kind)
+        if rng.random() < truncate_rate:
+            content = content[:rng.randint(len(content) // 3, max(len(content) // 3, len(content) - 2))]
+            stats[f"{kind}:truncated"] += 1
+        else:
+            stats[f"{kind}:200"] += 1
+
+        if body.get("stream"):
+            async def events():
+                for event in _stream_chunks(model, content):
+                    yield event
+                    await asyncio.sleep(stream_chunk_ms / 1000)
+            return StreamingResponse(events(), media_type="text/event-stream")
+        return completion(model, content)
+
+    @app.get("/stats")
+    def get_stats():
+        """Responses served so far, by prompt kind and outcome."""
+        return {"uptime_seconds": round(time.monotonic() - started, 1), "responses": dict(stats)}
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok", "fixtures": {kind: len(items) for kind, items in fixtures.items()}}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenAI-compatible Gemini stand-in")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", help="fixed:MS | normal:MEAN,SD | lognormal:MEDIAN,SIGMA | uniform:LOW,HIGH")
+    parser.add_argument("--latency-ms", type=float, default=800, help="shorthand for normal:MS,JITTER")
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 503")
+    parser.add_argument("--burst-every", type=float, default=0, help="seconds between error bursts")
+    parser.add_argument("--burst-length", type=float, default=0, help="seconds each burst lasts")
+    parser.add_argument("--burst-status", type=int, default=429)
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="fraction of bodies cut mid-JSON")
+    parser.add_argument("--stream-chunk-ms", type=float, default=20)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--record-from", help="proxy to this upstream and record responses as fixtures")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    app = create_app(
+        latency=args.latency or f"normal:{args.latency_ms},{args.jitter_ms}",
+        error_rate=args.error_rate,
+        burst_every=args.burst_every,
+        burst_length=args.burst_length,
+        burst_status=args.burst_status,
+        truncate_rate=args.truncate_rate,
+        stream_chunk_ms=args.stream_chunk_ms,
+        fixtures_dir=args.fixtures,
+        record_from=args.record_from,
+        seed=args.seed,
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
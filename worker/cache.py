@@ -0,0 +1,258 @@
+"""
+Cache and outbound rate-limit state shared by every worker process.
+
+With several processes (gunicorn, see gunicorn.conf.py) an in-memory dict
+would be split N ways and each process would call Gemini for the same PDF.
+This keeps the state in one local SQLite file in WAL mode, which many
+readers and one writer use concurrently without a server:
+
+- entries: JSON values by (namespace, key) with a TTL. Namespaces:
+  "pdf" (page text, answer pages and layout grid result per PDF) and
+  "gemini" (parsed model result per prompt input)
+- leases: single-flight across processes. get_or_compute() claims a lease
+  before computing; other processes asking for the same key poll for the
+  result instead of making the same upstream call
+- buckets: token buckets for outbound calls (throttle())
+
+Every operation is a single indexed statement (sub-millisecond on local
+disk), but a writer may wait up to the 5 s busy timeout for another
+process's lock, so the async paths (get_or_compute, throttle) run each
+one in a thread (asyncio.to_thread), off the event loop. SQLite errors are
+logged and treated as a miss: the cache never fails an extraction.
+
+Config (env): CACHE_ENABLED (default 1), CACHE_PATH, CACHE_TTL_SECONDS,
+CACHE_MAX_ENTRIES (per namespace), CACHE_LEASE_SECONDS.
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
+
+from metrics import CACHE_LOOKUPS
+from deadlines import remaining
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(tempfile.gettempdir(), "exam-worker-cache.sqlite3"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "86400"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+# How long a process may hold a single-flight lease before others give up on it
+CACHE_LEASE_SECONDS = float(os.getenv("CACHE_LEASE_SECONDS", "120"))
+LEASE_POLL_SECONDS = 0.2
+PRUNE_EVERY = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);
+"""
+
+
+def cache_key(*parts) -> str:
+    """Stable key from strings/bytes/numbers (hashed, so any size is fine)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SharedCache:
+    """SQLite-backed cache, single-flight leases and token buckets."""
+
+    def __init__(self, path: str = CACHE_PATH, enabled: bool = CACHE_ENABLED,
+                 ttl: float = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES,
+                 lease_seconds: float = CACHE_LEASE_SECONDS):
+        self.path = path
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread and per process: connections must not
+        # cross a fork (gunicorn preload) or be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace: str, key: str):
+        """Cached value or None."""
+        if not self.enabled:
+            return None
+        value = self._read(namespace, key)
+        CACHE_LOOKUPS.labels(cache=namespace, result="miss" if value is None else "hit").inc()
+        return value
+
+    def _read(self, namespace: str, key: str):
+        try:
+            row = self._conn().execute(
+                "SELECT value FROM entries WHERE namespace = ? AND key = ? AND expires > ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Cache read failed: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace: str, key: str, value, ttl: float = None):
+        if not self.enabled:
+            return
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, ensure_ascii=False), time.time() + (ttl or self.ttl)),
+            )
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._prune(conn, namespace)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Cache write failed: {e}")
+
+    def _prune(self, conn: sqlite3.Connection, namespace: str):
+        """Drop expired entries, then the soonest-expiring ones over max_entries."""
+        conn.execute("DELETE FROM entries WHERE expires <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM entries WHERE namespace = ? AND key NOT IN "
+            "(SELECT key FROM entries WHERE namespace = ? ORDER BY expires DESC LIMIT ?)",
+            (namespace, namespace, self.max_entries),
+        )
+        conn.execute("DELETE FROM leases WHERE expires <= ?", (time.time(),))
+
+    def _claim(self, lease: str):
+        """Take the lease for a key; the owner token, or None if another process holds it."""
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        now = time.time()
+        try:
+            cursor = self._conn().execute(
+                "INSERT INTO leases (key, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE leases.expires <= ?",
+                (lease, owner, now + self.lease_seconds, now),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Cache lease failed: {e}")
+            return None
+        return owner if cursor.rowcount == 1 else None
+
+    def _release(self, lease: str, owner: str):
+        try:
+            self._conn().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (lease, owner))
+        except sqlite3.Error as e:
+            logger.warning(f"Cache lease release failed: {e}")
+
+    def _lease_held(self, lease: str) -> bool:
+        try:
+            row = self._conn().execute(
+                "SELECT 1 FROM leases WHERE key = ? AND expires > ?", (lease, time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            return False
+        return row is not None
+
+    async def get_or_compute(self, namespace: str, key: str, compute, cacheable=None, ttl: float = None):
+        """
+        Cached value, else `await compute()` -- once across all processes.
+        While another process holds the lease for this key, poll for its
+        result (within the request's budget); if it finishes without a
+        cacheable result, compute here. Only values passing `cacheable`
+        are stored.
+        """
+        if not self.enabled:
+            return await compute()
+        value = await asyncio.to_thread(self._read, namespace, key)
+        if value is not None:
+            CACHE_LOOKUPS.labels(cache=namespace, result="hit").inc()
+            return value
+
+        lease = f"{namespace}:{key}"
+        owner = await asyncio.to_thread(self._claim, lease)
+        if owner is None:
+            while await asyncio.to_thread(self._lease_held, lease) and remaining() > LEASE_POLL_SECONDS:
+                await asyncio.sleep(LEASE_POLL_SECONDS)
+                value = await asyncio.to_thread(self._read, namespace, key)
+                if value is not None:
+                    CACHE_LOOKUPS.labels(cache=namespace, result="shared").inc()
+                    return value
+            owner = await asyncio.to_thread(self._claim, lease)
+        CACHE_LOOKUPS.labels(cache=namespace, result="miss").inc()
+        try:
+            value = await compute()
+            if value is not None and (cacheable is None or cacheable(value)):
+                await asyncio.to_thread(self.set, namespace, key, value, ttl)
+            return value
+        finally:
+            if owner is not None:
+                await asyncio.to_thread(self._release, lease, owner)
+
+    def _take_token(self, name: str, rate: float, burst: float) -> float:
+        """Take one token from a bucket; 0 if taken, else seconds until one is available."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                         (name, tokens, now))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    async def throttle(self, name: str, per_minute: float, burst: float = 1):
+        """Wait for a token of a bucket shared by all processes (no-op when per_minute <= 0)."""
+        if per_minute <= 0:
+            return
+        while True:
+            try:
+                wait = await asyncio.to_thread(self._take_token, name, per_minute / 60, max(burst, 1))
+            except sqlite3.Error as e:
+                logger.warning(f"Rate limit state unavailable, not throttling: {e}")
+                return
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        try:
+            rows = self._conn().execute(
+                "SELECT namespace, COUNT(*) FROM entries WHERE expires > ? GROUP BY namespace", (time.time(),)
+            ).fetchall()
+        except sqlite3.Error as e:
+            return {"enabled": True, "error": str(e)}
+        return {"enabled": True, "path": self.path, "entries": dict(rows)}
+
+
+shared_cache = SharedCache()
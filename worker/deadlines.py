@@ -0,0 +1,160 @@
+"""
+Per-request deadlines and client-disconnect cancellation.
+
+DeadlineMiddleware gives every extraction request a RequestBudget: the
+X-Deadline-Ms header (remaining budget in milliseconds, set by the Next.js
+proxy) or REQUEST_DEADLINE_SECONDS. It runs the request as a task and cancels
+it when the budget runs out (504) or the client goes away (nothing is sent;
+recorded as 499), which cancels pending Gemini HTTP calls. Pool jobs cannot be
+cancelled from outside, so they call check() between pages and stop there.
+
+The pipeline also reads remaining() to skip expensive routes (vision, AI
+model attempts) that cannot finish in the time left.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Optional
+
+from metrics import REQUEST_CANCELLATIONS
+
+logger = logging.getLogger(__name__)
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "120"))
+MAX_DEADLINE_SECONDS = float(os.getenv("MAX_DEADLINE_SECONDS", "300"))
+DEADLINE_HEADER = b"x-deadline-ms"
+
+# Status recorded for a request the worker gave up on
+CANCELLED_STATUS = {"deadline": "504", "disconnect": "499"}
+
+_current_budget: ContextVar[Optional["RequestBudget"]] = ContextVar("request_budget", default=None)
+
+
+class RequestCancelled(Exception):
+    """Raised inside pool jobs once their request has been cancelled."""
+
+
+class RequestBudget:
+    """Deadline and cancellation flag shared by a request's task and pool jobs."""
+
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+        self.cancelled_reason: Optional[str] = None
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def cancel(self, reason: str):
+        self.cancelled_reason = reason
+
+
+def current_budget() -> Optional[RequestBudget]:
+    return _current_budget.get()
+
+
+def remaining() -> float:
+    """Seconds left for the current request (inf outside a request)."""
+    budget = _current_budget.get()
+    return budget.remaining() if budget is not None else float("inf")
+
+
+def allows(seconds: float) -> bool:
+    """Whether at least `seconds` of budget remain."""
+    return remaining() >= seconds
+
+
+def check():
+    """Raise RequestCancelled if the current request was cancelled."""
+    budget = _current_budget.get()
+    if budget is not None and budget.cancelled_reason:
+        raise RequestCancelled(budget.cancelled_reason)
+
+
+def _budget_seconds(scope) -> float:
+    for name, value in scope.get("headers", []):
+        if name == DEADLINE_HEADER:
+            try:
+                return min(max(int(value) / 1000, 1.0), MAX_DEADLINE_SECONDS)
+            except ValueError:
+                break
+    return REQUEST_DEADLINE_SECONDS
+
+
+class DeadlineMiddleware:
+    """ASGI middleware enforcing the budget and watching for disconnects."""
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        budget = RequestBudget(_budget_seconds(scope))
+        token = _current_budget.set(budget)
+        body_read = asyncio.Event()
+        disconnected = asyncio.Event()
+        response_started = False
+        response_complete = False
+
+        async def app_receive():
+            if disconnected.is_set():
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False):
+                body_read.set()
+            elif message["type"] == "http.disconnect":
+                disconnected.set()
+            return message
+
+        async def app_send(message):
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        async def watch_disconnect():
+            # Only listen once the app has the whole body, so no body
+            # message is taken from it
+            await body_read.wait()
+            while not disconnected.is_set():
+                if (await receive())["type"] == "http.disconnect":
+                    disconnected.set()
+
+        app_task = asyncio.create_task(self.app(scope, app_receive, app_send))
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            done, _ = await asyncio.wait({app_task, watcher}, timeout=max(budget.remaining(), 0),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            # The server also reports "disconnect" once the response is done
+            if app_task in done or (watcher in done and response_complete):
+                return await app_task
+
+            reason = "disconnect" if watcher in done else "deadline"
+            budget.cancel(reason)
+            REQUEST_CANCELLATIONS.labels(endpoint=scope["path"], reason=reason).inc()
+            logger.warning(f"Cancelling {scope['path']}: {reason}")
+            app_task.cancel()
+            try:
+                await app_task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+            if reason == "deadline" and not response_started:
+                body = json.dumps({"detail": "Deadline exceeded"}).encode()
+                await send({"type": "http.response.start", "status": 504,
+                            "headers": [(b"content-type", b"application/json"),
+                                        (b"content-length", str(len(body)).encode())]})
+                await send({"type": "http.response.body", "body": body})
+        finally:
+            watcher.cancel()
+            if not app_task.done():
+                app_task.cancel()
+            _current_budget.reset(token)
@@ -12,9 +12,18 @@ import asyncio
 import json
 import re
 import time
+import functools
 from typing import Optional, Dict, Any, List, Union
 from pydantic import BaseModel, Field, ValidationError
 
+from metrics import (MODEL_RETRIES, MODEL_SECONDS, UPSTREAM_POOL_CONNECTIONS, UPSTREAM_POOL_REQUESTS,
+                     UPSTREAM_RESPONSES, stage)
+from timing import record
+from tracing import inject_headers, mark_error, span
+from deadlines import allows, remaining
+from pdf_parser import parse_short_answer
+from cache import cache_key, shared_cache
+
 # ============================================================================
 # PYDANTIC MODELS FOR VALIDATION
 # ============================================================================
@@ -80,6 +89,29 @@ MAX_RETRIES = 1
 RETRY_DELAY = 2.0  # seconds
 RETRYABLE_STATUS_CODES = {429, 503, 502, 500}
 
+# Connection pool to the Gemini proxy (owned by the app lifespan)
+POOL_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "20"))
+POOL_MAX_KEEPALIVE = int(os.getenv("GEMINI_MAX_KEEPALIVE", "10"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", "90"))  # seconds
+POOL_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "10"))
+# Multiplex requests over one connection; needs the optional h2 package
+HTTP2_ENABLED = os.getenv("GEMINI_HTTP2", "0") == "1"
+# Connections opened at startup so the first extraction skips DNS/TLS setup
+WARMUP_CONNECTIONS = int(os.getenv("GEMINI_WARMUP_CONNECTIONS", "2"))
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Outbound request rate shared by all worker processes (0 = unlimited)
+RATE_LIMIT_PER_MINUTE = float(os.getenv("GEMINI_RATE_LIMIT_PER_MINUTE", "0"))
+RATE_LIMIT_BURST = float(os.getenv("GEMINI_RATE_LIMIT_BURST", "5"))
+
+# Don't start a model attempt with less request budget than this (seconds)
+MIN_ATTEMPT_SECONDS = 3.0
+
 # ============================================================================
 # ANSWER EXTRACTION PROMPT
 # ============================================================================
@@ -107,6 +139,24 @@ VÍ DỤ 2 — Đề có cả 3 phần:
 VĂN BẢN CẦN XỬ LÝ:
 {text}"""
 
+VARIANT_EXTRACTION_PROMPT = """CHỈ TRẢ VỀ JSON THUẦN TÚY. KHÔNG giải thích, KHÔNG markdown, KHÔNG thêm bất kỳ text nào khác.
+
+Bạn là AI trích xuất đáp án từ bảng đáp án gộp nhiều mã đề của đề thi THPT Việt Nam.
+
+NHIỆM VỤ: Với MỖI mã đề (101, 102, ...) trong bảng, trích xuất đáp án của mã đề đó.
+
+QUY TẮC:
+- "trac_nghiem": chuỗi các chữ cái A/B/C/D theo thứ tự câu 1, 2, 3, ... (dùng "_" nếu thiếu câu)
+- "dung_sai": object {{"số câu": "4 ký tự Đ/S theo ý a,b,c,d"}}
+- "tra_loi_ngan": object {{"số câu": "giá trị"}}
+- Phần nào không có → "" hoặc {{}}
+
+VÍ DỤ:
+{{"de_thi":[{{"ma_de":"101","trac_nghiem":"DCBA","dung_sai":{{"13":"ĐSĐS"}},"tra_loi_ngan":{{"17":"2,5"}}}},{{"ma_de":"102","trac_nghiem":"ABCD","dung_sai":{{}},"tra_loi_ngan":{{}}}}]}}
+
+VĂN BẢN CẦN XỬ LÝ:
+{text}"""
+
 QUESTION_EXTRACTION_PROMPT = """CHỈ TRẢ VỀ JSON THUẦN TÚY. KHÔNG giải thích, KHÔNG markdown, KHÔNG thêm text.
 
 Bạn là trợ lý AI phân tích đề thi trắc nghiệm Việt Nam.
@@ -140,6 +190,62 @@ VĂN BẢN CẦN XỬ LÝ:
 
 
 
+# ============================================================================
+# METRICS
+# ============================================================================
+
+def _observe_upstream(model: str, kind: str, start: float, status: Union[int, str]):
+    """Record one upstream AI request's latency and status code."""
+    elapsed = time.perf_counter() - start
+    MODEL_SECONDS.labels(model=model, kind=kind).observe(elapsed)
+    UPSTREAM_RESPONSES.labels(model=model, status=str(status)).inc()
+    record("ai_attempt", elapsed, model=model, kind=kind, status=str(status))
+
+
+async def _post_chat(client: httpx.AsyncClient, url: str, headers: dict, payload: dict, kind: str) -> httpx.Response:
+    """
+    POST one chat completion inside a span, carrying trace context upstream.
+    The read timeout is cut to the request's remaining budget.
+    """
+    model = payload["model"]
+    if RATE_LIMIT_PER_MINUTE > 0:
+        with stage("rate_limit"):
+            await shared_cache.throttle("gemini", RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST)
+    options = {}
+    left = remaining()
+    if left < (client.timeout.read or float("inf")):
+        options["timeout"] = httpx.Timeout(client.timeout.connect, read=max(left, 0.1))
+    with span("gemini.attempt", **{"gen_ai.request.model": model, "worker.kind": kind}) as attempt:
+        response = await client.post(url, headers=inject_headers(dict(headers)), json=payload, **options)
+        attempt.set_attribute("http.status_code", response.status_code)
+        if response.status_code != 200:
+            mark_error(attempt, f"HTTP {response.status_code}")
+        return response
+
+
+def _shared_result(kind: str, prompt: str, ok):
+    """
+    Serve an extraction from the cross-process cache. On a miss one process
+    calls the model and the others wait for its result; results passing
+    `ok` are stored. The prompt template is part of the key, so editing it
+    invalidates old results.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            inputs = [a for a in args if not isinstance(a, GeminiClient)] + sorted(kwargs.items())
+            key = cache_key(kind, prompt, *MODELS, *inputs)
+            return await shared_cache.get_or_compute("gemini", key, lambda: fn(*args, **kwargs), cacheable=ok)
+        return wrapper
+    return decorator
+
+
+def _has_answers(result: dict) -> bool:
+    """Cacheable: no error and at least one non-empty answer section."""
+    if result.get("error"):
+        return False
+    return any(result.get(section) for section in ("multiple_choice", "true_false", "short_answer"))
+
 # ============================================================================
 # GEMINI CLIENT
 # ============================================================================
@@ -152,14 +258,84 @@ class GeminiClient:
         self.base_url = (base_url or GEMINI_BASE_URL).rstrip('/')
         self.timeout = timeout
         self._client: Optional[httpx.AsyncClient] = None
+        self._transport: Optional[httpx.AsyncHTTPTransport] = None
+        self.http2 = HTTP2_ENABLED and HTTP2_AVAILABLE
+        if HTTP2_ENABLED and not HTTP2_AVAILABLE:
+            logger.warning("GEMINI_HTTP2=1 but the h2 package is not installed; using HTTP/1.1")
         logger.info(f"GeminiClient initialized with base URL: {self.base_url}")
     
+    def _create_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=POOL_MAX_KEEPALIVE,
+            keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+        )
+        self._transport = httpx.AsyncHTTPTransport(limits=limits, http2=self.http2)
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=POOL_CONNECT_TIMEOUT),
+            transport=self._transport,
+        )
+    
     async def _get_client(self) -> httpx.AsyncClient:
-        """Get or create a reusable HTTP client."""
+        """The pooled HTTP client; created here if the app lifespan has not started it."""
         if self._client is None or self._client.is_closed:
-            self._client = httpx.AsyncClient(timeout=self.timeout)
+            self._client = self._create_client()
         return self._client
     
+    async def start(self, warmup: int = WARMUP_CONNECTIONS):
+        """Open the pool and warm `warmup` connections (called on app startup)."""
+        await self._get_client()
+        if warmup > 0:
+            await self.warmup(warmup)
+    
+    async def warmup(self, connections: int):
+        """
+        Open connections ahead of the first extraction with cheap concurrent
+        GET /v1/models requests. Any response (even 404) leaves a
+        kept-alive connection; failures are only logged.
+        """
+        client = await self._get_client()
+        url = f"{self.base_url}/v1/models"
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(client.get(url, headers=headers, timeout=POOL_CONNECT_TIMEOUT) for _ in range(connections)),
+            return_exceptions=True,
+        )
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.warning(f"Gemini warmup: {len(failed)}/{connections} failed ({failed[0]!r})")
+        logger.info(f"Gemini pool warmed in {(time.perf_counter() - start) * 1000:.0f}ms: {self.pool_stats()}")
+    
+    async def aclose(self):
+        """Close pooled connections (called on app shutdown)."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._transport = None
+        self.pool_stats()
+    
+    def pool_stats(self) -> dict:
+        """Pool utilisation (also published as worker_upstream_pool_* gauges)."""
+        # httpcore exposes the connections; pending requests are internal
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for c in connections if c.is_idle())
+        requests = len(getattr(pool, "_requests", []))
+        UPSTREAM_POOL_CONNECTIONS.labels(state="active").set(len(connections) - idle)
+        UPSTREAM_POOL_CONNECTIONS.labels(state="idle").set(idle)
+        UPSTREAM_POOL_REQUESTS.set(requests)
+        return {
+            "open": self._client is not None and not self._client.is_closed,
+            "http2": self.http2,
+            "connections": len(connections),
+            "idle": idle,
+            "requests": requests,
+            "max_connections": POOL_MAX_CONNECTIONS,
+            "max_keepalive": POOL_MAX_KEEPALIVE,
+        }
+    
+    @_shared_result("answers", EXTRACTION_PROMPT, ok=_has_answers)
     async def extract_answers(self, pdf_text: str) -> Dict[str, Any]:
         """
         Use AI to extract answers from PDF text.
@@ -168,6 +344,9 @@ class GeminiClient:
         prompt = EXTRACTION_PROMPT.format(text=pdf_text[:15000])
         
         for model in MODELS:
+            if not allows(MIN_ATTEMPT_SECONDS):
+                logger.warning("Request deadline near, not trying further models")
+                break
             logger.info(f"Trying model: {model}")
             result = await self._try_model_with_retry(model, prompt)
             if result:
@@ -181,6 +360,29 @@ class GeminiClient:
             "error": "AI extraction failed - all models unavailable"
         }
     
+    @_shared_result("variants", VARIANT_EXTRACTION_PROMPT, ok=lambda r: bool(r.get("variants")))
+    async def extract_variant_answers(self, key_text: str) -> Dict[str, Any]:
+        """
+        Use AI to extract every mã đề's answers from a combined key table.
+        One call covers all variants instead of one call per variant PDF.
+        """
+        prompt = VARIANT_EXTRACTION_PROMPT.format(text=key_text[:15000])
+        
+        for model in MODELS:
+            if not allows(MIN_ATTEMPT_SECONDS):
+                logger.warning("Request deadline near, not trying further models")
+                break
+            logger.info(f"Trying model for variants: {model}")
+            result = await self._try_model_with_retry(model, prompt)
+            if result and result.get("variants"):
+                return result
+        
+        logger.error("All AI models failed for variant extraction")
+        return {
+            "variants": {},
+            "error": "AI variant extraction failed - all models unavailable"
+        }
+    
     async def _try_model_with_retry(self, model: str, prompt: str) -> Optional[Dict]:
         """Try a model with retry on transient errors (429, 503)."""
         for attempt in range(MAX_RETRIES + 1):
@@ -189,8 +391,10 @@ class GeminiClient:
                 return result
             
             # Check if we should retry (only if _try_model stored a retryable status)
-            if attempt < MAX_RETRIES and self._last_status in RETRYABLE_STATUS_CODES:
+            if (attempt < MAX_RETRIES and self._last_status in RETRYABLE_STATUS_CODES
+                    and allows(RETRY_DELAY + MIN_ATTEMPT_SECONDS)):
                 logger.info(f"Retrying {model} in {RETRY_DELAY}s (attempt {attempt + 1})...")
+                MODEL_RETRIES.labels(model=model).inc()
                 await asyncio.sleep(RETRY_DELAY)
             else:
                 break
@@ -201,6 +405,7 @@ class GeminiClient:
     
     async def _try_model(self, model: str, prompt: str) -> Optional[Dict]:
         """Try a specific model."""
+        start = time.perf_counter()
         try:
             url = f"{self.base_url}/v1/chat/completions"
             
@@ -217,15 +422,17 @@ class GeminiClient:
             }
             
             client = await self._get_client()
-            response = await client.post(url, headers=headers, json=payload)
+            response = await _post_chat(client, url, headers, payload, "text")
             self._last_status = response.status_code
+            _observe_upstream(model, "text", start, response.status_code)
             
             if response.status_code == 200:
                 data = response.json()
                 text = data.get("choices", [{}])[0].get("message", {}).get("content", "")
                 
                 if text:
-                    result = self._parse_json_response(text)
+                    with stage("ai_parse"):
+                        result = self._parse_json_response(text)
                     if result:
                         result["model"] = model
                         logger.info(f"Success with model: {model}")
@@ -236,9 +443,11 @@ class GeminiClient:
         except httpx.TimeoutException:
             logger.error(f"Model {model} timed out")
             self._last_status = 0
+            _observe_upstream(model, "text", start, "timeout")
         except Exception as e:
             logger.error(f"Model {model} failed: {e}")
             self._last_status = 0
+            _observe_upstream(model, "text", start, "error")
         
         return None
     
@@ -272,20 +481,23 @@ class GeminiClient:
             try:
                 data = json.loads(text)
             except json.JSONDecodeError:
-                # Try to fix truncated JSON
-                if text.count('{') > text.count('}'):
-                    text += '}' * (text.count('{') - text.count('}'))
-                if text.count('[') > text.count(']'):
-                    text += ']' * (text.count('[') - text.count(']'))
-                
-                try:
-                    data = json.loads(text)
-                except json.JSONDecodeError:
-                    # Last resort: regex extraction
-                    return self._regex_fallback(text)
+                with span("json_repair") as repair:
+                    # Try to fix truncated JSON
+                    if text.count('{') > text.count('}'):
+                        text += '}' * (text.count('{') - text.count('}'))
+                    if text.count('[') > text.count(']'):
+                        text += ']' * (text.count('[') - text.count(']'))
+                    
+                    try:
+                        data = json.loads(text)
+                    except json.JSONDecodeError:
+                        # Last resort: regex extraction
+                        repair.set_attribute("worker.regex_fallback", True)
+                        return self._regex_fallback(text)
             
             # Step 5: Normalize to English keys
-            return self._normalize_response(data)
+            with span("validate"):
+                return self._normalize_response(data)
             
         except Exception as e:
             logger.error(f"JSON parse error: {e}")
@@ -314,6 +526,9 @@ class GeminiClient:
     
     def _normalize_response(self, data: Dict) -> Dict:
         """Convert Vietnamese or English format to standardized output."""
+        if "de_thi" in data:
+            return {"variants": self._normalize_variants(data.get("de_thi", []))}
+        
         if "phan_trac_nghiem" in data:
             # Vietnamese format → convert
             mc_list = data.get("phan_trac_nghiem", [])
@@ -365,33 +580,79 @@ class GeminiClient:
         
         return result
 
+    def _normalize_variants(self, variant_list: List) -> Dict[str, Dict]:
+        """Convert the compact per-mã-đề format to {code: standardized output}."""
+        variants = {}
+        for item in variant_list:
+            if not isinstance(item, dict) or not item.get("ma_de"):
+                continue
+            
+            mc_str = str(item.get("trac_nghiem") or "")
+            multiple_choice = [
+                ch.upper() if ch.upper() in "ABCD" else None
+                for ch in mc_str if not ch.isspace()
+            ]
+            
+            true_false = []
+            for q, marks in (item.get("dung_sai") or {}).items():
+                marks = str(marks).replace("-", "").replace(" ", "").upper()
+                if str(q).isdigit() and len(marks) == 4:
+                    true_false.append({
+                        "question": int(q),
+                        "answers": {k: m in ("Đ", "D") for k, m in zip("abcd", marks)}
+                    })
+            
+            short_answer = []
+            for q, value in (item.get("tra_loi_ngan") or {}).items():
+                if str(q).isdigit():
+                    short_answer.append({"question": int(q), "answer": parse_short_answer(str(value))})
+            
+            variants[str(item["ma_de"])] = {
+                "multiple_choice": multiple_choice,
+                "true_false": sorted(true_false, key=lambda x: x["question"]),
+                "short_answer": sorted(short_answer, key=lambda x: x["question"])
+            }
+        return variants
+
+    @_shared_result("bank", QUESTION_EXTRACTION_PROMPT, ok=lambda r: bool(r.get("questions")))
     async def extract_bank_questions(self, pdf_text: str) -> dict:
         prompt = QUESTION_EXTRACTION_PROMPT.format(text=pdf_text[:15000])
         for model in MODELS:
+            if not allows(MIN_ATTEMPT_SECONDS):
+                logger.warning("Request deadline near, not trying further models")
+                break
             try:
                 url = f"{self.base_url}/v1/chat/completions"
                 headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
                 payload = {"model": model, "messages": [{"role": "user", "content": prompt}], "temperature": 0.1, "max_tokens": 8192}
                 client = await self._get_client()
-                response = await client.post(url, headers=headers, json=payload)
+                start = time.perf_counter()
+                response = await _post_chat(client, url, headers, payload, "bank")
+                _observe_upstream(model, "bank", start, response.status_code)
                 if response.status_code == 200:
                     text = response.json().get("choices", [{}])[0].get("message", {}).get("content", "")
                     if text:
-                        result = self._parse_json_response(text)
+                        with stage("ai_parse"):
+                            result = self._parse_json_response(text)
                         if result:
                             try:
                                 # Validate with Pydantic
-                                validated = ExamBankModel.model_validate(result)
+                                with span("validate"):
+                                    validated = ExamBankModel.model_validate(result)
                                 return validated.model_dump()
                             except ValidationError as ve:
                                 logger.warning(f"Pydantic validation failed for {model}: {ve}")
                                 continue # Try next model if validation fails
                 else:
                     logger.warning(f"Bank extraction failed for {model}: {response.status_code}")
+            except httpx.TimeoutException:
+                logger.error(f"Bank extraction timed out for {model}")
+                _observe_upstream(model, "bank", start, "timeout")
             except Exception as e:
                 logger.error(f"Bank extraction exception for {model}: {e}")
         return {"questions": []}
 
+    @_shared_result("bank_vision", QUESTION_EXTRACTION_PROMPT, ok=lambda r: bool(r.get("questions")))
     async def extract_bank_questions_vision(self, base64_images: list) -> dict:
         try:
             url = f"{self.base_url}/v1/chat/completions"
@@ -401,14 +662,18 @@ class GeminiClient:
                 content_array.append({"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img}"}})
             payload = {"model": "gemini-2.5-flash", "messages": [{"role": "user", "content": content_array}], "temperature": 0.1, "max_tokens": 8192}
             client = await self._get_client()
-            response = await client.post(url, headers=headers, json=payload)
+            start = time.perf_counter()
+            response = await _post_chat(client, url, headers, payload, "bank_vision")
+            _observe_upstream("gemini-2.5-flash", "bank_vision", start, response.status_code)
             if response.status_code == 200:
                 text = response.json().get("choices", [{}])[0].get("message", {}).get("content", "")
                 if text:
-                    result = self._parse_json_response(text)
+                    with stage("ai_parse"):
+                        result = self._parse_json_response(text)
                     if result:
                         try:
-                            validated = ExamBankModel.model_validate(result)
+                            with span("validate"):
+                                validated = ExamBankModel.model_validate(result)
                             return validated.model_dump()
                         except ValidationError as ve:
                             logger.error(f"Vision Pydantic validation failed: {ve}")
@@ -443,6 +708,7 @@ VÍ DỤ:
 # VISION EXTRACTION FUNCTION
 # ============================================================================
 
+@_shared_result("vision", VISION_PROMPT, ok=_has_answers)
 async def extract_answers_from_image(image_base64: str, mime_type: str = "image/png") -> Dict[str, Any]:
     """Extract answers from an image of answer key using Gemini Vision."""
     try:
@@ -474,7 +740,9 @@ async def extract_answers_from_image(image_base64: str, mime_type: str = "image/
         logger.info("Sending image to Gemini Vision...")
         
         client = await gemini_client._get_client()
-        response = await client.post(url, headers=headers, json=payload)
+        start = time.perf_counter()
+        response = await _post_chat(client, url, headers, payload, "vision")
+        _observe_upstream("gemini-2.5-flash", "vision", start, response.status_code)
         
         if response.status_code == 200:
             data = response.json()
@@ -483,7 +751,8 @@ async def extract_answers_from_image(image_base64: str, mime_type: str = "image/
             logger.info(f"Vision response preview: {text[:300]}")
             
             if text:
-                result = gemini_client._parse_json_response(text)
+                with stage("ai_parse"):
+                    result = gemini_client._parse_json_response(text)
                 if result:
                     result["model"] = "gemini-2.5-flash-vision"
                     result["extraction_method"] = "vision"
@@ -509,3 +778,8 @@ async def extract_answers_from_image(image_base64: str, mime_type: str = "image/
 async def extract_answers_with_ai(pdf_text: str) -> Dict[str, Any]:
     """Main function to extract answers using AI (text mode)."""
     return await gemini_client.extract_answers(pdf_text)
+
+
+async def extract_variant_answers_with_ai(key_text: str) -> Dict[str, Any]:
+    """Extract every mã đề's answers from a combined key table using AI."""
+    return await gemini_client.extract_variant_answers(key_text)
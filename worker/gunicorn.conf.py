@@ -0,0 +1,57 @@
+"""
+Multi-process serving: gunicorn managing uvicorn workers, one per core.
+Run: gunicorn main:app -c gunicorn.conf.py
+
+- The app is imported once in the master (preload) and forked, so workers
+  start warm and share the imported code pages
+- Cache, single-flight leases and the Gemini rate limit live in the shared
+  SQLite file (cache.py), so more processes don't mean more upstream calls
+- Prometheus samples from all processes are merged at /metrics
+- kill -HUP <master> replaces workers gracefully; each worker is also
+  recycled after GUNICORN_MAX_REQUESTS requests to bound memory growth
+  from large PDFs
+
+Config (env): WEB_CONCURRENCY (workers, default: cores, max 4), PORT,
+GUNICORN_PRELOAD, GUNICORN_TIMEOUT, GUNICORN_GRACEFUL_TIMEOUT,
+GUNICORN_MAX_REQUESTS.
+"""
+
+import os
+import shutil
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(len(os.sched_getaffinity(0)), 4))))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# Longer than REQUEST_DEADLINE_SECONDS so draining workers finish their uploads
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "130"))
+keepalive = 5
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "500"))
+max_requests_jitter = max_requests // 10
+
+# Must exist before prometheus_client is imported, which preload does right
+# after this file is read. A directory set by the operator is theirs to manage.
+_own_metrics_dir = "PROMETHEUS_MULTIPROC_DIR" not in os.environ
+_metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "worker-prometheus")
+)
+os.makedirs(_metrics_dir, exist_ok=True)
+
+
+def on_starting(server):
+    """
+    Start from empty metrics, once per master: not on HUP, which re-reads
+    this file while the workers' samples are still in use.
+    """
+    if _own_metrics_dir:
+        shutil.rmtree(_metrics_dir, ignore_errors=True)
+        os.makedirs(_metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges from the merged metrics."""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
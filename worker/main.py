@@ -3,23 +3,79 @@ PDF Worker API - FastAPI server for parsing exam PDFs.
 Provides endpoints for:
 - /parse-pdf: Extract questions and answers from PDF
 - /extract-answers: Get answer key from PDF
-- /health: Health check
+- /extract-answers/variants: Get every mã đề's key from a combined table
+- /health: Liveness check
+- /ready: Readiness (503 until startup warmup has finished)
+- /metrics: Prometheus metrics
 """
 
-import io
 import time
+
+# Cold-start import cost, logged and reported by /ready
+_IMPORT_START = time.perf_counter()
+
+import io
+import os
+import json
+import base64
+import asyncio
+import hashlib
 import logging
-from fastapi import FastAPI, UploadFile, HTTPException
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, Request, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import pdfplumber
+from pdf2image import convert_from_bytes
 
-from pdf_parser import parse_pdf_content, extract_answer_key
+from pdf_parser import parse_pdf_content, extract_answer_key, build_flat_answers
+from answer_grid import extract_answer_grid, extract_variant_grid, find_answer_pages
+from metrics import EXTRACTIONS, IN_FLIGHT, POOL_QUEUE_DEPTH, REQUEST_SECONDS, registry, stage
+from timing import record, start_trace
+from tracing import setup_tracing, shutdown_tracing, span
+from profiling import profiler
+from admission import AdmissionRejected, admission, resolve_priority
+from deadlines import CANCELLED_STATUS, DeadlineMiddleware, allows, check, current_budget
+from gemini_service import (WARMUP_CONNECTIONS, extract_answers_from_image, extract_answers_with_ai,
+                            extract_variant_answers_with_ai, gemini_client)
+from startup import readiness, warm_up
+from cache import cache_key, shared_cache
 
 logger = logging.getLogger("worker")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+setup_tracing()
+readiness.mark("imports", time.perf_counter() - _IMPORT_START)
+logger.info(f"Imports took {readiness.timings_ms['imports']:.0f}ms")
 
 MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB
 
+# pdfplumber / pdf2image are blocking and CPU-bound: run them in a bounded
+# pool so the event loop keeps serving health checks and AI responses
+PDF_POOL_WORKERS = int(os.getenv("PDF_POOL_WORKERS", "2"))
+pdf_pool = ThreadPoolExecutor(max_workers=PDF_POOL_WORKERS, thread_name_prefix="pdf")
+
+# Part of the "pdf" cache key: bump when text or layout extraction changes
+PDF_CACHE_VERSION = "1"
+
+# Minimum budget left (seconds) to still try a route; below it the cheaper
+# route is used (vision -> text, AI -> regex)
+VISION_MIN_BUDGET = float(os.getenv("VISION_MIN_BUDGET_SECONDS", "25"))
+AI_MIN_BUDGET = float(os.getenv("AI_MIN_BUDGET_SECONDS", "8"))
+
+# Endpoints tracked in request metrics (others would only add label noise),
+# with the admission class each one is admitted under
+ENDPOINT_CLASSES = {
+    "/parse-pdf": "text",
+    "/extract-answers": "text",
+    "/extract-answers/variants": "text",
+    "/extract-bank-questions": "bank",
+    "/parse-text": "text",
+    "/test-ai": "text",
+}
+
 app = FastAPI(
     title="Exam PDF Worker",
     description="PDF parsing service for the exam system",
@@ -36,6 +92,223 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def open_gemini_pool():
+    """Open the Gemini connection pool; warm it in the background so startup isn't held up."""
+    await gemini_client.start(warmup=0)
+    app.state.gemini_warmup = asyncio.create_task(gemini_client.warmup(WARMUP_CONNECTIONS))
+
+
+@app.on_event("startup")
+async def warm_pdf_pool():
+    """Warm the PDF pool threads in the background; /ready reports when done."""
+    app.state.pdf_warmup = asyncio.create_task(warm_up(pdf_pool, PDF_POOL_WORKERS, _IMPORT_START))
+
+
+@app.on_event("shutdown")
+async def close_gemini_pool():
+    for name in ("gemini_warmup", "pdf_warmup"):
+        task = getattr(app.state, name, None)
+        if task is not None and not task.done():
+            task.cancel()
+    await gemini_client.aclose()
+
+
+@app.on_event("shutdown")
+def flush_traces():
+    shutdown_tracing()
+
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """
+    Admit the request under its endpoint class (503 + Retry-After when the
+    class is saturated), scheduled fairly by X-Caller-Id and X-Priority.
+    Records in-flight count and latency per endpoint and attaches the stage
+    trace as a Server-Timing header (plus a "timings" object in the JSON
+    body with ?timings=1 or X-Timings: 1). The request span continues the
+    caller's traceparent; profiling.py wraps the request when asked for.
+    """
+    endpoint = request.url.path
+    if endpoint not in ENDPOINT_CLASSES:
+        return await call_next(request)
+    
+    in_flight = IN_FLIGHT.labels(endpoint=endpoint)
+    in_flight.inc()
+    trace = start_trace()
+    status = "500"
+    caller = request.headers.get("x-caller-id") or (request.client.host if request.client else "")
+    priority = resolve_priority(ENDPOINT_CLASSES[endpoint], request.headers.get("x-priority"))
+    try:
+        try:
+            async with admission.admit(ENDPOINT_CLASSES[endpoint], caller, priority):
+                async with profiler.profile(endpoint, request.headers.get("x-profile")) as profile_id:
+                    with span("request", parent_headers=dict(request.headers), server=True,
+                              **{"http.method": request.method, "http.route": endpoint}) as request_span:
+                        response = await call_next(request)
+                        status = str(response.status_code)
+                        request_span.set_attribute("http.status_code", response.status_code)
+        except AdmissionRejected as e:
+            status = "503"
+            return _busy_response(e)
+        if profile_id:
+            response.headers["X-Profile-Id"] = profile_id
+        if _wants_timings(request) and response.headers.get("content-type", "").startswith("application/json"):
+            response = await _with_timings_body(response, trace.as_dict())
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["Timing-Allow-Origin"] = "*"
+        return response
+    finally:
+        in_flight.dec()
+        budget = current_budget()
+        if budget is not None and budget.cancelled_reason:
+            status = CANCELLED_STATUS[budget.cancelled_reason]
+        REQUEST_SECONDS.labels(endpoint=endpoint, status=status, priority=priority).observe(trace.total_ms() / 1000)
+
+
+# Outermost: the deadline covers admission wait too, and cancelling the
+# request task cancels everything under it
+app.add_middleware(DeadlineMiddleware, paths=ENDPOINT_CLASSES)
+
+
+def _busy_response(rejection: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Worker busy ({rejection.job_class}), retry later"},
+        headers={"Retry-After": str(rejection.retry_after)},
+    )
+
+
+def _wants_timings(request: Request) -> bool:
+    flag = request.query_params.get("timings") or request.headers.get("x-timings") or ""
+    return flag.lower() in ("1", "true", "yes")
+
+
+async def _with_timings_body(response: Response, timings: dict) -> Response:
+    """Rebuild a JSON response with the stage trace added under "timings"."""
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    data = json.loads(body)
+    if isinstance(data, dict):
+        data["timings"] = timings
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    return Response(content=body, status_code=response.status_code, headers=headers)
+
+
+# =============================================
+# Blocking PDF work (runs in pdf_pool)
+# =============================================
+
+def _dequeue_once():
+    """POOL_QUEUE_DEPTH.dec for one job, at most once whoever calls it first."""
+    lock = threading.Lock()
+
+    def dequeue():
+        if lock.acquire(blocking=False):
+            POOL_QUEUE_DEPTH.dec()
+    return dequeue
+
+
+def _pool_job(fn, args, submitted, dequeue):
+    dequeue()
+    record("pool_wait", time.perf_counter() - submitted)
+    check()
+    return fn(*args)
+
+
+async def run_in_pool(fn, *args):
+    """
+    Run a blocking PDF job in pdf_pool, tracking how many are waiting.
+    The job runs in a copy of the caller's context so it records into the
+    same request trace and sees the request's cancellation flag. A job
+    cancelled while still queued never starts, so the caller leaves the
+    queue for it.
+    """
+    POOL_QUEUE_DEPTH.inc()
+    dequeue = _dequeue_once()
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    try:
+        return await loop.run_in_executor(pdf_pool, ctx.run, _pool_job, fn, args, time.perf_counter(), dequeue)
+    finally:
+        dequeue()
+
+
+async def run_cached(fn, content: bytes, *args):
+    """
+    run_in_pool for a PDF read step, cached per document (and grid decoder)
+    in the cross-process "pdf" cache, so a re-upload or the same PDF on
+    another worker process skips pdfplumber.
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    key = cache_key(fn.__name__, PDF_CACHE_VERSION, digest, *(getattr(a, "__name__", a) for a in args))
+    return await shared_cache.get_or_compute("pdf", key, lambda: run_in_pool(fn, content, *args))
+
+
+def _extract_page_texts(pdf) -> list:
+    """Extract text per page ("" for pages without text), timing each page."""
+    page_texts = []
+    with stage("extract_text"):
+        for i, page in enumerate(pdf.pages):
+            check()
+            start = time.perf_counter()
+            with span("extract_page", page=i + 1):
+                page_texts.append(page.extract_text() or "")
+            record("extract_text", time.perf_counter() - start, page=i + 1)
+    return page_texts
+
+
+def _open_pdf(content: bytes):
+    with span("pdf_open", size_bytes=len(content)):
+        return pdfplumber.open(io.BytesIO(content))
+
+
+def _read_page_texts(content: bytes) -> list:
+    """Extract text per page with pdfplumber."""
+    with _open_pdf(content) as pdf:
+        return _extract_page_texts(pdf)
+
+
+def _read_key_pages(content: bytes, grid_decoder) -> tuple:
+    """
+    Extract text per page, then run a layout grid decoder on the answer pages
+    while the document is still open.
+    
+    Returns:
+        (page_texts, answer_page_indexes, grid_result or None)
+    """
+    grid_result = None
+    with _open_pdf(content) as pdf:
+        page_texts = _extract_page_texts(pdf)
+        
+        answer_page_indexes = find_answer_pages(page_texts)
+        try:
+            with stage("layout"):
+                grid_result = grid_decoder([pdf.pages[i] for i in answer_page_indexes])
+        except Exception as e:
+            logger.warning(f"Layout grid extraction failed: {e}")
+    return page_texts, answer_page_indexes, grid_result
+
+
+def _render_pages_base64(content: bytes, first_page: int, last_page: int) -> list:
+    """Rasterize pages to PNG and base64-encode them for vision models."""
+    with stage("rasterize"):
+        images = convert_from_bytes(content, first_page=first_page, last_page=last_page)
+    
+    encoded = []
+    with stage("encode"):
+        for img in images:
+            check()
+            img_buffer = io.BytesIO()
+            img.save(img_buffer, format='PNG')
+            encoded.append(base64.b64encode(img_buffer.getvalue()).decode('utf-8'))
+    return encoded
+
+
+def _join_page_texts(page_texts: list) -> str:
+    return "".join(text + "\n" for text in page_texts if text)
+
+
 @app.get("/")
 def root():
     """Root endpoint for Render health check."""
@@ -44,8 +317,28 @@ def root():
 
 @app.get("/health")
 def health_check():
-    """Health check endpoint."""
-    return {"status": "ok", "service": "pdf-worker"}
+    """Liveness: the process is up and answering."""
+    return {
+        "status": "ok",
+        "service": "pdf-worker",
+        "admission": admission.snapshot(),
+        "gemini_pool": gemini_client.pool_stats(),
+        "cache": shared_cache.stats(),
+    }
+
+
+@app.get("/ready")
+def ready_check():
+    """Readiness: 503 until startup warmup has finished."""
+    snapshot = readiness.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint."""
+    gemini_client.pool_stats()
+    return Response(generate_latest(registry()), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.post("/parse-pdf")
@@ -64,15 +357,12 @@ async def parse_pdf(file: UploadFile):
     
     try:
         # Read file content
-        content = await file.read()
+        with stage("read"):
+            content = await file.read()
         
         # Extract text using pdfplumber
-        full_text = ""
-        with pdfplumber.open(io.BytesIO(content)) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    full_text += text + "\n"
+        page_texts = await run_cached(_read_page_texts, content)
+        full_text = _join_page_texts(page_texts)
         
         if not full_text.strip():
             raise HTTPException(
@@ -81,10 +371,12 @@ async def parse_pdf(file: UploadFile):
             )
         
         # Parse the extracted text
-        result = parse_pdf_content(full_text)
+        with stage("parse"):
+            result = parse_pdf_content(full_text)
         result["filename"] = file.filename
-        result["page_count"] = len(pdf.pages) if 'pdf' in dir() else 0
+        result["page_count"] = len(page_texts)
         
+        EXTRACTIONS.labels(endpoint="parse-pdf", method="regex").inc()
         return result
         
     except Exception as e:
@@ -94,7 +386,7 @@ async def parse_pdf(file: UploadFile):
 @app.post("/extract-answers")
 async def extract_answers(file: UploadFile, use_ai: bool = True):
     """
-    Extract answer key from PDF using AI + regex fallback.
+    Extract answer key from PDF: layout grid first, then AI + regex fallback.
     
     Args:
         file: Uploaded PDF file
@@ -108,72 +400,86 @@ async def extract_answers(file: UploadFile, use_ai: bool = True):
     
     start_time = time.time()
     try:
-        content = await file.read()
+        with stage("read"):
+            content = await file.read()
         
         if len(content) > MAX_FILE_SIZE:
             raise HTTPException(status_code=400, detail=f"File too large ({len(content) // 1024 // 1024}MB). Max: 20MB")
         
-        full_text = ""
-        last_page_has_text = True
-        page_count = 0
-        
-        with pdfplumber.open(io.BytesIO(content)) as pdf:
-            page_count = len(pdf.pages)
-            for i, page in enumerate(pdf.pages):
-                text = page.extract_text()
-                if text:
-                    full_text += text + "\n"
-                # Check if last page has text (might be image)
-                if i == page_count - 1:
-                    last_page_has_text = bool(text and len(text.strip()) > 50)
+        # Table-format keys: rebuild the grid from word positions on the
+        # answer pages only, before paying for an AI call
+        page_texts, _, grid_result = await run_cached(_read_key_pages, content, extract_answer_grid)
+        full_text = _join_page_texts(page_texts)
+        page_count = len(page_texts)
+        # Check if last page has text (might be image)
+        last_page_has_text = bool(page_count == 0 or len(page_texts[-1].strip()) > 50)
         
         logger.info(f"PDF has {page_count} pages, last page has text: {last_page_has_text}")
         
+        if grid_result and grid_result["confident"]:
+            elapsed = round(time.time() - start_time, 2)
+            answers = grid_result["answers"]
+            logger.info(f"Layout grid extraction successful! Coverage: {grid_result['coverage']}, elapsed: {elapsed}s")
+            EXTRACTIONS.labels(endpoint="extract-answers", method="layout").inc()
+            return {
+                "answers": answers,
+                "total": len([a for a in answers if a is not None]),
+                "filename": file.filename,
+                "extraction_method": "layout",
+                "multiple_choice": grid_result["multiple_choice"],
+                "true_false": grid_result["true_false"],
+                "short_answer": grid_result["short_answer"],
+                "elapsed_seconds": elapsed
+            }
+        
         # If last page is an image (no text), try vision extraction
-        if not last_page_has_text and page_count > 0:
+        # (when there is still time for rasterize + a vision call)
+        if not last_page_has_text and page_count > 0 and not allows(VISION_MIN_BUDGET):
+            logger.info("Not enough budget left for Vision, using text")
+        elif not last_page_has_text and page_count > 0:
             logger.info("Last page is image-based, trying Vision extraction...")
             try:
-                from pdf2image import convert_from_bytes
-                import base64
-                from io import BytesIO
-                
-                # Convert ONLY last page to image
-                images = convert_from_bytes(content, first_page=page_count, last_page=page_count)
-                if images:
-                    # Convert to base64
-                    img_buffer = BytesIO()
-                    images[0].save(img_buffer, format='PNG')
-                    img_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
-                    
-                    logger.info(f"Converted last page to image ({len(img_base64)} bytes)")
-                    
-                    # Use vision extraction
-                    from gemini_service import extract_answers_from_image
-                    vision_result = await extract_answers_from_image(img_base64, "image/png")
-                    
-                    if vision_result and not vision_result.get("error"):
-                        return {
-                            "answers": vision_result.get("multiple_choice", []),
-                            "total": len(vision_result.get("multiple_choice", [])),
-                            "filename": file.filename,
-                            "extraction_method": "vision",
-                            "model": vision_result.get("model", "gemini-vision"),
-                            "multiple_choice": vision_result.get("multiple_choice", []),
-                            "true_false": vision_result.get("true_false", []),
-                            "short_answer": vision_result.get("short_answer", [])
-                        }
+                # Vision has its own cap; when no slot is free right now, go straight to text
+                async with admission.admit("vision", wait=False):
+                    # Convert ONLY last page to image
+                    images = await run_in_pool(_render_pages_base64, content, page_count, page_count)
+                    if images:
+                        img_base64 = images[0]
+                        
+                        logger.info(f"Converted last page to image ({len(img_base64)} bytes)")
+                        
+                        # Use vision extraction
+                        with stage("vision"):
+                            vision_result = await extract_answers_from_image(img_base64, "image/png")
+                        
+                        if vision_result and not vision_result.get("error"):
+                            EXTRACTIONS.labels(endpoint="extract-answers", method="vision").inc()
+                            return {
+                                "answers": vision_result.get("multiple_choice", []),
+                                "total": len(vision_result.get("multiple_choice", [])),
+                                "filename": file.filename,
+                                "extraction_method": "vision",
+                                "model": vision_result.get("model", "gemini-vision"),
+                                "multiple_choice": vision_result.get("multiple_choice", []),
+                                "true_false": vision_result.get("true_false", []),
+                                "short_answer": vision_result.get("short_answer", [])
+                            }
+            except AdmissionRejected:
+                logger.warning("Vision at capacity, falling back to text")
             except Exception as e:
                 logger.warning(f"Vision extraction failed: {e}, falling back to text")
         
         logger.info(f"Extracted text preview ({len(full_text)} chars): {full_text[:500]}")
         
-        # Try AI extraction first
+        # Try AI extraction first (regex only when the budget is nearly spent)
         ai_result = None
-        if use_ai:
+        if use_ai and not allows(AI_MIN_BUDGET):
+            logger.info("Not enough budget left for AI, using regex")
+        elif use_ai:
             try:
                 logger.info(f"Starting AI extraction for: {file.filename}")
-                from gemini_service import extract_answers_with_ai
-                ai_result = await extract_answers_with_ai(full_text)
+                with stage("ai"):
+                    ai_result = await extract_answers_with_ai(full_text)
                 logger.info(f"AI result keys: {list(ai_result.keys())}, MC count: {len(ai_result.get('multiple_choice', []))}")
                 
                 # Check if AI returned meaningful data
@@ -186,6 +492,7 @@ async def extract_answers(file: UploadFile, use_ai: bool = True):
                 if has_data:
                     elapsed = round(time.time() - start_time, 2)
                     logger.info(f"AI extraction successful! Model: {ai_result.get('model')}, elapsed: {elapsed}s")
+                    EXTRACTIONS.labels(endpoint="extract-answers", method="ai").inc()
                     return {
                         "answers": ai_result.get("multiple_choice", []),
                         "total": len(ai_result.get("multiple_choice", [])),
@@ -203,10 +510,12 @@ async def extract_answers(file: UploadFile, use_ai: bool = True):
                 logger.error(f"AI extraction failed: {e}", exc_info=True)
         
         # Fallback to regex extraction
-        answer_data = extract_answer_key(full_text)
+        with stage("parse"):
+            answer_data = extract_answer_key(full_text)
         answers = answer_data.get("answers", [])
         valid_answers = [a for a in answers if a is not None]
         
+        EXTRACTIONS.labels(endpoint="extract-answers", method="regex").inc()
         return {
             "answers": answers,
             "total": len(valid_answers),
@@ -224,6 +533,76 @@ async def extract_answers(file: UploadFile, use_ai: bool = True):
         raise HTTPException(status_code=500, detail=f"Error extracting answers: {str(e)}")
 
 
+@app.post("/extract-answers/variants")
+async def extract_variant_answers(file: UploadFile, use_ai: bool = True):
+    """
+    Extract every variant's (mã đề) answer key from one PDF whose key pages
+    hold a combined table for all variants.
+    
+    Args:
+        file: Uploaded PDF file
+        use_ai: Use one AI call for all variants if the table cannot be decoded locally
+        
+    Returns:
+        {"variants": {code: {answers, multiple_choice, true_false, short_answer}}}
+    """
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are accepted")
+    
+    start_time = time.time()
+    try:
+        with stage("read"):
+            content = await file.read()
+        
+        if len(content) > MAX_FILE_SIZE:
+            raise HTTPException(status_code=400, detail=f"File too large ({len(content) // 1024 // 1024}MB). Max: 20MB")
+        
+        page_texts, answer_page_indexes, grid_result = await run_cached(
+            _read_key_pages, content, extract_variant_grid
+        )
+        
+        def variant_response(variants: dict, method: str, **extra) -> dict:
+            EXTRACTIONS.labels(endpoint="extract-answers/variants", method=method).inc()
+            for key in variants.values():
+                key["answers"] = build_flat_answers(
+                    key["multiple_choice"], key["true_false"], key["short_answer"]
+                )
+            return {
+                "variants": variants,
+                "variant_count": len(variants),
+                "filename": file.filename,
+                "extraction_method": method,
+                "elapsed_seconds": round(time.time() - start_time, 2),
+                **extra
+            }
+        
+        if grid_result and grid_result["confident"]:
+            logger.info(f"Variant grid extraction successful! Variants: {grid_result['variant_count']}")
+            return variant_response(grid_result["variants"], "layout")
+        
+        if use_ai and allows(AI_MIN_BUDGET):
+            try:
+                key_text = "\n".join(page_texts[i] for i in answer_page_indexes)
+                with stage("ai"):
+                    ai_result = await extract_variant_answers_with_ai(key_text)
+                if ai_result.get("variants"):
+                    logger.info(f"AI variant extraction successful! Variants: {len(ai_result['variants'])}")
+                    return variant_response(ai_result["variants"], "ai", model=ai_result.get("model", "unknown"))
+                logger.warning("AI returned no variants")
+            except Exception as e:
+                logger.error(f"AI variant extraction failed: {e}", exc_info=True)
+        
+        # Partial local decode is still better than nothing
+        if grid_result:
+            return variant_response(grid_result["variants"], "layout")
+        return variant_response({}, "none")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error extracting variant answers: {str(e)}")
+
+
 @app.post("/parse-text")
 async def parse_text(text: str):
     """
@@ -246,7 +625,6 @@ async def test_ai():
     Use this to verify the Gemini API is working.
     """
     try:
-        from gemini_service import gemini_client
         
         test_text = """
         ĐÁP ÁN ĐỀ THI
@@ -283,39 +661,32 @@ async def extract_bank_questions(file: UploadFile):
         raise HTTPException(status_code=400, detail="Only PDF files are accepted")
     
     try:
-        content = await file.read()
+        with stage("read"):
+            content = await file.read()
         
         if len(content) > MAX_FILE_SIZE:
             raise HTTPException(status_code=400, detail=f"File too large ({len(content) // 1024 // 1024}MB)")
         
-        full_text = ""
-        with pdfplumber.open(io.BytesIO(content)) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    full_text += text + "\n"
+        page_texts = await run_cached(_read_page_texts, content)
+        full_text = _join_page_texts(page_texts)
         
         if not full_text.strip():
             logger.info("No text extracted from PDF, trying Vision extraction for bank questions...")
             try:
-                from pdf2image import convert_from_bytes
-                import base64
-                from io import BytesIO
-                
-                # Convert up to first 8 pages to images to prevent timeout
-                images = convert_from_bytes(content, first_page=1, last_page=8)
-                if images:
-                    base64_images = []
-                    for img in images:
-                        img_buffer = BytesIO()
-                        img.save(img_buffer, format='PNG')
-                        base64_images.append(base64.b64encode(img_buffer.getvalue()).decode('utf-8'))
-                    
-                    from gemini_service import gemini_client
-                    result = await gemini_client.extract_bank_questions_vision(base64_images)
-                    
-                    if result and result.get("questions"):
-                        return result
+                # Vision is the only route here, so a full vision class is a 503
+                # (without queueing while this request holds its bank slot)
+                async with admission.admit("vision", wait=False):
+                    # Convert up to first 8 pages to images to prevent timeout
+                    base64_images = await run_in_pool(_render_pages_base64, content, 1, 8)
+                    if base64_images:
+                        with stage("vision"):
+                            result = await gemini_client.extract_bank_questions_vision(base64_images)
+                        
+                        if result and result.get("questions"):
+                            EXTRACTIONS.labels(endpoint="extract-bank-questions", method="vision").inc()
+                            return result
+            except AdmissionRejected as e:
+                return _busy_response(e)
             except Exception as e:
                 logger.error(f"Vision extraction failed for bank questions: {e}")
                 
@@ -324,9 +695,10 @@ async def extract_bank_questions(file: UploadFile):
                 detail="Could not extract text from PDF. The PDF might be scanned/image-based, and vision fallback failed."
             )
         
-        from gemini_service import gemini_client
-        result = await gemini_client.extract_bank_questions(full_text)
+        with stage("ai"):
+            result = await gemini_client.extract_bank_questions(full_text)
         
+        EXTRACTIONS.labels(endpoint="extract-bank-questions", method="ai").inc()
         return result
         
     except HTTPException:
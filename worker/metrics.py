@@ -0,0 +1,145 @@
+"""
+Prometheus metrics for the PDF worker.
+Exposed at /metrics; the Next.js proxy does not forward this path.
+
+- Stage latency: upload read, pdfplumber, layout grid, rasterize, encode,
+  AI call, parsing
+- Per-model latency and upstream status codes for Gemini calls
+- Extraction method (layout/ai/regex/vision), cache hits, retries
+- In-flight requests and PDF pool queue depth
+- Admission control: slots in use, queue depth and rejections per job class,
+  wait time and request latency per priority (interactive / bulk)
+- Requests cancelled on deadline or client disconnect
+- Gemini connection pool: open connections by state, requests using or
+  waiting for a connection
+
+Under gunicorn (PROMETHEUS_MULTIPROC_DIR set by gunicorn.conf.py) each
+process writes its samples to that directory and registry() merges them;
+gauges are summed over live processes.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, multiprocess
+
+from timing import record
+from tracing import span
+
+# Worker stages run from milliseconds (read, regex) to a minute (AI calls)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 90)
+
+REQUEST_SECONDS = Histogram(
+    "worker_request_seconds",
+    "End-to-end request latency",
+    ["endpoint", "status", "priority"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "worker_stage_seconds",
+    "Latency of one pipeline stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+MODEL_SECONDS = Histogram(
+    "worker_model_request_seconds",
+    "Latency of one upstream AI request",
+    ["model", "kind"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_RESPONSES = Counter(
+    "worker_upstream_responses_total",
+    "Upstream AI responses by status code ('timeout' / 'error' without a response)",
+    ["model", "status"],
+)
+MODEL_RETRIES = Counter(
+    "worker_model_retries_total",
+    "Retries of an upstream AI request after a retryable status",
+    ["model"],
+)
+EXTRACTIONS = Counter(
+    "worker_extractions_total",
+    "Completed extractions by the method that produced the answer",
+    ["endpoint", "method"],
+)
+CACHE_LOOKUPS = Counter(
+    "worker_cache_lookups_total",
+    "Cache lookups by cache name and result (hit / miss / shared: waited for another process)",
+    ["cache", "result"],
+)
+IN_FLIGHT = Gauge(
+    "worker_requests_in_flight",
+    "Requests currently being handled",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "worker_admission_in_flight",
+    "Admitted jobs holding a slot, by job class",
+    ["job_class"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "worker_admission_queue_depth",
+    "Jobs waiting for a slot, by job class",
+    ["job_class"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_REJECTIONS = Counter(
+    "worker_admission_rejections_total",
+    "Jobs turned away with 503 (queue_full / queue_timeout / busy)",
+    ["job_class", "reason", "priority"],
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "worker_admission_wait_seconds",
+    "Time spent queued for an admission slot",
+    ["job_class", "priority"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_CANCELLATIONS = Counter(
+    "worker_request_cancellations_total",
+    "Requests cancelled before finishing (deadline / disconnect)",
+    ["endpoint", "reason"],
+)
+UPSTREAM_POOL_CONNECTIONS = Gauge(
+    "worker_upstream_pool_connections",
+    "Open connections to the Gemini proxy by state (active / idle)",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_POOL_REQUESTS = Gauge(
+    "worker_upstream_pool_requests",
+    "Gemini requests holding or waiting for a pooled connection",
+    multiprocess_mode="livesum",
+)
+POOL_QUEUE_DEPTH = Gauge(
+    "worker_pool_queue_depth",
+    "PDF jobs submitted to the worker pool and not yet started",
+    multiprocess_mode="livesum",
+)
+
+
+def registry():
+    """Registry to scrape: every process's samples under gunicorn, else this process's."""
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    merged = CollectorRegistry()
+    multiprocess.MultiProcessCollector(merged)
+    return merged
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a pipeline stage into worker_stage_seconds and the request trace,
+    inside an OpenTelemetry span of the same name.
+    """
+    start = time.perf_counter()
+    try:
+        with span(name):
+            yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=name).observe(elapsed)
+        record(name, elapsed)
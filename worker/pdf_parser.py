@@ -6,9 +6,119 @@ Supports Vietnamese formats including:
 - Short answer (numeric)
 """
 
+import logging
 import re
 from typing import Optional, Union
 
+logger = logging.getLogger("pdf_parser")
+
+# =========================================
+# Precompiled tokens (built once at import)
+# =========================================
+
+# Answer section markers, in priority order: the first marker that occurs
+# anywhere wins, even if a lower-priority one appears earlier in the text.
+# "BẢNG ĐÁP ÁN" always contains "ĐÁP ÁN", so it never needs its own pattern.
+# Kept as separate searches: "ĐÁP ÁN" is present in almost every key, so the
+# first search usually ends the lookup, which a combined alternation cannot.
+_ANSWER_MARKERS = tuple(
+    re.compile(marker, re.IGNORECASE)
+    for marker in (r'ĐÁP\s*ÁN', r'DAP\s*AN', r'ANSWER\s*KEY', r'KEY\s*:')
+)
+
+# Section headings. "Phần"/"Part" are matched once and the roman numeral is
+# counted afterwards, so "Phần III" also counts as a "Phần I" and "Phần II"
+# boundary (the same prefix semantics the per-section searches used to have).
+# The leading lookahead lets the engine skip positions that cannot start any
+# heading without trying every alternative there.
+_SECTION_RE = re.compile(
+    r'(?=[PATĐS])(?:'
+    r'(?P<part>P(?:hần|art)\s*)I'
+    r'|(?P<abcd>ABCD)'
+    r'|(?P<tf>Đúng\s*Sai)'
+    r'|(?P<truefalse>True\s*False)'
+    r'|(?P<sa>Trả\s*lời\s*ngắn)'
+    r'|(?P<short>Short))',
+    re.IGNORECASE
+)
+
+# "1D 2C 3D", "1.D", "1-D", "1:D", "1 D" (lowercase letters count too)
+_MC_RE = re.compile(r'\b(\d+)\s*[.\-:]?\s*([A-Da-d])\b')
+_MC_MAX_QUESTION = 50
+
+# "13 Đ Đ S Đ" / "13 D D S D". The classes are every character whose
+# uppercase form is Đ/D/S ('Ꭰ' shows up in place of 'Đ' in some PDFs); the last
+# slot also accepts ligatures whose uppercase form starts with 'S'.
+_TF_MARK = '[ĐđᎠDdSsſ]'
+_TF_RE = re.compile(
+    r'(\d+)\s+(' + _TF_MARK + r')\s+(' + _TF_MARK + r')\s+(' + _TF_MARK + r')'
+    r'\s+([ĐđᎠDdSsſßﬅﬆ])'
+)
+_TF_TRUE = frozenset('ĐđᎠDd')
+
+# One "question answer" pair per line: "17 18", "18 6,5"
+_SA_LINE_RE = re.compile(r'^[^\S\n]*(\d+)[^\S\n]+([\d.,]+)[^\S\n]*$', re.MULTILINE)
+
+
+def find_answer_section(text: str) -> Optional[int]:
+    """Return where the answer section starts, or None if there is no marker."""
+    for marker in _ANSWER_MARKERS:
+        match = marker.search(text)
+        if match:
+            return match.start()
+    return None
+
+
+def _scan_sections(text: str, pos: int) -> tuple:
+    """
+    Scan the answer section once and return the start offsets of every
+    heading family used to cut the MC, TF and SA sections.
+    """
+    part1 = []      # Phần I | Part I | ABCD
+    mc_end = []     # Phần II | Part II | Đúng Sai | True False
+    tf_start = []   # Phần II | Part II | Đúng Sai
+    tf_end = []     # Phần III | Part III | Trả lời ngắn | Short
+    sa_start = []   # Phần III | Part III | Trả lời ngắn
+
+    for match in _SECTION_RE.finditer(text, pos):
+        kind = match.lastgroup
+        start = match.start()
+        if kind == "part":
+            part1.append(start)
+            end = match.end()
+            numeral = 1
+            while numeral < 3 and text[end:end + 1] in ("I", "i"):
+                numeral += 1
+                end += 1
+            if numeral >= 2:
+                mc_end.append(start)
+                tf_start.append(start)
+            if numeral >= 3:
+                tf_end.append(start)
+                sa_start.append(start)
+        elif kind == "abcd":
+            part1.append(start)
+        elif kind == "tf":
+            mc_end.append(start)
+            tf_start.append(start)
+        elif kind == "truefalse":
+            mc_end.append(start)
+        elif kind == "sa":
+            tf_end.append(start)
+            sa_start.append(start)
+        else:
+            tf_end.append(start)
+
+    return part1, mc_end, tf_start, tf_end, sa_start
+
+
+def _first_at_or_after(offsets: list, pos: int, default: int) -> int:
+    """First offset >= pos in an ascending list, or default."""
+    for offset in offsets:
+        if offset >= pos:
+            return offset
+    return default
+
 
 def extract_answer_key(text: str) -> dict:
     """
@@ -21,160 +131,132 @@ def extract_answer_key(text: str) -> dict:
         "short_answer": [],
         "answers": []
     }
-    
+    text_end = len(text)
+
     # =========================================
-    # Step 1: Find the answer section
+    # Step 1: Find the answer section and its parts
     # =========================================
-    
-    # Look for answer section markers
-    answer_markers = [
-        r'ĐÁP\s*ÁN',
-        r'DAP\s*AN',
-        r'ANSWER\s*KEY',
-        r'KEY\s*:',
-        r'BẢNG\s*ĐÁP\s*ÁN'
-    ]
-    
-    answer_section_text = text
-    for marker in answer_markers:
-        match = re.search(marker, text, re.IGNORECASE)
-        if match:
-            # Only parse from this point onwards
-            answer_section_text = text[match.start():]
-            print(f"Found answer section at position {match.start()}")
-            break
-    
+
+    section_pos = find_answer_section(text)
+    if section_pos is None:
+        section_pos = 0
+    else:
+        logger.debug(f"Found answer section at position {section_pos}")
+
+    part1, mc_end, tf_start, tf_end, sa_start = _scan_sections(text, section_pos)
+
     # =========================================
     # PART I: Multiple Choice (ABCD)
     # =========================================
-    
-    # First, try to find Part I / Phần I section within answer section
-    part1_match = re.search(r'(?:Phần\s*I|Part\s*I|ABCD)', answer_section_text, re.IGNORECASE)
-    if part1_match:
-        # Find where Part II starts
-        part2_match = re.search(r'(?:Phần\s*II|Part\s*II|Đúng\s*Sai|True\s*False)', answer_section_text[part1_match.start():], re.IGNORECASE)
-        if part2_match:
-            mc_section = answer_section_text[part1_match.start():part1_match.start() + part2_match.start()]
-        else:
-            mc_section = answer_section_text[part1_match.start():]
+
+    if part1:
+        mc_from = part1[0]
+        mc_to = _first_at_or_after(mc_end, mc_from, text_end)
     else:
-        mc_section = answer_section_text
-    
-    # Pattern: "1D 2C 3D" - number followed by letter (with or without separator)
-    # Also handles: "1.D", "1-D", "1:D", "1 D"
-    mc_pattern = r'\b(\d+)\s*[.\-:]?\s*([A-D])\b'
-    mc_matches = re.findall(mc_pattern, mc_section.upper())
-    
-    # Remove duplicates by keeping first occurrence
-    seen_questions = set()
-    unique_mc = []
-    for num_str, ans in mc_matches:
-        num = int(num_str)
-        if num not in seen_questions and 1 <= num <= 50:
-            seen_questions.add(num)
-            unique_mc.append((num, ans))
-    
-    # Sort by question number
-    unique_mc.sort(key=lambda x: x[0])
-    
-    # Build ordered list
-    if unique_mc:
-        max_q = max(m[0] for m in unique_mc)
-        mc_answers = [None] * max_q
-        for num, ans in unique_mc:
-            mc_answers[num - 1] = ans
-        result["multiple_choice"] = mc_answers
-    
+        mc_from, mc_to = section_pos, text_end
+
+    # Keep the first occurrence of each question number
+    mc_answers = [None] * (_MC_MAX_QUESTION + 1)
+    max_q = 0
+    for match in _MC_RE.finditer(text, mc_from, mc_to):
+        num = int(match.group(1))
+        if 1 <= num <= _MC_MAX_QUESTION and mc_answers[num] is None:
+            mc_answers[num] = match.group(2).upper()
+            if num > max_q:
+                max_q = num
+    if max_q:
+        result["multiple_choice"] = mc_answers[1:max_q + 1]
+
     # =========================================
     # PART II: True/False (Đúng/Sai)
     # =========================================
-    
-    # Find Part II section
-    part2_start = re.search(r'(?:Phần\s*II|Part\s*II|Đúng\s*Sai)', answer_section_text, re.IGNORECASE)
-    if part2_start:
-        part3_match = re.search(r'(?:Phần\s*III|Part\s*III|Trả\s*lời\s*ngắn|Short)', answer_section_text[part2_start.start():], re.IGNORECASE)
-        if part3_match:
-            tf_section = answer_section_text[part2_start.start():part2_start.start() + part3_match.start()]
-        else:
-            tf_section = answer_section_text[part2_start.start():]
-        
-        # Normalize Đ and S characters
-        tf_section = tf_section.replace('Ꭰ', 'Đ').upper()
-        
-        # Pattern: "13 Đ Đ S Đ" or "13 D D S D"
-        tf_pattern = r'(\d+)\s+([ĐDS])\s+([ĐDS])\s+([ĐDS])\s+([ĐDS])'
-        tf_matches = re.findall(tf_pattern, tf_section)
-        
-        for match in tf_matches:
-            q_num = int(match[0])
-            sub_answers = {
-                'a': match[1] in ['Đ', 'D'],
-                'b': match[2] in ['Đ', 'D'],
-                'c': match[3] in ['Đ', 'D'],
-                'd': match[4] in ['Đ', 'D']
-            }
-            result["true_false"].append({
-                "question": q_num,
-                "answers": sub_answers
+
+    if tf_start:
+        tf_from = tf_start[0]
+        tf_to = _first_at_or_after(tf_end, tf_from, text_end)
+        true_false = result["true_false"]
+        for match in _TF_RE.finditer(text, tf_from, tf_to):
+            a, b, c, d = match.group(2, 3, 4, 5)
+            true_false.append({
+                "question": int(match.group(1)),
+                "answers": {
+                    'a': a in _TF_TRUE,
+                    'b': b in _TF_TRUE,
+                    'c': c in _TF_TRUE,
+                    'd': d in _TF_TRUE
+                }
             })
-    
+
     # =========================================
     # PART III: Short Answer (Numeric)
     # =========================================
-    
-    part3_start = re.search(r'(?:Phần\s*III|Part\s*III|Trả\s*lời\s*ngắn)', answer_section_text, re.IGNORECASE)
-    if part3_start:
-        sa_section = answer_section_text[part3_start.start():]
-        
-        # Pattern: "17 18" or "18 6,5" (question number followed by answer)
-        # Each line: question_number answer_value
-        lines = sa_section.split('\n')
-        for line in lines:
-            # Match: number followed by number (possibly with comma/decimal)
-            sa_match = re.match(r'^\s*(\d+)\s+([\d.,]+)\s*$', line.strip())
-            if sa_match:
-                q_num = int(sa_match.group(1))
-                ans_str = sa_match.group(2).replace(',', '.')
-                try:
-                    ans_val = float(ans_str)
-                except:
-                    ans_val = ans_str
-                result["short_answer"].append({
-                    "question": q_num,
-                    "answer": ans_val
-                })
-    
+
+    if sa_start:
+        short_answer = result["short_answer"]
+        for match in _SA_LINE_RE.finditer(text, sa_start[0]):
+            short_answer.append({
+                "question": int(match.group(1)),
+                "answer": parse_short_answer(match.group(2))
+            })
+
     # =========================================
     # Build flat answers list
     # =========================================
-    
-    # Start with MC answers
-    result["answers"] = result["multiple_choice"].copy() if result["multiple_choice"] else []
-    
-    # Add T/F as string format
-    for tf in result["true_false"]:
-        q_num = tf["question"]
-        tf_str = ''.join(['Đ' if tf["answers"][k] else 'S' for k in ['a', 'b', 'c', 'd']])
-        while len(result["answers"]) < q_num:
-            result["answers"].append(None)
-        if q_num <= len(result["answers"]):
-            result["answers"][q_num - 1] = tf_str
-        else:
-            result["answers"].append(tf_str)
-    
-    # Add short answers
-    for sa in result["short_answer"]:
-        q_num = sa["question"]
-        while len(result["answers"]) < q_num:
-            result["answers"].append(None)
-        if q_num <= len(result["answers"]):
-            result["answers"][q_num - 1] = str(sa["answer"])
-        else:
-            result["answers"].append(str(sa["answer"]))
-    
+
+    result["answers"] = build_flat_answers(
+        result["multiple_choice"], result["true_false"], result["short_answer"]
+    )
     return result
 
 
+def parse_short_answer(value: str) -> Union[float, str]:
+    """Read "6,5" / "2.75" as a float; keep anything else as a string."""
+    value = value.replace(',', '.')
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def build_flat_answers(mc: list, tf: list, sa: list) -> list:
+    """
+    Merge MC letters, T/F strings ("ĐSĐS") and short answers into one list
+    indexed by question number, allocated once at its final size.
+    """
+    size = len(mc)
+    for item in tf:
+        if item["question"] > size:
+            size = item["question"]
+    for item in sa:
+        if item["question"] > size:
+            size = item["question"]
+
+    answers = [None] * size
+    answers[:len(mc)] = mc
+
+    # A question numbered 0 lands in the last slot filled so far
+    filled = len(mc)
+    for q_num, value in _flat_entries(tf, sa):
+        if q_num > 0:
+            answers[q_num - 1] = value
+            if q_num > filled:
+                filled = q_num
+        elif filled:
+            answers[filled - 1] = value
+    return answers
+
+
+def _flat_entries(tf: list, sa: list):
+    """Yield (question, flat value) pairs: T/F first, then short answers."""
+    for item in tf:
+        marks = item["answers"]
+        yield item["question"], ''.join(
+            'Đ' if marks[k] else 'S' for k in ('a', 'b', 'c', 'd')
+        )
+    for item in sa:
+        yield item["question"], str(item["answer"])
+
+
 def parse_pdf_content(text: str) -> dict:
     """
     Main function to parse PDF content.
@@ -0,0 +1,180 @@
+"""
+On-demand profiling for slow worker requests.
+
+A request is profiled when either
+- PROFILE_REQUESTS=1 (profile tracked requests, subject to the rate limit), or
+- PROFILE_TOKEN is set and the request sends X-Profile: <token>.
+
+While it runs, a sampler thread reads every thread's stack (event loop and
+PDF pool) every PROFILE_INTERVAL_MS and tracemalloc records allocations. At the
+end two files are written to PROFILE_DIR:
+- <id>.collapsed: collapsed stacks ("thread;frame;frame count"), the input
+  format of flamegraph.pl / speedscope / inferno
+- <id>.alloc.txt: top allocation sites by growth over the request
+
+At most one profile runs at a time, and at most one per PROFILE_MIN_INTERVAL
+seconds, so a stuck header or flag cannot slow every request. The tracemalloc
+snapshots, their comparison and the file writes run in the default executor,
+off the event loop.
+
+The sampler cannot tell requests apart: the event loop and the PDF pool
+threads are shared, so stacks of requests that overlap the profiled one are
+recorded too (each stack is rooted at its thread's name). Profile on an
+otherwise idle worker for a clean flame graph.
+"""
+
+import os
+import sys
+import hmac
+import time
+import asyncio
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") == "1"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/worker-profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MIN_INTERVAL = float(os.getenv("PROFILE_MIN_INTERVAL", "60"))
+TOP_ALLOCATIONS = 25
+
+
+class StackSampler:
+    """Samples all thread stacks into collapsed-stack counts."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class RequestProfiler:
+    """Decides which requests to profile and writes their output."""
+
+    def __init__(self, enabled: bool = PROFILE_REQUESTS, token: str = PROFILE_TOKEN,
+                 output_dir: str = PROFILE_DIR, interval_ms: float = PROFILE_INTERVAL_MS,
+                 min_interval: float = PROFILE_MIN_INTERVAL):
+        self.enabled = enabled
+        self.token = token
+        self.output_dir = output_dir
+        self.interval = interval_ms / 1000
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._running = False
+        self._last_started = float("-inf")
+
+    def wanted(self, header_value: Optional[str]) -> bool:
+        if self.token and header_value and hmac.compare_digest(header_value, self.token):
+            return True
+        return self.enabled
+
+    def _acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._running or now - self._last_started < self.min_interval:
+                return False
+            self._running = True
+            self._last_started = now
+            return True
+
+    def _release(self):
+        with self._lock:
+            self._running = False
+
+    @asynccontextmanager
+    async def profile(self, label: str, header_value: Optional[str] = None):
+        """
+        Profile the enclosed block if requested and allowed by the rate
+        limit. Yields the profile id (None when not profiling).
+        """
+        if not self.wanted(header_value) or not self._acquire():
+            yield None
+            return
+
+        loop = asyncio.get_running_loop()
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{label.strip('/').replace('/', '_') or 'root'}"
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start()
+        try:
+            before = await loop.run_in_executor(None, tracemalloc.take_snapshot)
+        except BaseException:
+            if started_tracemalloc:
+                tracemalloc.stop()
+            self._release()
+            raise
+        sampler = StackSampler(self.interval)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            yield profile_id
+        finally:
+            elapsed = time.perf_counter() - start
+            try:
+                await loop.run_in_executor(
+                    None, self._finish, profile_id, elapsed, sampler, before, started_tracemalloc
+                )
+            except OSError as e:
+                logger.error(f"Could not write profile {profile_id}: {e}")
+            finally:
+                self._release()
+
+    def _finish(self, profile_id, elapsed, sampler, before, started_tracemalloc):
+        """Stop sampling, take the closing snapshot and write the files (executor thread)."""
+        sampler.stop()
+        after = tracemalloc.take_snapshot()
+        if started_tracemalloc:
+            tracemalloc.stop()
+        self._write(profile_id, elapsed, sampler, before, after)
+
+    def _write(self, profile_id, elapsed, sampler, before, after):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, profile_id)
+
+        with open(f"{base}.collapsed", "w") as f:
+            f.write(sampler.collapsed())
+
+        # Leave out the profiler's own sample bookkeeping and snapshots
+        own = (tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__))
+        growth = after.filter_traces(own).compare_to(before.filter_traces(own), "lineno")
+        with open(f"{base}.alloc.txt", "w") as f:
+            f.write(f"# {profile_id}: {elapsed:.3f}s, top {TOP_ALLOCATIONS} allocation sites by growth\n")
+            for stat in growth[:TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+
+        logger.info(f"Profile {profile_id} written to {self.output_dir} ({sum(sampler.samples.values())} samples)")
+
+
+profiler = RequestProfiler()
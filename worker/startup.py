@@ -0,0 +1,94 @@
+"""
+Cold-start warmup and readiness for the PDF worker.
+
+After an idle spin-down on Render, the first upload used to pay for lazy
+imports (pdf2image, gemini_service), the first pdfplumber/pdfminer parse,
+loading the poppler binaries and the PNG encoder. main.py now imports its
+heavy modules up front (and logs how long that took), and once the server
+is up warm_up() runs a tiny PDF through open, text and word extraction,
+rasterize and encode on every PDF pool thread.
+
+/health is liveness (the process answers); /ready returns 503 until the
+warmup has finished, so Render's health check only sends traffic to a
+warm instance. Import and warmup times are logged and returned by /ready.
+"""
+
+import io
+import time
+import base64
+import asyncio
+import logging
+from concurrent.futures import Executor
+
+import pdfplumber
+from pdf2image import convert_from_bytes
+from PIL import Image
+
+logger = logging.getLogger("startup")
+
+
+class Readiness:
+    """Whether startup warmup has finished, and how long each phase took."""
+
+    def __init__(self):
+        self.ready = False
+        self.error = None
+        self.timings_ms = {}
+
+    def mark(self, phase: str, seconds: float):
+        self.timings_ms[phase] = round(seconds * 1000, 1)
+
+    def snapshot(self) -> dict:
+        data = {"ready": self.ready, "timings_ms": dict(self.timings_ms)}
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+readiness = Readiness()
+
+
+def _sample_pdf() -> bytes:
+    """A blank one-page PDF, built in memory so no fixture ships with the worker."""
+    buffer = io.BytesIO()
+    Image.new("RGB", (200, 100), "white").save(buffer, format="PDF")
+    return buffer.getvalue()
+
+
+def warm_pdf_stack(sample: bytes):
+    """Run one PDF through every blocking step of the extraction pipeline."""
+    with pdfplumber.open(io.BytesIO(sample)) as pdf:
+        for page in pdf.pages:
+            page.extract_text()
+            page.extract_words()
+    try:
+        images = convert_from_bytes(sample, dpi=50)
+    except Exception as e:
+        # No poppler: the vision route fails on its own, text routes still work
+        logger.warning(f"Rasterize warmup skipped: {e}")
+        return
+    for img in images:
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+        base64.b64encode(buffer.getvalue())
+
+
+async def warm_up(pool: Executor, workers: int, started: float):
+    """
+    Warm every pool thread, then mark the worker ready. `started` is the
+    perf_counter() value at the start of main.py's imports.
+    """
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        sample = _sample_pdf()
+        # One job per thread so each one is started and has run the stack
+        await asyncio.gather(*(loop.run_in_executor(pool, warm_pdf_stack, sample) for _ in range(workers)))
+    except Exception as e:
+        # Still go ready: a broken warmup shouldn't keep the instance out of rotation
+        readiness.error = f"warmup failed: {e}"
+        logger.error(f"Warmup failed: {e}", exc_info=True)
+    readiness.mark("warmup", time.perf_counter() - start)
+    readiness.mark("startup", time.perf_counter() - started)
+    readiness.ready = True
+    logger.info(f"Worker ready: {readiness.timings_ms}")
@@ -0,0 +1,150 @@
+"""
+Unit tests for worker admission control.
+Run: pytest test_admission.py -v
+"""
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+class TestAdmission:
+    """Test per-class caps, the bounded queue and rejections."""
+
+    @pytest.mark.asyncio
+    async def test_queued_job_gets_released_slot(self):
+        """A job queued behind a full class runs once a slot is released."""
+        controller = AdmissionController({"text": 1}, queue_size=1, queue_timeout=1)
+        order = []
+
+        async def job(name, hold):
+            async with controller.admit("text"):
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        await asyncio.gather(job("first", 0.05), job("second", 0))
+        assert order == ["first", "second"]
+        assert controller.snapshot()["text"]["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_full_queue_rejects_immediately(self):
+        """With the cap and the queue both full, the next job is rejected."""
+        controller = AdmissionController({"bank": 1}, queue_size=1, queue_timeout=1)
+        release = asyncio.Event()
+
+        async def holder():
+            async with controller.admit("bank"):
+                await release.wait()
+
+        tasks = [asyncio.create_task(holder()), asyncio.create_task(holder())]
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected) as excinfo:
+            async with controller.admit("bank"):
+                pass
+        assert excinfo.value.reason == "queue_full"
+        assert excinfo.value.retry_after > 0
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert controller.snapshot()["bank"]["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout_rejects(self):
+        """A queued job that waits past the timeout is rejected, not left hanging."""
+        controller = AdmissionController({"vision": 1}, queue_size=4, queue_timeout=0.05)
+
+        async with controller.admit("vision"):
+            with pytest.raises(AdmissionRejected) as excinfo:
+                async with controller.admit("vision"):
+                    pass
+        assert excinfo.value.reason == "queue_timeout"
+        assert controller.snapshot()["vision"]["in_flight"] == 0
+        assert controller.snapshot()["vision"]["queued"] == 0
+
+    @pytest.mark.asyncio
+    async def test_no_wait_rejects_without_queueing(self):
+        """wait=False (a nested admit) is rejected at once when no slot is free."""
+        controller = AdmissionController({"vision": 1}, queue_size=4, queue_timeout=10)
+
+        async with controller.admit("vision"):
+            with pytest.raises(AdmissionRejected) as excinfo:
+                async with controller.admit("vision", wait=False):
+                    pass
+            assert controller.snapshot()["vision"]["queued"] == 0
+        assert excinfo.value.reason == "busy"
+        async with controller.admit("vision", wait=False):
+            assert controller.snapshot()["vision"]["in_flight"] == 1
+
+
+class TestFairScheduling:
+    """Test weighted fair queuing across callers and priority classes."""
+
+    @pytest.mark.asyncio
+    async def test_bulk_caller_does_not_starve_others(self):
+        """A second caller's job runs before the rest of a bulk import."""
+        controller = AdmissionController({"bank": 1}, queue_size=10, queue_timeout=2, reserved=0)
+        order = []
+
+        async def job(caller, name):
+            async with controller.admit("bank", caller, "bulk"):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        tasks = [asyncio.create_task(job("teacher-a", f"a{i}")) for i in range(4)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(job("teacher-b", "b0")))
+        await asyncio.gather(*tasks)
+        assert order == ["a0", "b0", "a1", "a2", "a3"]
+
+    @pytest.mark.asyncio
+    async def test_rejected_jobs_do_not_advance_caller(self):
+        """Jobs turned away cost the caller nothing in the fair-share order."""
+        controller = AdmissionController({"bank": 1}, queue_size=4, queue_timeout=2, reserved=0)
+        release = asyncio.Event()
+        order = []
+
+        async def holder():
+            async with controller.admit("bank", "teacher-a", "bulk"):
+                await release.wait()
+
+        async def job(caller, name):
+            async with controller.admit("bank", caller, "bulk"):
+                order.append(name)
+
+        tasks = [asyncio.create_task(holder())]
+        await asyncio.sleep(0)
+        for _ in range(5):
+            with pytest.raises(AdmissionRejected):
+                async with controller.admit("bank", "teacher-a", "bulk", wait=False):
+                    pass
+        for i in range(3):
+            tasks.append(asyncio.create_task(job("teacher-b", f"b{i}")))
+        tasks.append(asyncio.create_task(job("teacher-a", "a1")))
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(*tasks)
+        assert order == ["b0", "b1", "a1", "b2"]
+
+    @pytest.mark.asyncio
+    async def test_interactive_uses_reserved_slot(self):
+        """Bulk work cannot take the reserved slot, so interactive runs at once."""
+        controller = AdmissionController({"text": 2}, queue_size=4, queue_timeout=1, reserved=1)
+        release = asyncio.Event()
+
+        async def bulk():
+            async with controller.admit("text", "importer", "bulk"):
+                await release.wait()
+
+        tasks = [asyncio.create_task(bulk()), asyncio.create_task(bulk())]
+        await asyncio.sleep(0.01)
+        assert controller.snapshot()["text"]["bulk_in_flight"] == 1
+        assert controller.snapshot()["text"]["queued"] == 1
+
+        async with controller.admit("text", "teacher", "interactive") as priority:
+            assert priority == "interactive"
+            assert controller.snapshot()["text"]["in_flight"] == 2
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert controller.snapshot()["text"]["in_flight"] == 0
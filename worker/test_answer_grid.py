@@ -0,0 +1,194 @@
+"""
+Unit tests for the layout-aware answer grid decoder.
+Run: pytest test_answer_grid.py -v
+"""
+from answer_grid import extract_answer_grid, extract_variant_grid, find_answer_pages
+
+
+def _word(text, x, top, width=10):
+    return {"text": text, "x0": x - width / 2, "x1": x + width / 2, "top": top, "bottom": top + 10}
+
+
+def _row(label, cells, top, x_start=110, gap=40):
+    words = [_word(label, 40, top, width=30)] if label else []
+    for i, cell in enumerate(cells):
+        words.extend(_word(part, x_start + i * gap + j * 6, top, width=5) for j, part in enumerate(cell.split()))
+    return words
+
+
+class FakePage:
+    """Stand-in for a pdfplumber page: only extract_words() is used."""
+
+    def __init__(self, words):
+        self.words = words
+
+    def extract_words(self):
+        return self.words
+
+
+class TestExtractAnswerGrid:
+    """Test grid reconstruction from word coordinates."""
+
+    def test_mc_tf_and_sa_tables(self):
+        """Should decode MC rows, a)-d) T/F rows and numeric cells."""
+        words = (
+            _row("Câu", [str(i) for i in range(1, 6)], 100)
+            + _row("Đáp", list("DCBAd"), 118)
+            + _row("Câu", ["6", "7", "8"], 150)
+            + _row("a)", list("ĐSĐ"), 168)
+            + _row("b)", list("SSĐ"), 186)
+            + _row("c)", list("ĐĐĐ"), 204)
+            + _row("d)", list("SĐS"), 222)
+            + _row("Câu", ["9", "10", "11"], 260)
+            + _row("", ["2,5", "-1", "121"], 278)
+        )
+        result = extract_answer_grid([FakePage(words)])
+
+        assert result["multiple_choice"] == ["D", "C", "B", "A", "D"]
+        assert result["true_false"][0] == {"question": 6, "answers": {"a": True, "b": False, "c": True, "d": False}}
+        assert [item["answer"] for item in result["short_answer"]] == [2.5, -1.0, 121.0]
+        assert result["answers"][5:8] == ["ĐSĐS", "SSĐĐ", "ĐĐĐS"]
+        assert result["confident"] is True
+
+    def test_tf_cell_with_spaced_marks(self):
+        """"Đ S Đ S" split into four words inside one cell is one T/F answer."""
+        words = _row("Câu", ["1", "2", "3", "4"], 100) + _row("", ["Đ S Đ S", "S S S S", "D D D D", "Đ-S-Đ-S"], 118)
+        result = extract_answer_grid([FakePage(words)])
+        assert [tf["question"] for tf in result["true_false"]] == [1, 2, 3, 4]
+        assert result["answers"] == ["ĐSĐS", "SSSS", "ĐĐĐĐ", "ĐSĐS"]
+
+    def test_unanswered_columns_are_not_confident(self):
+        """Question rows without answer rows below must not be trusted."""
+        words = _row("Câu", ["1", "2", "3", "4"], 100) + _row("", ["A", "B"], 118) + _row("Câu", ["5", "6", "7"], 150)
+        result = extract_answer_grid([FakePage(words)])
+        assert result["coverage"] < 0.9
+        assert result["confident"] is False
+
+    def test_parts_restarting_numbering(self):
+        """Phần II and III restart at câu 1: numbered on, nothing overwritten."""
+        words = (
+            _row("PHẦN I", [], 80)
+            + _row("Câu", [str(i) for i in range(1, 7)], 100)
+            + _row("Đáp", list("ABCDAB"), 118)
+            + _row("PHẦN II", [], 140)
+            + _row("Câu", ["1", "2", "3"], 160)
+            + _row("", ["ĐSĐS", "SSSS", "ĐĐĐĐ"], 178)
+            + _row("PHẦN III", [], 200)
+            + _row("Câu", ["1", "2", "3"], 220)
+            + _row("", ["2,5", "-1", "121"], 238)
+        )
+        result = extract_answer_grid([FakePage(words)])
+
+        assert result["multiple_choice"] == list("ABCDAB")
+        assert [tf["question"] for tf in result["true_false"]] == [7, 8, 9]
+        assert result["short_answer"][0] == {"question": 10, "answer": 2.5}
+        assert result["answers"][6:] == ["ĐSĐS", "SSSS", "ĐĐĐĐ", "2.5", "-1.0", "121.0"]
+        assert result["coverage"] == 1.0
+        assert result["confident"] is True
+
+    def test_restart_without_heading_is_a_new_part(self):
+        """Numbering that goes backwards starts a part; coverage stays per part."""
+        words = (
+            _row("Câu", [str(i) for i in range(1, 9)], 100)
+            + _row("Đáp", list("ABCDABCD"), 118)
+            + _row("Câu", ["1", "2", "3", "4"], 150)
+        )
+        result = extract_answer_grid([FakePage(words)])
+
+        assert result["multiple_choice"] == list("ABCDABCD")
+        assert result["coverage"] <= 1.0
+        assert result["confident"] is False
+
+    def test_plain_text_is_not_a_grid(self):
+        """Prose without a question-number row returns None."""
+        words = _row("Câu", ["Cho", "hàm", "số"], 100)
+        assert extract_answer_grid([FakePage(words)]) is None
+
+
+class TestExtractVariantGrid:
+    """Test combined multi-variant (mã đề) tables."""
+
+    def test_variants_as_columns(self):
+        """One column per mã đề, one row per question or T/F sub-question."""
+        codes = ["101", "102", "103"]
+        words = _row("Mã", codes, 100)
+        keys = {"101": "ABCDA", "102": "BCDAB", "103": "CDABC"}
+        for q in range(5):
+            words += _row(str(q + 1), [keys[c][q] for c in codes], 118 + q * 18)
+        for i, (sub, marks) in enumerate(zip("abcd", ["ĐSĐ", "SSĐ", "ĐĐS", "SĐĐ"])):
+            words += _row(f"6{sub}", list(marks), 220 + i * 18)
+        words += _row("7", ["2,5", "18", "-3"], 300)
+
+        result = extract_variant_grid([FakePage(words)])
+
+        assert result["variant_count"] == 3
+        assert result["confident"] is True
+        for code in codes:
+            assert result["variants"][code]["multiple_choice"] == list(keys[code])
+        assert result["variants"]["101"]["true_false"] == [
+            {"question": 6, "answers": {"a": True, "b": False, "c": True, "d": False}}
+        ]
+        assert result["variants"]["103"]["short_answer"] == [{"question": 7, "answer": -3.0}]
+
+    def test_variants_as_rows(self):
+        """A "Mã đề | 1 | 2 ..." header, then one row per mã đề."""
+        words = _row("Mã đề", ["1", "2", "3", "4"], 100)
+        words += _row("0101", list("ABCD"), 118) + _row("0102", list("DCBA"), 136)
+        words += _row("Mã đề", ["5", "6", "7", "8"], 160)
+        words += _row("0101", list("AAAA"), 178) + _row("0102", list("BBBB"), 196)
+
+        result = extract_variant_grid([FakePage(words)])
+
+        assert result["variants"]["0101"]["multiple_choice"] == list("ABCDAAAA")
+        assert result["variants"]["0102"]["multiple_choice"] == list("DCBABBBB")
+        assert extract_answer_grid([FakePage(words)]) is None
+
+    def test_parts_restarting_numbering(self):
+        """Phần II rows restart at 1 in both layouts: numbered on after Phần I."""
+        codes = ["101", "102"]
+        words = _row("Mã", codes, 100)
+        for q in range(4):
+            words += _row(str(q + 1), ["ABCD"[q], "DCBA"[q]], 118 + q * 18)
+        for i, sub in enumerate("abcd"):
+            words += _row(f"1{sub}", ["Đ", "S"], 200 + i * 18)
+        words += _row("2", ["2,5", "7"], 280)
+        words += _row("3", ["1", "-4"], 298)
+
+        result = extract_variant_grid([FakePage(words)])
+
+        assert result["variants"]["101"]["multiple_choice"] == list("ABCD")
+        assert result["variants"]["102"]["true_false"] == [
+            {"question": 5, "answers": {"a": False, "b": False, "c": False, "d": False}}
+        ]
+        assert result["variants"]["101"]["short_answer"] == [
+            {"question": 6, "answer": 2.5}, {"question": 7, "answer": 1.0}
+        ]
+        assert result["coverage"] == 1.0
+        assert result["confident"] is True
+
+        words = _row("Mã đề", ["1", "2", "3", "4"], 100)
+        words += _row("0101", list("ABCD"), 118) + _row("0102", list("DCBA"), 136)
+        words += _row("PHẦN II", [], 150)
+        words += _row("Mã đề", ["1", "2", "3"], 160)
+        words += _row("0101", ["ĐSĐS", "SSSS", "ĐĐĐĐ"], 178) + _row("0102", ["SSSS", "ĐĐĐĐ", "ĐSĐS"], 196)
+
+        result = extract_variant_grid([FakePage(words)])
+
+        assert result["variants"]["0101"]["multiple_choice"] == list("ABCD")
+        assert [tf["question"] for tf in result["variants"]["0102"]["true_false"]] == [5, 6, 7]
+        assert result["coverage"] == 1.0
+
+    def test_single_key_table_is_not_a_variant_table(self):
+        words = _row("Câu", ["1", "2", "3", "4"], 100) + _row("Đáp", list("ABCD"), 118)
+        assert extract_variant_grid([FakePage(words)]) is None
+
+
+class TestFindAnswerPages:
+    """Test answer page selection."""
+
+    def test_last_heading_page_to_end(self):
+        texts = ["Chọn đáp án đúng", "BẢNG ĐÁP ÁN", "Phần II", "ĐÁP ÁN CHI TIẾT", "tiếp"]
+        assert find_answer_pages(texts) == [3, 4]
+
+    def test_falls_back_to_last_page(self):
+        assert find_answer_pages(["Câu 1", "Chọn đáp án đúng"]) == [1]
@@ -0,0 +1,94 @@
+"""
+Unit tests for the cross-process SQLite cache.
+Run: pytest test_cache.py -v
+"""
+import time
+import asyncio
+import sqlite3
+
+import pytest
+
+from cache import SharedCache, cache_key
+
+
+class TestSharedCache:
+    """Test entries, single-flight leases and the shared token bucket."""
+
+    def test_set_get_and_expiry(self, tmp_path):
+        """Values round-trip as JSON and disappear after their TTL."""
+        cache = SharedCache(str(tmp_path / "cache.sqlite3"), enabled=True)
+        key = cache_key("answers", "Câu 1: A")
+        cache.set("gemini", key, {"multiple_choice": [{"question": 1, "answer": "A"}]})
+        assert cache.get("gemini", key) == {"multiple_choice": [{"question": 1, "answer": "A"}]}
+        assert cache.get("pdf", key) is None
+
+        cache.set("pdf", key, ["page"], ttl=0.01)
+        time.sleep(0.02)
+        assert cache.get("pdf", key) is None
+
+    @pytest.mark.asyncio
+    async def test_single_flight_across_instances(self, tmp_path):
+        """Two processes (two connections to one file) asking at once compute once."""
+        path = str(tmp_path / "cache.sqlite3")
+        first, second = SharedCache(path, enabled=True), SharedCache(path, enabled=True)
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.3)
+            return {"model": "stub"}
+
+        results = await asyncio.gather(
+            first.get_or_compute("gemini", "k", compute),
+            second.get_or_compute("gemini", "k", compute),
+        )
+        assert results == [{"model": "stub"}, {"model": "stub"}]
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_uncacheable_result_not_stored(self, tmp_path):
+        """A failed extraction is returned but computed again next time."""
+        cache = SharedCache(str(tmp_path / "cache.sqlite3"), enabled=True)
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            return {"error": "all models unavailable"}
+
+        for _ in range(2):
+            result = await cache.get_or_compute("gemini", "k", compute, cacheable=lambda r: not r.get("error"))
+            assert result["error"]
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_throttle_spaces_calls(self, tmp_path):
+        """With a burst of 1 at 600/min, three calls take at least two intervals."""
+        cache = SharedCache(str(tmp_path / "cache.sqlite3"), enabled=True)
+        start = time.perf_counter()
+        for _ in range(3):
+            await cache.throttle("gemini", per_minute=600, burst=1)
+        assert time.perf_counter() - start >= 0.18
+
+    @pytest.mark.asyncio
+    async def test_locked_database_does_not_block_event_loop(self, tmp_path):
+        """A throttle waiting on another process's write lock leaves the loop free."""
+        path = str(tmp_path / "cache.sqlite3")
+        cache = SharedCache(path, enabled=True)
+        await cache.throttle("gemini", per_minute=600, burst=10)
+        holder = sqlite3.connect(path, isolation_level=None)
+        holder.execute("BEGIN IMMEDIATE")
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0.01)
+
+        ticking = asyncio.create_task(ticker())
+        waiting = asyncio.create_task(cache.throttle("gemini", per_minute=600, burst=10))
+        await asyncio.sleep(0.2)
+        holder.execute("COMMIT")
+        await waiting
+        ticking.cancel()
+        holder.close()
+        assert len(ticks) >= 10
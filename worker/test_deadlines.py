@@ -0,0 +1,105 @@
+"""
+Unit tests for request deadlines and disconnect cancellation.
+Run: pytest test_deadlines.py -v
+"""
+import asyncio
+
+import pytest
+
+from deadlines import DeadlineMiddleware, allows, check, remaining, RequestCancelled
+
+
+def _scope(deadline_ms=None):
+    headers = [(b"x-deadline-ms", str(deadline_ms).encode())] if deadline_ms else []
+    return {"type": "http", "path": "/extract-answers", "headers": headers}
+
+
+class TestDeadlineMiddleware:
+    """Test budget propagation, 504 on deadline and cancel on disconnect."""
+
+    @pytest.mark.asyncio
+    async def test_budget_visible_to_app(self):
+        """The header budget is what the app sees through remaining()."""
+        seen = {}
+
+        async def app(scope, receive, send):
+            seen["remaining"] = remaining()
+            seen["allows"] = allows(30)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        await DeadlineMiddleware(app, ["/extract-answers"])(_scope(5000), receive, send)
+        assert 4 < seen["remaining"] <= 5
+        assert seen["allows"] is False
+        assert sent[0]["status"] == 200
+        assert remaining() == float("inf")
+
+    @pytest.mark.asyncio
+    async def test_deadline_returns_504_and_cancels(self):
+        """A handler still running at the deadline is cancelled and the client gets 504."""
+        cancelled = asyncio.Event()
+
+        async def app(scope, receive, send):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        sent = []
+        hang = asyncio.Event()
+
+        async def receive():
+            await hang.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        await DeadlineMiddleware(app, ["/extract-answers"])(_scope(1000), receive, send)
+        assert cancelled.is_set()
+        assert sent[0]["status"] == 504
+
+    @pytest.mark.asyncio
+    async def test_disconnect_cancels_without_response(self):
+        """A client disconnect cancels the handler and nothing is sent."""
+        cancelled = asyncio.Event()
+        checks = []
+
+        async def app(scope, receive, send):
+            await receive()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                try:
+                    check()
+                except RequestCancelled as exc:
+                    checks.append(str(exc))
+                cancelled.set()
+                raise
+
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await DeadlineMiddleware(app, ["/extract-answers"])(_scope(), receive, send)
+        assert cancelled.is_set()
+        assert checks == ["disconnect"]
+        assert sent == []
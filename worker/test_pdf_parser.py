@@ -0,0 +1,63 @@
+"""
+Unit tests for the regex answer-key parser.
+Run: pytest test_pdf_parser.py -v
+"""
+from pdf_parser import extract_answer_key, parse_pdf_content
+
+
+FULL_KEY = """Câu 1. Cho hàm số y = f(x). A. 1 B. 2 C. 3 D. 4
+BẢNG ĐÁP ÁN
+Phần I
+1D 2C 3.B 4-a 5:D 6 C
+Phần II
+7 Đ S Đ S
+8 d s s Ꭰ
+Phần III
+9 2,5
+10 121
+"""
+
+
+class TestExtractAnswerKey:
+    """Test section detection and per-part parsing."""
+
+    def test_three_part_key(self):
+        """Should split MC, TF and SA sections and merge them in order."""
+        result = extract_answer_key(FULL_KEY)
+
+        assert result["multiple_choice"] == ["D", "C", "B", "A", "D", "C"]
+        assert result["true_false"] == [
+            {"question": 7, "answers": {"a": True, "b": False, "c": True, "d": False}},
+            {"question": 8, "answers": {"a": True, "b": False, "c": False, "d": True}},
+        ]
+        assert result["short_answer"] == [
+            {"question": 9, "answer": 2.5},
+            {"question": 10, "answer": 121.0},
+        ]
+        assert result["answers"] == ["D", "C", "B", "A", "D", "C", "ĐSĐS", "ĐSSĐ", "2.5", "121.0"]
+
+    def test_ignores_text_before_marker(self):
+        """Question text before ĐÁP ÁN must not be read as answers."""
+        result = extract_answer_key("Câu 1 A. x\nĐÁP ÁN\n2B 1C")
+        assert result["multiple_choice"] == ["C", "B"]
+
+    def test_first_occurrence_wins_and_gaps_stay_none(self):
+        """Repeated question numbers keep the first answer; gaps are None."""
+        result = extract_answer_key("ĐÁP ÁN 1A 3B 1D 51C")
+        assert result["multiple_choice"] == ["A", None, "B"]
+
+    def test_tf_and_sa_extend_flat_answers(self):
+        """TF/SA numbers beyond the MC range grow the flat list with gaps."""
+        result = extract_answer_key("ĐÁP ÁN\nPhần II\n3 Đ Đ Đ Đ\nPhần III\n5 7\n")
+        assert result["answers"] == [None, None, "ĐĐĐĐ", None, "7.0"]
+
+    def test_no_answers(self):
+        """Text without any key should return empty lists."""
+        result = extract_answer_key("This is a blank page with no answers.")
+        assert result == {"multiple_choice": [], "true_false": [], "short_answer": [], "answers": []}
+
+    def test_parse_pdf_content_totals(self):
+        """parse_pdf_content should expose the flat key and its length."""
+        result = parse_pdf_content(FULL_KEY)
+        assert result["total_questions"] == 10
+        assert result["answer_key"][0] == "D"
@@ -0,0 +1,56 @@
+"""
+Unit tests for the on-demand request profiler.
+Run: pytest test_profiling.py -v
+"""
+
+import os
+
+import pytest
+
+from profiling import RequestProfiler
+
+
+def _busy():
+    total = 0
+    for i in range(300000):
+        total += i * i
+    return [bytearray(1024) for _ in range(200)], total
+
+
+class TestRequestProfiler:
+    """Test profile selection, output files and rate limiting."""
+
+    @pytest.mark.asyncio
+    async def test_disabled_without_flag_or_token(self, tmp_path):
+        """Nothing is profiled unless enabled or the token matches."""
+        profiler = RequestProfiler(enabled=False, token="secret", output_dir=str(tmp_path))
+        async with profiler.profile("/extract-answers", "wrong") as profile_id:
+            _busy()
+        assert profile_id is None
+        assert os.listdir(tmp_path) == []
+
+    @pytest.mark.asyncio
+    async def test_token_writes_collapsed_stacks_and_allocations(self, tmp_path):
+        """A matching admin token writes flame-graph and allocation files."""
+        profiler = RequestProfiler(enabled=False, token="secret", output_dir=str(tmp_path), interval_ms=1)
+        async with profiler.profile("/extract-answers", "secret") as profile_id:
+            kept = _busy()
+
+        assert profile_id and profile_id.endswith("extract-answers")
+        collapsed = (tmp_path / f"{profile_id}.collapsed").read_text()
+        assert "_busy (test_profiling.py" in collapsed
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed.splitlines())
+        alloc = (tmp_path / f"{profile_id}.alloc.txt").read_text()
+        assert "test_profiling.py" in alloc
+        assert kept
+
+    @pytest.mark.asyncio
+    async def test_rate_limited(self, tmp_path):
+        """A second request inside the minimum interval is not profiled."""
+        profiler = RequestProfiler(enabled=True, output_dir=str(tmp_path), min_interval=60)
+        async with profiler.profile("/parse-pdf") as first:
+            pass
+        async with profiler.profile("/parse-pdf") as second:
+            pass
+        assert first is not None
+        assert second is None
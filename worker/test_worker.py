@@ -4,6 +4,7 @@ Run: pytest test_worker.py -v
 """
 import pytest
 import httpx
+import asyncio
 import os
 import tempfile
 from pathlib import Path
@@ -63,6 +64,65 @@ class TestHealthCheck:
             assert data["status"] == "ok"
             assert "version" in data
 
+    @pytest.mark.asyncio
+    async def test_ready_after_warmup(self):
+        """/ready turns 200 once startup warmup is done and reports its timings."""
+        async with httpx.AsyncClient() as client:
+            for _ in range(50):
+                r = await client.get(f"{WORKER_URL}/ready")
+                if r.status_code == 200:
+                    break
+                assert r.status_code == 503
+                await asyncio.sleep(0.2)
+            assert r.status_code == 200
+            data = r.json()
+            assert data["ready"] is True
+            assert {"imports", "warmup", "startup"} <= set(data["timings_ms"])
+
+
+class TestMetrics:
+    """Test the Prometheus scrape endpoint."""
+
+    @pytest.mark.asyncio
+    async def test_metrics_endpoint(self, sample_pdf):
+        """Stage and extraction metrics should appear after an extraction."""
+        async with httpx.AsyncClient(timeout=120) as client:
+            with open(sample_pdf, "rb") as f:
+                await client.post(
+                    f"{WORKER_URL}/extract-answers",
+                    files={"file": ("test.pdf", f, "application/pdf")},
+                )
+            r = await client.get(f"{WORKER_URL}/metrics")
+
+        assert r.status_code == 200
+        assert r.headers["content-type"].startswith("text/plain")
+        assert 'worker_stage_seconds_count{stage="extract_text"}' in r.text
+        assert "worker_extractions_total" in r.text
+        assert "worker_pool_queue_depth" in r.text
+
+
+class TestServerTiming:
+    """Test the per-request stage trace."""
+
+    @pytest.mark.asyncio
+    async def test_server_timing_header_and_body(self, sample_pdf):
+        """Responses carry Server-Timing; ?timings=1 adds per-page timings."""
+        async with httpx.AsyncClient(timeout=120) as client:
+            with open(sample_pdf, "rb") as f:
+                r = await client.post(
+                    f"{WORKER_URL}/extract-answers?timings=1",
+                    files={"file": ("test.pdf", f, "application/pdf")},
+                )
+
+        assert r.status_code == 200
+        header = r.headers["server-timing"]
+        assert "extract_text;dur=" in header
+        assert "total;dur=" in header
+        timings = r.json()["timings"]
+        assert timings["total_ms"] > 0
+        pages = [s for s in timings["stages"] if s["name"] == "extract_text" and "page" in s]
+        assert pages and pages[0]["page"] == 1
+
 
 class TestExtractAnswers:
     """Test the /extract-answers endpoint."""
@@ -0,0 +1,82 @@
+"""
+Per-request stage trace for the PDF worker.
+
+Every tracked request gets a RequestTrace in a context variable. Stage timers
+(metrics.stage), per-page extraction and each upstream model attempt record
+into it, and the middleware turns it into:
+- a Server-Timing header on every response (shown in browser devtools and
+  passed through by the Next.js proxy)
+- an optional "timings" object in the JSON body (?timings=1 or X-Timings: 1)
+
+PDF pool jobs run inside a copy of the request context, so work done in
+pool threads lands in the same trace.
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """Ordered list of timed entries for one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.entries = []
+
+    def add(self, name: str, seconds: float, **attrs):
+        ended = time.perf_counter()
+        self.entries.append({
+            "name": name,
+            "start_ms": round((ended - seconds - self.start) * 1000, 1),
+            "ms": round(seconds * 1000, 1),
+            **attrs,
+        })
+
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self.start) * 1000, 1)
+
+    def as_dict(self) -> dict:
+        return {"total_ms": self.total_ms(), "stages": list(self.entries)}
+
+    def server_timing(self) -> str:
+        """
+        Format as a Server-Timing header value. Stages are summed by name,
+        per-page entries are left out (their sum is extract_text) and every
+        model attempt is listed on its own with model and status.
+        """
+        totals = {}
+        attempts = []
+        for entry in self.entries:
+            if "page" in entry:
+                continue
+            if entry["name"] == "ai_attempt":
+                desc = f'{entry.get("model", "")} {entry.get("status", "")}'.strip()
+                attempts.append(f'ai_attempt;dur={entry["ms"]};desc="{desc}"')
+                continue
+            totals[entry["name"]] = totals.get(entry["name"], 0.0) + entry["ms"]
+
+        parts = [f"{name};dur={round(ms, 1)}" for name, ms in totals.items()]
+        parts.extend(attempts)
+        parts.append(f"total;dur={self.total_ms()}")
+        return ", ".join(parts)
+
+
+def start_trace() -> RequestTrace:
+    """Begin a trace for the current request context."""
+    trace = RequestTrace()
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def record(name: str, seconds: float, **attrs):
+    """Add an entry to the current request's trace, if there is one."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds, **attrs)
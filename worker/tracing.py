@@ -0,0 +1,106 @@
+"""
+OpenTelemetry tracing for the PDF worker.
+
+Spans cover the request, pdf open, per-page extraction, every metrics.stage()
+(read, rasterize, encode, ai, parse, ...), each Gemini attempt with model and
+status, JSON repair and validation. Incoming W3C trace context (traceparent,
+forwarded by the Next.js proxy) becomes the parent, and outbound Gemini calls
+carry it on.
+
+Export is OTLP/HTTP to OTEL_EXPORTER_OTLP_ENDPOINT (e.g. a local collector at
+http://localhost:4318). Without the endpoint, or without the opentelemetry
+packages installed, every helper here is a no-op.
+"""
+
+import os
+import logging
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:
+    trace = None
+
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "exam-pdf-worker")
+
+_tracer = None
+
+
+class _NoopSpan:
+    def set_attribute(self, key, value):
+        pass
+
+    def set_status(self, *args, **kwargs):
+        pass
+
+    def record_exception(self, exc):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def setup_tracing():
+    """Install an OTLP exporter when an endpoint is configured."""
+    global _tracer
+    if trace is None:
+        return
+
+    endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+    if endpoint:
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT set but opentelemetry-sdk / OTLP exporter not installed")
+        else:
+            provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            trace.set_tracer_provider(provider)
+            logger.info(f"Tracing exported via OTLP to {endpoint}")
+
+    _tracer = trace.get_tracer(SERVICE_NAME)
+
+
+def shutdown_tracing():
+    """Flush pending spans (no-op without an SDK provider)."""
+    if trace is None:
+        return
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+@contextmanager
+def span(name: str, parent_headers: Optional[dict] = None, server: bool = False, **attributes):
+    """
+    Open a span as the current span. parent_headers (incoming request headers)
+    supply the remote parent; server marks the request's entry span.
+    """
+    if _tracer is None:
+        yield _NOOP_SPAN
+        return
+
+    context = propagate.extract(parent_headers) if parent_headers is not None else None
+    kind = SpanKind.SERVER if server else SpanKind.INTERNAL
+    with _tracer.start_as_current_span(name, context=context, kind=kind, attributes=attributes) as current:
+        yield current
+
+
+def mark_error(current, description: str):
+    """Set an error status on a span returned by span()."""
+    if trace is not None and current is not _NOOP_SPAN:
+        current.set_status(Status(StatusCode.ERROR, description))
+
+
+def inject_headers(headers: dict) -> dict:
+    """Add traceparent/tracestate for the current span to outbound headers."""
+    if trace is not None:
+        propagate.inject(headers)
+    return headers